@@ -1,10 +1,94 @@
-#Objaverse_downoald 
+#Objaverse_downoald
+"""
+Write a catalog of Objaverse-XL assets (one JSON line per asset with its uid,
+url, sha256 and file type) for `data_generator.py --catalog`, which downloads
+the assets while the first ones render.
+
+    python Objaverse_downoald.py --catalog catalog.jsonl --start 2 --count 100
+"""
+
+import argparse
+import json
+import os
+import re
 
 import objaverse
 import objaverse.xl as oxl
 
-annotations = oxl.get_annotations(
-    download_dir="/home/opdal/Bureau/5GMM/Synthetic-Data-Generation-for-Supervised-Learning-Using-3D-Tools/PYBLEND/objects6glb" # default download directory
-)
+GITHUB_BLOB = re.compile(r"https://github\.com/([^/]+)/([^/]+)/blob/(.+)")
+# the Sketchfab models of Objaverse-XL are the GLBs of Objaverse 1.0, hosted on Hugging Face
+OBJAVERSE_HF = "https://huggingface.co/datasets/allenai/objaverse/resolve/main/"
+
+
+def download_url(source, file_identifier, object_paths):
+    """
+    Direct download URL of an asset: the raw file for GitHub, the Hugging
+    Face GLB for Sketchfab, the identifier itself for the Smithsonian (a
+    GLB URL).
+
+    Args:
+        object_paths (dict): uid to path of the Objaverse 1.0 GLBs, see `objaverse._load_object_paths`.
+
+    Returns:
+        str: the URL, or None for the sources without a direct file URL (e.g. Thingiverse).
+    """
+    if source == "github":
+        match = GITHUB_BLOB.match(file_identifier)
+        if match:
+            return "https://raw.githubusercontent.com/{}/{}/{}".format(*match.groups())
+    elif source == "sketchfab":
+        uid = file_identifier.rstrip("/").split("-")[-1]
+        if uid in object_paths:
+            return OBJAVERSE_HF + object_paths[uid]
+    elif source == "smithsonian":
+        return file_identifier
+    return None
+
+
+def write_catalog(annotations, path, fallback_dir):
+    """
+    Write the annotations to a JSONL catalog, see `tools.ingest.read_catalog`.
+    The assets without a direct file URL are downloaded to fallback_dir with
+    the objaverse downloader, their catalog url is the local file.
+    """
+    object_paths = objaverse._load_object_paths() if (annotations["source"] == "sketchfab").any() else {}
+    urls = [download_url(row.source, row.fileIdentifier, object_paths) for row in annotations.itertuples()]
+    missing = annotations[[url is None for url in urls]]
+    if len(missing):
+        print(f"Downloading the {len(missing)} assets without a direct URL to {fallback_dir}")
+        local_paths = oxl.download_objects(missing.reset_index(drop=True), download_dir=fallback_dir)
+        urls = [local_paths.get(row.fileIdentifier) if url is None else url for url, row in zip(urls, annotations.itertuples())]
+
+    if os.path.dirname(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    written = 0
+    with open(path, "w") as f:
+        for url, row in zip(urls, annotations.itertuples()):
+            if url is None:
+                print(f"No file for {row.fileIdentifier}, skipped")
+                continue
+            f.write(json.dumps(dict(
+                uid=row.sha256,
+                url=url,
+                sha256=row.sha256,
+                file_type=row.fileType,
+                source=row.source,
+            )) + "\n")
+            written += 1
+    return written
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--catalog", type=str, default="catalog.jsonl", help="Catalog to write")
+    parser.add_argument("--download_dir", type=str, default="~/.objaverse", help="Directory of the cached Objaverse-XL annotations")
+    parser.add_argument("--fallback_dir", type=str, default="objects_fallback", help="Directory of the assets downloaded with the objaverse downloader (sources without a direct file URL)")
+    parser.add_argument("--file_type", type=str, default="glb", help="File type of the assets")
+    parser.add_argument("--start", type=int, default=2, help="Index of the first asset")
+    parser.add_argument("--count", type=int, default=100, help="Number of assets")
+    args = parser.parse_args()
 
-oxl.download_objects(annotations[annotations["fileType"]== "glb"][2:102].reset_index(drop=True), "/home/opdal/Bureau/5GMM/Synthetic-Data-Generation-for-Supervised-Learning-Using-3D-Tools/PYBLEND/objects6gbl")
+    annotations = oxl.get_annotations(download_dir=args.download_dir)
+    annotations = annotations[annotations["fileType"] == args.file_type][args.start:args.start + args.count].reset_index(drop=True)
+    written = write_catalog(annotations, args.catalog, args.fallback_dir)
+    print(f"Wrote {written} assets to {args.catalog}")
@@ -0,0 +1,483 @@
+"""
+Benchmarks and calibration of the rendering pipeline. Most commands need
+Blender and take the same scene arguments as super_main.py:
+
+>>> blender -b -P benchmark.py -- quality --obj_paths objects/chair.glb --background hdris/studio.exr
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+
+def prepare_scene(args, seed=0):
+    """
+    Build a reference scene from the super_main.py arguments: one scene with
+    the first background and `num_views` fixed camera poses. The compositor
+    file outputs are muted.
+
+    Returns:
+        Tuple[dict, List[bpy.types.Object], np.ndarray]:
+            the scene state, the objects and the (V, 4, 4) camera poses.
+    """
+    import bpy
+    import numpy as np
+    from super_main import setup_scene, load_objects, list_backgrounds, set_background, randomize_scene
+    from tools.poses import pose_matrices, sample_poses
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    state = setup_scene(args)
+    for node in bpy.context.scene.node_tree.nodes:
+        if node.type == "OUTPUT_FILE":
+            node.mute = True
+    objects = load_objects(args.obj_paths.split(","), cache=state["asset_cache"], lod_budget=state["lod_budget"], texture_proxy=state["texture_proxy"])
+    background, color, _ = list_backgrounds(args.background.split(","), args.color)[0]
+    set_background(background, color, state)
+    np.random.seed(seed)
+    target = randomize_scene(objects, background)
+    poses = pose_matrices(*sample_poses(args.num_views, target, strategy=args.view_sampler))
+    return state, objects, poses
+
+
+def set_view(pose):
+    import bpy
+    from mathutils import Matrix
+
+    bpy.data.objects["Camera"].matrix_world = Matrix(pose.tolist())
+    bpy.context.view_layer.update()
+
+
+def read_image(path):
+    """
+    Read an image written by Blender as a (H, W, C) float array.
+    """
+    import bpy
+    from tools.background import image_to_array
+
+    image = bpy.data.images.load(path, check_existing=False)
+    pixels = image_to_array(image).copy()
+    bpy.data.images.remove(image)
+    return pixels
+
+
+def psnr(image, reference):
+    import numpy as np
+
+    mse = np.mean((image[..., :3] - reference[..., :3]) ** 2)
+    return float(10 * np.log10(1 / max(mse, 1e-12)))
+
+
+def quality(args):
+    """
+    Render the reference scene with a high-sample reference and with each
+    quality profile, and report the seconds per frame and the error against
+    the reference.
+    """
+    import numpy as np
+    from tools.render import config_quality, render_image
+
+    state, objects, poses = prepare_scene(args)
+
+    def render_views(tag):
+        seconds = []
+        images = []
+        for view_idx, pose in enumerate(poses):
+            set_view(pose)
+            path = os.path.join(args.output_dir, f"{tag}_{view_idx:03d}.png")
+            start = time.time()
+            render_image(path)
+            seconds.append(time.time() - start)
+            images.append(read_image(path))
+        return float(np.mean(seconds)), images
+
+    config_quality(
+        dict(samples=args.reference_samples, adaptive_threshold=0, max_bounces=12, denoiser=None, time_limit=0)
+    )
+    reference_seconds, reference = render_views("reference")
+
+    rows = [("reference", reference_seconds, float("inf"), 0.0)]
+    for profile in args.profiles.split(","):
+        config_quality(profile)
+        seconds, images = render_views(profile)
+        rmse = np.mean([np.sqrt(np.mean((i[..., :3] - r[..., :3]) ** 2)) for i, r in zip(images, reference)])
+        rows.append((profile, seconds, np.mean([psnr(i, r) for i, r in zip(images, reference)]), float(rmse)))
+
+    print(f"{'profile':>10} {'s/frame':>9} {'PSNR (dB)':>10} {'RMSE':>8}")
+    for profile, seconds, value, rmse in rows:
+        print(f"{profile:>10} {seconds:>9.3f} {value:>10.2f} {rmse:>8.4f}")
+    return rows
+
+
+def labels(args):
+    """
+    Render the reference scene twice: with the label passes taken from the
+    beauty render (current pipeline) and from the single-sample label view
+    layer (--split_labels). Check that the depth and the object index masks
+    agree pixel for pixel, that the normals of the objects agree within
+    --normal_tolerance degrees on average (the label layer does not apply
+    normal maps), and report the seconds per frame of both. The check is
+    repeated with a cut-out cube (alpha clip checker) around the objects,
+    which the label layer must see through like the beauty render.
+    """
+    import bpy
+    import numpy as np
+    from super_main import enable_outputs
+    from mathutils import Vector
+    from tools.render import render_image, set_segmentation_max_value, update_label_override
+
+    args.split_labels = False
+    state, objects, poses = prepare_scene(args)
+    set_segmentation_max_value(len(objects))
+    split_outputs = enable_outputs(label_layer="Labels")
+
+    def render_views(outputs, tag):
+        nodes = sum(outputs.values(), ())
+        for node in nodes:
+            node.mute = False
+            node.base_path = os.path.join(args.output_dir, tag)
+        outputs["seg"][0].file_slots[0].path = "seg_"
+        outputs["depth"][0].file_slots[0].path = "depth_"
+        outputs["normal"][0].file_slots[0].path = "normal_"
+        seconds = []
+        for view_idx, pose in enumerate(poses):
+            set_view(pose)
+            bpy.context.scene.frame_current = view_idx
+            start = time.time()
+            render_image(os.path.join(args.output_dir, tag, f"render_{view_idx:04d}.png"))
+            seconds.append(time.time() - start)
+        for node in nodes:
+            node.mute = True
+        return float(np.mean(seconds))
+
+    def compare(case):
+        transparent = update_label_override()
+        print(f"{case}: label override {'off, materials with alpha: ' + ', '.join(transparent) if transparent else 'on'}")
+        combined_dir, split_dir = f"{case}_combined", f"{case}_split"
+        combined_seconds = render_views(state["outputs"], combined_dir)
+        split_seconds = render_views(split_outputs, split_dir)
+
+        agree = True
+        for view_idx in range(len(poses)):
+            for label in ("seg", "depth"):
+                combined = read_image(os.path.join(args.output_dir, combined_dir, f"{label}_{view_idx:04d}.exr"))[..., 0]
+                split = read_image(os.path.join(args.output_dir, split_dir, f"{label}_{view_idx:04d}.exr"))[..., 0]
+                mismatches = int((combined != split).sum())
+                agree &= mismatches == 0
+                print(f"{case} view {view_idx} {label}: {mismatches} mismatching pixels")
+            # normals of the pixels of the objects, decoded from [0, 1] to [-1, 1]
+            mask = read_image(os.path.join(args.output_dir, combined_dir, f"seg_{view_idx:04d}.exr"))[..., 0] > 0
+            normals = [
+                read_image(os.path.join(args.output_dir, tag, f"normal_{view_idx:04d}.png"))[..., :3][mask] * 2 - 1
+                for tag in (combined_dir, split_dir)
+            ]
+            normals = [n / np.maximum(np.linalg.norm(n, axis=-1, keepdims=True), 1e-6) for n in normals]
+            angles = np.degrees(np.arccos(np.clip((normals[0] * normals[1]).sum(-1), -1, 1)))
+            mean_angle = float(angles.mean()) if len(angles) else 0.0
+            agree &= mean_angle <= args.normal_tolerance
+            print(f"{case} view {view_idx} normal: mean {mean_angle:.2f} deg, max {angles.max(initial=0):.2f} deg")
+        print(f"{case} labels from the beauty render: {combined_seconds:.3f} s/frame")
+        print(f"{case} labels from the label layer: {split_seconds:.3f} s/frame")
+        return agree
+
+    agree = compare("opaque")
+
+    # cut-out case: a cube around the objects, with holes from an alpha clip checker
+    corners = np.array([obj.matrix_world @ Vector(corner) for obj in objects for corner in obj.bound_box])
+    bpy.ops.mesh.primitive_cube_add(location=tuple((corners.min(0) + corners.max(0)) / 2))
+    cube = bpy.context.active_object
+    cube.dimensions = tuple((corners.max(0) - corners.min(0)) * 1.2)
+    material = bpy.data.materials.new("CutOut")
+    material.use_nodes = True
+    material.blend_method = "CLIP"
+    nodes = material.node_tree.nodes
+    checker = nodes.new("ShaderNodeTexChecker")
+    checker.inputs["Scale"].default_value = 8
+    material.node_tree.links.new(checker.outputs["Fac"], nodes["Principled BSDF"].inputs["Alpha"])
+    cube.data.materials.append(material)
+    agree &= compare("cutout")
+    bpy.data.objects.remove(cube, do_unlink=True)
+    bpy.data.materials.remove(material)
+    update_label_override()
+
+    print("Label passes agree" if agree else "Label passes DIFFER")
+    return agree
+
+
+def views(args):
+    """
+    Views per second of the per-view render loop and of the keyframed
+    animation path with persistent data (--keyframed_views).
+    """
+    import bpy
+    from super_main import render_views
+
+    state, objects, poses = prepare_scene(args)
+    camera = bpy.data.objects["Camera"]
+    rates = {}
+    for keyframed in (False, True):
+        bpy.context.scene.render.use_persistent_data = keyframed
+        tag = "keyframed" if keyframed else "per_view"
+        start = time.time()
+        render_views(camera, poses, os.path.join(args.output_dir, f"{tag}_"), first_frame=0, keyframed=keyframed)
+        rates[tag] = len(poses) / (time.time() - start)
+        print(f"{tag}: {rates[tag]:.3f} views/s")
+    return rates
+
+
+def writes(args):
+    """
+    Per-frame write overhead of the outputs: a render with nothing written,
+    with the PNG and the compositor File Output nodes (current pipeline) and
+    with the passes captured in memory and sent to --sink (--capture), and
+    captured with the encoding in background threads (--encoder_threads).
+    """
+    import bpy
+    import numpy as np
+    from super_main import create_sink
+    from tools.capture import FrameCapture
+    from tools.encoder import AsyncEncoder
+    from tools.render import render_image
+
+    state, objects, poses = prepare_scene(args)
+    scene = bpy.context.scene
+    file_outputs = sum(state["outputs"].values(), ())
+
+    def render_views(tag, write):
+        seconds = []
+        for view_idx, pose in enumerate(poses):
+            set_view(pose)
+            scene.frame_current = view_idx
+            start = time.time()
+            write(os.path.join(args.output_dir, tag, f"{view_idx:05d}"))
+            seconds.append(time.time() - start)
+        return float(np.mean(seconds))
+
+    def render_only(path):
+        bpy.ops.render.render(write_still=False)
+
+    def file_output(path):
+        render_image(f"{path}.png")
+
+    for node in file_outputs:
+        node.base_path = os.path.join(args.output_dir, "files")
+    rows = [("render only", render_views("none", render_only))]
+    for node in file_outputs:
+        node.mute = False
+    rows.append(("files", render_views("files", file_output)))
+
+    capture = FrameCapture(create_sink(args), scratch_dir=args.scratch_dir)
+    capture.enable()
+
+    def captured(path):
+        render_image(capture.path(scene.frame_current))
+        capture.collect(capture.path(scene.frame_current), path, frame=scene.frame_current)
+
+    rows.append((f"capture ({args.sink})", render_views("capture", captured)))
+
+    capture.encoder = AsyncEncoder(num_threads=max(args.encoder_threads, 1), max_queue=args.encoder_queue)
+    start = time.time()
+    seconds = render_views("capture_async", captured)
+    capture.encoder.join()
+    # the frames still in the queue at the end are part of the cost
+    rows.append((f"async ({args.sink})", max(seconds, (time.time() - start) / len(poses))))
+    print(f"Encoder: {capture.encoder.stats}")
+    capture.close()
+
+    print(f"{'outputs':>16} {'s/frame':>9} {'overhead':>9}")
+    for tag, seconds in rows:
+        print(f"{tag:>16} {seconds:>9.3f} {seconds - rows[0][1]:>9.3f}")
+    return rows
+
+
+def lod(args):
+    """
+    Validate the LOD: render the reference scene with the full resolution
+    objects, decimate them to the budget of --lod_triangles_per_pixel and
+    render it again. Report the silhouette IoU and the depth error of the
+    LOD renders and the seconds per frame of both.
+    """
+    import bpy
+    import numpy as np
+    from super_main import scene_lod_budget
+    from tools.capture import FrameCapture
+    from tools.lod import decimate
+    from tools.render import render_image
+    from tools.sinks import FrameSink
+
+    class ListSink(FrameSink):
+        def __init__(self):
+            self.records = []
+
+        def write(self, record):
+            self.records.append(record)
+
+    args.lod = False
+    state, objects, poses = prepare_scene(args)
+    capture = FrameCapture(ListSink(), scratch_dir=args.scratch_dir)
+    capture.enable()
+
+    def render_views(tag):
+        capture.sink.records = []
+        seconds = []
+        for view_idx, pose in enumerate(poses):
+            set_view(pose)
+            bpy.context.scene.frame_current = view_idx
+            path = capture.path(f"{tag}_{view_idx:05d}")
+            start = time.time()
+            render_image(path)
+            seconds.append(time.time() - start)
+            capture.collect(path, tag)
+        return float(np.mean(seconds)), [record["passes"] for record in capture.sink.records]
+
+    full_seconds, full = render_views("full")
+    budget = scene_lod_budget(args.lod_triangles_per_pixel)
+    for obj in objects:
+        before, after = decimate(obj, budget)
+        print(f"{obj.name}: {before} -> {after} triangles")
+    lod_seconds, decimated = render_views("lod")
+
+    ious, depth_errors = [], []
+    for reference, passes in zip(full, decimated):
+        mask, lod_mask = reference["index"] > 0, passes["index"] > 0
+        ious.append((mask & lod_mask).sum() / max((mask | lod_mask).sum(), 1))
+        both = mask & lod_mask
+        depth_errors.append(np.abs(reference["depth"][both] - passes["depth"][both]).mean() if both.any() else 0.0)
+    print(f"full resolution: {full_seconds:.3f} s/frame, LOD ({budget} triangles): {lod_seconds:.3f} s/frame")
+    print(f"silhouette IoU: mean {np.mean(ious):.4f}, min {np.min(ious):.4f}")
+    print(f"depth error: mean {np.mean(depth_errors):.5f} m, max {np.max(depth_errors):.5f} m")
+    return float(np.mean(ious)), float(np.mean(depth_errors))
+
+
+def poses(args):
+    """
+    Sampling time and coverage of the camera pose strategies (no Blender
+    needed). The coverage is the largest angle between a direction of the
+    sampled band and its closest view, averaged over --seeds scenes.
+    """
+    import numpy as np
+    from tools.poses import POSE_STRATEGIES, coverage, sample_poses, unit_samples
+
+    # dense and even set of directions of the band (azimuth and elevation in [0, pi / 2])
+    u = unit_samples(20000, "fibonacci", np.random.RandomState(0))
+    azimuth, elevation = u[:, 0] * 2 * np.pi, np.arcsin(u[:, 1])
+    band = np.stack([np.cos(elevation) * np.cos(azimuth), np.cos(elevation) * np.sin(azimuth), np.sin(elevation)], -1)
+
+    print(f"{'views':>6} {'strategy':>11} {'us/pose':>8} {'coverage (deg)':>15}")
+    rows = []
+    for num_views in [int(n) for n in args.counts.split(",")]:
+        for strategy in POSE_STRATEGIES:
+            rng = np.random.RandomState(0)
+            start = time.time()
+            samples = [
+                sample_poses(num_views, (0, 0, 0), radius=(1, 1), phi=(0, 0.5), strategy=strategy, rng=rng)[0]
+                for _ in range(args.seeds)
+            ]
+            seconds = (time.time() - start) / (args.seeds * num_views)
+            value = float(np.mean([coverage(positions, band) for positions in samples]))
+            rows.append((num_views, strategy, seconds, value))
+            print(f"{num_views:>6} {strategy:>11} {seconds * 1e6:>8.2f} {value:>15.2f}")
+    return rows
+
+
+def placement(args):
+    """
+    Seconds to scatter N objects on the floor with the grid index and with
+    pairwise checks (no Blender needed). Both place the same objects at the
+    same positions.
+    """
+    import numpy as np
+    from tools.placement import GridIndex, PairwiseIndex, scatter
+
+    print(f"{'objects':>8} {'grid (ms)':>10} {'pairwise (ms)':>14} {'placed':>7}")
+    rows = []
+    for num_objects in [int(n) for n in args.counts.split(",")]:
+        radii = np.random.RandomState(0).uniform(0.2, 0.7, num_objects)
+        seconds = {}
+        for name, index in (("grid", GridIndex), ("pairwise", PairwiseIndex)):
+            start = time.time()
+            _, placed = scatter(radii, margin=0.05, rng=np.random.RandomState(1), index=index)
+            seconds[name] = time.time() - start
+        rows.append((num_objects, seconds["grid"], seconds["pairwise"], float(placed.mean())))
+        print(f"{num_objects:>8} {seconds['grid'] * 1e3:>10.2f} {seconds['pairwise'] * 1e3:>14.2f} {placed.mean():>7.0%}")
+    return rows
+
+
+def triage(args):
+    """
+    Files per minute of the Blender-free asset triage with one process and
+    with --processes, and the number of assets of each flag.
+    """
+    from collections import Counter
+    from tools.triage import triage_files
+
+    paths = [os.path.join(args.obj_dir, f) for f in sorted(os.listdir(args.obj_dir))]
+    paths = [path for path in paths if os.path.isfile(path)]
+    rows = []
+    for processes in (1, args.processes):
+        start = time.time()
+        records = triage_files(paths, processes=processes)
+        seconds = time.time() - start
+        rows.append((processes, len(paths) / max(seconds, 1e-9) * 60))
+        print(f"{processes} processes: {rows[-1][1]:.0f} files/min ({len(paths)} files, {seconds:.2f}s)")
+    flags = Counter(flag for record in records.values() for flag in record["flags"] or [record["status"]])
+    print("flags: " + ", ".join(f"{flag} {count}" for flag, count in sorted(flags.items())))
+    return rows
+
+
+def _argv():
+    # Blender ignores the arguments after "--", they are the script's
+    if "--" in sys.argv:
+        return sys.argv[sys.argv.index("--") + 1 :]
+    return sys.argv[1:]
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    command = commands.add_parser("poses", help="Sampling time and coverage of the camera pose strategies")
+    command.add_argument("--counts", type=str, default="8,16,32,64", help="Comma-separated numbers of views")
+    command.add_argument("--seeds", type=int, default=20, help="Number of sampled scenes per count")
+    command.set_defaults(func=poses)
+
+    command = commands.add_parser("placement", help="Seconds to scatter N objects with the grid index and pairwise checks")
+    command.add_argument("--counts", type=str, default="10,100,500,2000", help="Comma-separated numbers of objects")
+    command.set_defaults(func=placement)
+
+    command = commands.add_parser("triage", help="Files per minute of the Blender-free asset triage")
+    command.add_argument("--obj_dir", type=str, default="./objects", help="Directory of the assets")
+    command.add_argument("--processes", type=int, default=os.cpu_count(), help="Number of triage processes")
+    command.set_defaults(func=triage)
+
+    try:
+        from super_main import add_arguments
+    except ImportError:
+        # outside of Blender, only the commands above are available
+        return parser
+
+    command = add_arguments(commands.add_parser("quality", help="Seconds per frame and PSNR of the quality profiles"))
+    command.add_argument("--profiles", type=str, default="draft,train,eval", help="Comma-separated quality profiles")
+    command.add_argument("--reference_samples", type=int, default=4096, help="Samples of the reference renders")
+    command.set_defaults(func=quality, output_dir="benchmark_output", num_views=4)
+
+    command = add_arguments(commands.add_parser("labels", help="Check the split label passes against the current pipeline"))
+    command.add_argument("--normal_tolerance", type=float, default=2.0, help="Largest mean angle (degrees) between the normals of both renders")
+    command.set_defaults(func=labels, output_dir="benchmark_output", num_views=4)
+
+    command = add_arguments(commands.add_parser("views", help="Views per second of the per-view and keyframed render paths"))
+    command.set_defaults(func=views, output_dir="benchmark_output", num_views=16)
+
+    command = add_arguments(commands.add_parser("lod", help="Silhouette IoU and depth error of the LOD against the full resolution objects"))
+    command.set_defaults(func=lod, output_dir="benchmark_output", num_views=8)
+
+    command = add_arguments(commands.add_parser("writes", help="Per-frame write overhead of the file outputs and of the in-memory capture"))
+    command.set_defaults(func=writes, output_dir="benchmark_output", num_views=8)
+
+    return parser
+
+
+if __name__ == "__main__":
+    args = build_parser().parse_args(_argv())
+    args.func(args)
@@ -1,8 +1,13 @@
+import argparse
 import os
-import random
-import subprocess
 
-def run_blender_commands(obj_dir, hdri_dir, output_base_dir, blender_app, script_path, num_scenes, num_views):
+from tools.ingest import IngestPipeline, check_asset, read_catalog
+from tools.manifest import JobManifest
+from tools.scheduler import Scheduler
+from tools.shards import recover_shards
+from tools.triage import CatalogIndex, route, triage_files, validate_asset
+
+def run_blender_commands(obj_dir, hdri_dir, output_base_dir, blender_app, script_path, num_scenes, num_views, num_workers=None, manifest_path=None, resume=False, worker_args=(), catalog=None, ingest_options=None, triage=False, triage_processes=None):
     """
     Run Blender commands for each object in the specified directory with a randomly selected HDRI.
 
@@ -13,61 +18,211 @@ def run_blender_commands(obj_dir, hdri_dir, output_base_dir, blender_app, script
     :param script_path: Path to the Python script to execute in Blender
     :param num_scenes: Number of scenes to render per object
     :param num_views: Number of views to render per scene
+    :param num_workers: Number of long-lived Blender workers rendering the jobs in parallel,
+        the cores are split between them. Defaults to one worker per 8 cores
+    :param manifest_path: JSONL file recording every finished view. Defaults to <output_base_dir>/manifest.jsonl
+    :param resume: Skip the views already recorded in the manifest
+    :param worker_args: Extra command line arguments of the Blender workers, e.g. ['--asset_cache', 'cache']
+    :param catalog: Asset catalog (see Objaverse_downoald.py). The assets are downloaded to obj_dir while
+        the first ones render, instead of rendering the files already in obj_dir
+    :param ingest_options: Options of the download pipeline, see tools.ingest.IngestPipeline
+    :param triage: Inspect the assets without Blender first (see tools.triage), skip the corrupt, empty,
+        degenerate or huge ones and render the heaviest first. The results are kept in <output_base_dir>/catalog_index.jsonl
+    :param triage_processes: Number of triage processes. Defaults to the number of cores
     """
-    # Get list of .obj files
-    obj_files = [f for f in os.listdir(obj_dir) if f.endswith('.obj') or f.endswith('.blend') or f.endswith('.glb')]
     hdri_files = [f for f in os.listdir(hdri_dir) if f.endswith('.exr')]
 
-    if not obj_files:
-        print("No .obj files found in the directory.")
-        return
-
     if not hdri_files:
         print("No .exr HDRI files found in the directory.")
         return
 
-    for obj_file in obj_files:
+    if manifest_path is None:
+        manifest_path = os.path.join(output_base_dir, "manifest.jsonl")
+    manifest = JobManifest(manifest_path)
+    triage_index = CatalogIndex(os.path.join(output_base_dir, "catalog_index.jsonl")) if triage else None
+
+    def remaining(obj_name):
+        # HDRIs still to render for the object, and the views already rendered
+        backgrounds = []
+        skip = []
         for hdri in hdri_files:
             # Select a random HDRI file
             # hdri_file = random.choice(hdri_files)
             hdri_path = os.path.join(hdri_dir, hdri)
-            print(f"HDRI: {hdri}")
-            
-            obj_path = os.path.join(obj_dir, obj_file)
-            obj_name = os.path.splitext(obj_file)[0]
-
-            # Create output directory for the current object
-            output_dir = os.path.join(output_base_dir, obj_name)
-            os.makedirs(output_dir, exist_ok=True)
-
-            # Construct the Blender command
-            command = [
-                blender_app, '-b', '-P', script_path, '--',
-                '--obj_paths', obj_path,
-                '--background', hdri_path,
-                '--output_dir', output_dir,
-                '--num_scenes', str(num_scenes),
-                '--num_views', str(num_views),
-                '--name', obj_name
-            ]
-            print(command)
-            print(f"Running command for object '{obj_name}'...")
-            try:
-                subprocess.run(command, check=True)
-                print(f"Completed rendering for object '{obj_name}'.")
-            except subprocess.CalledProcessError as e:
-                print(f"Error occurred while rendering object '{obj_name}': {e}")
-            except Exception as e:
-                print(f"Skipping object '{obj_name}' due to an error: {e}")
-
-# Example usage
-obj_directory = "./objects"
-hdri_directory = "./hdris"
-output_directory = "./renders10"
-blender_executable = "/home/opdal/Bureau/5GMM/Synthetic-Data-Generation-for-Supervised-Learning-Using-3D-Tools/PYBLEND/blender-3.2.2-linux-x64/blender"
-#"blender_app"
-blender_script = "super_main.py"
-num_scenes = 1
-num_views = 10
-
-run_blender_commands(obj_directory, hdri_directory, output_directory, blender_executable, blender_script, num_scenes, num_views)
+            if resume:
+                completed = manifest.completed(obj_name, hdri, num_scenes, num_views)
+                if len(completed) == num_scenes * num_views:
+                    continue
+                skip.extend((hdri, scene, view) for scene, view in completed)
+            backgrounds.append(hdri_path)
+        return backgrounds, skip
+
+    def make_job(obj_path):
+        obj_name = os.path.splitext(os.path.basename(obj_path))[0]
+        backgrounds, skip = remaining(obj_name)
+        if not backgrounds:
+            return None
+
+        # Create output directory for the current object
+        output_dir = os.path.join(output_base_dir, obj_name)
+        os.makedirs(output_dir, exist_ok=True)
+
+        # Same arguments as the command line of super_main.py
+        return dict(
+            obj_paths=[obj_path],
+            background=backgrounds,
+            output_dir=output_dir,
+            num_scenes=num_scenes,
+            num_views=num_views,
+            name=obj_name,
+            skip=skip,
+        )
+
+    # One job per object: the object is loaded once and rendered with every HDRI
+    pipeline = None
+    if catalog is None:
+        # Get list of .obj files
+        obj_files = [f for f in os.listdir(obj_dir) if f.endswith('.obj') or f.endswith('.blend') or f.endswith('.glb')]
+        if not obj_files:
+            print("No .obj files found in the directory.")
+            return
+        obj_paths = [os.path.join(obj_dir, f) for f in obj_files]
+        if triage_index is not None:
+            # broken assets are skipped before any Blender launch, the heaviest render first
+            records = triage_files(obj_paths, triage_index, processes=triage_processes)
+            flagged = [record for record in records.values() if record["status"] == "skip"]
+            for record in flagged:
+                print(f"Skipping '{record['path']}' ({', '.join(record['flags'])})")
+            print(f"Triage: {len(records) - len(flagged)} of {len(records)} assets kept, index in {triage_index.path}")
+            obj_paths = route(records.values())
+        jobs = [job for job in map(make_job, obj_paths) if job is not None]
+    else:
+        # The jobs are created as the assets arrive, the finished assets are not downloaded again
+        entries = (entry for entry in read_catalog(catalog) if remaining(entry["uid"])[0])
+        ingest_options = dict(ingest_options or {})
+        if triage_index is not None:
+            ingest_options["validate"] = lambda path: validate_asset(check_asset(path), triage_index)
+        pipeline = IngestPipeline(entries, obj_dir, **ingest_options)
+        def stream_jobs():
+            for path in pipeline:
+                job = make_job(path)
+                if job is None:
+                    # nothing left to render, the asset can be evicted
+                    pipeline.done(path)
+                    continue
+                yield job
+
+        jobs = stream_jobs()
+
+    def report(job, result):
+        if pipeline is not None:
+            # the asset can be evicted from the download directory
+            pipeline.done(job["obj_paths"][0])
+        if result["status"] == "ok":
+            print(f"Completed rendering for object '{job['name']}' with {len(job['background'])} HDRIs.")
+            if result.get("asset_cache"):
+                print(f"Asset cache of the worker: {result['asset_cache']}")
+            if result.get("memory"):
+                print(f"Worker memory: {result['memory']['rss_mb']:.0f} MB, peak {result['memory']['peak_rss_mb']:.0f} MB")
+            if result.get("timings"):
+                timings = result["timings"]
+                print(
+                    f"Timings: render {timings['render']:.1f}s, outputs {timings['output']:.1f}s, "
+                    f"other {timings['other']:.1f}s, renderer idle {timings['idle_fraction']:.0%}"
+                )
+        else:
+            print(f"Error occurred while rendering object '{job['name']}': {result['error']}")
+
+    def record(job, message):
+        if message["type"] == "progress":
+            manifest.record(job["name"], message["background"], message["scene"], message["view"], path=message["path"])
+
+    scheduler = Scheduler(blender_app, script_path, num_workers=num_workers, extra_args=worker_args)
+    if pipeline is None:
+        print(f"Rendering {len(jobs)} jobs on {len(scheduler.threads)} Blender workers ({scheduler.cores} cores)...")
+    else:
+        print(f"Rendering the assets of {catalog} as they download, on {len(scheduler.threads)} Blender workers ({scheduler.cores} cores)...")
+    scheduler.run(jobs, callback=report, on_message=record)
+    manifest.close()
+    if triage_index is not None:
+        triage_index.close()
+    if pipeline is not None:
+        print(f"Ingest: {pipeline.stats}, evicted {pipeline.budget.stats['evicted']} assets")
+        for uid, error in pipeline.errors.items():
+            print(f"Rejected asset {uid}: {error}")
+
+if __name__ == "__main__":
+    # Example usage
+    obj_directory = "./objects"
+    hdri_directory = "./hdris"
+    output_directory = "./renders10"
+    blender_executable = "/home/opdal/Bureau/5GMM/Synthetic-Data-Generation-for-Supervised-Learning-Using-3D-Tools/PYBLEND/blender-3.2.2-linux-x64/blender"
+    #"blender_app"
+    blender_script = "super_main.py"
+    num_scenes = 1
+    num_views = 10
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--obj_dir", type=str, default=obj_directory, help="Directory containing .obj/.glb/.blend files")
+    parser.add_argument("--hdri_dir", type=str, default=hdri_directory, help="Directory containing .exr HDRI files")
+    parser.add_argument("--output_dir", type=str, default=output_directory, help="Base output directory")
+    parser.add_argument("--blender", type=str, default=blender_executable, help="Path to the Blender executable")
+    parser.add_argument("--script", type=str, default=blender_script, help="Script run by the Blender workers")
+    parser.add_argument("--num_scenes", type=int, default=num_scenes, help="Number of scenes per object")
+    parser.add_argument("--num_views", type=int, default=num_views, help="Number of views per scene")
+    parser.add_argument("--num_workers", type=int, default=None, help="Number of concurrent Blender workers, defaults to one per 8 cores")
+    parser.add_argument("--manifest", type=str, default=None, help="Job manifest, defaults to <output_dir>/manifest.jsonl")
+    parser.add_argument("--resume", action="store_true", help="Skip the views already recorded in the manifest")
+    parser.add_argument("--asset_cache", type=str, default=None, help="Directory of the preprocessed asset cache shared by the workers")
+    parser.add_argument("--asset_cache_size", type=float, default=50, help="Maximum size of the asset cache in GB")
+    parser.add_argument("--lod", action="store_true", help="Decimate the objects to the triangle budget of the render resolution, cached with --asset_cache")
+    parser.add_argument("--max_rss_mb", type=float, default=None, help="Memory ceiling of a worker, it is replaced by a fresh one after the job that crosses it")
+    parser.add_argument("--texture_proxy_dir", type=str, default=None, help="Directory of the downscaled object textures shared by the workers")
+    parser.add_argument("--hdri_proxy_dir", type=str, default=None, help="Directory of the downsampled HDRI proxies shared by the workers")
+    parser.add_argument("--hdri_proxy_tier", type=float, default=2.0, help="HDRI proxy texels per rendered pixel")
+    parser.add_argument("--quality", type=str, default=None, help="Render quality profile of the workers (draft, train, eval), see benchmark.py quality")
+    parser.add_argument("--split_labels", action="store_true", help="Render the label passes in a separate single-sample view layer")
+    parser.add_argument("--keyframed_views", action="store_true", help="Render the views of a scene as one animation with persistent data")
+    parser.add_argument("--capture", action="store_true", help="Capture the render passes in memory and send each frame to --sink")
+    parser.add_argument("--sink", type=str, default="npz", help="Destination of the captured frames (npz, packed, shards)")
+    parser.add_argument("--shard_size", type=float, default=1, help="Size of the shards of --sink shards in GB")
+    parser.add_argument("--encoder_threads", type=int, default=2, help="Threads per worker encoding the captured frames in the background")
+    parser.add_argument("--catalog", type=str, default=None, help="Asset catalog (see Objaverse_downoald.py), the assets are downloaded to --obj_dir while the first ones render")
+    parser.add_argument("--mirror", type=str, default=None, help="Directory or base URL to download the catalog assets from instead of their URL")
+    parser.add_argument("--downloaders", type=int, default=4, help="Number of concurrent downloads of --catalog")
+    parser.add_argument("--max_download_gb", type=float, default=None, help="Disk budget of the downloaded assets, the rendered ones are deleted first")
+    parser.add_argument("--triage", action="store_true", help="Inspect the assets without Blender and skip the corrupt, empty, degenerate or huge ones")
+    parser.add_argument("--triage_processes", type=int, default=None, help="Number of triage processes, defaults to the number of cores")
+    args = parser.parse_args()
+
+    worker_args = []
+    if args.asset_cache:
+        worker_args += ["--asset_cache", args.asset_cache, "--asset_cache_size", str(args.asset_cache_size)]
+    if args.capture:
+        worker_args += ["--capture", "--sink", args.sink, "--encoder_threads", str(args.encoder_threads)]
+        if args.sink == "shards":
+            # one shard directory shared by all the workers, left over partial shards are finalized first
+            shard_dir = os.path.join(args.output_dir, "shards")
+            if os.path.isdir(shard_dir):
+                recover_shards(shard_dir)
+            worker_args += ["--shard_dir", shard_dir, "--shard_size", str(args.shard_size)]
+    if args.lod:
+        worker_args += ["--lod"]
+    if args.keyframed_views:
+        worker_args += ["--keyframed_views"]
+    if args.split_labels:
+        worker_args += ["--split_labels"]
+    if args.quality:
+        worker_args += ["--quality", args.quality]
+    if args.max_rss_mb:
+        worker_args += ["--max_rss_mb", str(args.max_rss_mb)]
+    if args.texture_proxy_dir:
+        worker_args += ["--texture_proxy_dir", args.texture_proxy_dir]
+    if args.hdri_proxy_dir:
+        worker_args += ["--hdri_proxy_dir", args.hdri_proxy_dir, "--hdri_proxy_tier", str(args.hdri_proxy_tier)]
+
+    ingest_options = dict(num_downloaders=args.downloaders, mirror=args.mirror,
+                          max_bytes=None if args.max_download_gb is None else int(args.max_download_gb * 2**30))
+
+    run_blender_commands(args.obj_dir, args.hdri_dir, args.output_dir, args.blender, args.script, args.num_scenes, args.num_views, args.num_workers, args.manifest, args.resume, worker_args,
+                         args.catalog, ingest_options, args.triage, args.triage_processes)
@@ -5,28 +5,47 @@ import numpy as np
 import sys
 import os
 import random
+import time
+import traceback
+from mathutils import Matrix, Vector
 
 
 #sys.path.append('/home/vazqueza/5A/ProjetRI/PyBlend/PyBlend/scripts')
 sys.path.append('/home/opdal/Bureau/5GMM/Synthetic-Data-Generation-for-Supervised-Learning-Using-3D-Tools/PYBLEND')
 
-from tools.object import load_obj, create_plane, enable_shaow_catcher, center
+from tools.object import load_obj, create_plane, enable_shaow_catcher, center, instance_object
 # from PyBlend.pyblend.viztools import plot_corner
 from tools.find import find_all_objects
 from tools.lighting import config_world, create_light
-from tools.camera import get_camera_para
-from tools.utils import BlenderRemover, ArgumentParserForBlender
-from tools.transform import look_at, normalize_obj, random_loc, obj_bbox, persp_project, againts_wall
+from tools.camera import get_camera_para, get_K_intr_from_blender
+from tools.utils import BlenderRemover, ArgumentParserForBlender, memory_usage
+from tools.transform import normalize_obj, obj_bbox, persp_project, againts_wall, invalidate_vertices, get_hull, apply_matrix
 from tools.render import (
     config_render,
     render_image,
     enable_segmentation_render,
     enable_depth_render,
     enable_normal_render,
+    set_segmentation_max_value,
+    keyframe_camera,
+    render_animation,
+    enable_label_view_layer,
+    update_label_override,
+    QUALITY_PROFILES,
 )
 from typing import Literal,Tuple
 
 from tools.background import set_hdri_background, set_colored_background
+from tools.cache import AssetCache
+from tools.capture import FrameCapture
+from tools.encoder import AsyncEncoder
+from tools.lod import decimate, triangle_budget
+from tools.textures import proxy_textures, texture_size
+from tools.metadata import JobMetadata
+from tools.placement import footprint, scatter
+from tools.poses import POSE_STRATEGIES, pose_matrices, sample_poses
+from tools.sinks import SINKS, make_sink
+from tools.worker import emit, read_jobs
 
 ssl_context = ssl.create_default_context(cafile=certifi.where())
 ssl._create_default_https_context = lambda: ssl_context
@@ -114,12 +133,27 @@ def randomize_lighting():
         energy=random.choice([1, 2, 3]),
     )
 
-    return dict(
+    lights = dict(
         key_light=key_light,
         fill_light=fill_light,
         rim_light=rim_light,
         bottom_light=bottom_light,
     )
+    for light in lights.values():
+        light["random_light"] = True
+    return lights
+
+
+def clear_random_lights():
+    """
+    Remove the lights added by `randomize_lighting`, e.g. before an HDRI
+    background of the same job, which is lit by the world only.
+    """
+    for obj in [obj for obj in bpy.data.objects if obj.get("random_light")]:
+        light = obj.data
+        bpy.data.objects.remove(obj)
+        if light.users == 0:
+            bpy.data.lights.remove(light)
 
 def load_and_combine_objects(filepath):
     """
@@ -178,112 +212,662 @@ def load_and_combine_objects(filepath):
 
 
 
-def load_objects(object_paths):
+def load_object(obj_path, name):
+    if obj_path.endswith(".blend"):
+        print("Blend object!")
+        obj = load_and_combine_objects(obj_path) # load_mesh_with_materials_original(args.input) # append_and_join_objects(args.input) 
+        print(obj)
+        center(obj, "object")
+    else: 
+        obj = load_obj(obj_path, name, center=True, join=True)
+    # placement and normalization use the hull, compute it once with the preprocessing
+    get_hull(obj)
+    return obj
+
+
+def load_objects(object_paths, cache=None, lod_budget=None, texture_proxy=None):
+    """
+    Load, join and center the objects. With an asset cache, the preprocessed
+    objects are appended from the cache when possible. A path given several
+    times is loaded once, the other occurrences are linked duplicates that
+    share its mesh data and materials (see `instance_object`).
+
+    Args:
+        lod_budget (int, optional): decimate the objects to this number of triangles
+            (see `tools.lod`), the decimated objects are the ones stored in the cache.
+        texture_proxy (dict, optional): proxy_dir and size of the downscaled textures
+            (see `tools.textures`), the objects stored in the cache use the proxies.
+    """
+    def load(obj_path, name):
+        obj = load_object(obj_path, name)
+        if lod_budget is not None:
+            before, after = decimate(obj, lod_budget)
+            print(f"LOD of {obj_path}: {before} -> {after} triangles")
+        if texture_proxy is not None:
+            report = proxy_textures(obj, texture_proxy["proxy_dir"], texture_proxy["size"])
+            print(
+                f"Texture proxies of {obj_path}: {report['images']} images, "
+                f"{report['bytes_saved'] / 2**20:.1f} MB saved in {report['seconds']:.2f}s"
+            )
+        return obj
+
+    options = dict(center=True, join=True, hull=True)
+    if lod_budget is not None:
+        options["lod"] = lod_budget
+    if texture_proxy is not None:
+        options["textures"] = texture_proxy["size"]
     objects = []
+    loaded = {}
     for i, obj_path in enumerate(object_paths):
-        if obj_path.endswith(".blend"):
-            print("Blend object!")
-            obj = load_and_combine_objects(obj_path) # load_mesh_with_materials_original(args.input) # append_and_join_objects(args.input) 
-            print(obj)
-            center(obj, "object")
-            objects.append(obj)
-        else: 
-            obj = load_obj(obj_path, f"object_{i}", center=True, join=True)
-            objects.append(obj)
+        name = f"object_{i}"
+        if obj_path in loaded:
+            obj = instance_object(loaded[obj_path], name)
+        elif cache is None:
+            obj = load(obj_path, name)
+        else:
+            obj = cache.load(obj_path, name, lambda: load(obj_path, name), **options)
+        loaded.setdefault(obj_path, obj)
+        objects.append(obj)
     return objects
 
-def main(args):
-    random.seed(42)
-    np.random.seed(42)
+JOB_DEFAULTS = dict(
+    obj_paths=[],
+    background=None,
+    color=None,
+    output_dir="output",
+    num_scenes=1,
+    num_views=2,
+    name=None,
+    skip=[],
+)
+
+
+def job_from_args(args):
+    """
+    Build a job description from the command line arguments. Jobs sent to a
+    worker (see `--worker`) use the same keys.
+    """
+    return dict(
+        obj_paths=args.obj_paths.split(","),
+        background=args.background.split(","),
+        color=args.color,
+        output_dir=args.output_dir,
+        num_scenes=args.num_scenes,
+        num_views=args.num_views,
+        name=args.name,
+    )
+
+
+def enable_outputs(label_layer=None):
+    """
+    Enable the segmentation, depth and normal outputs of the compositor,
+    paths are set per job.
+
+    Args:
+        label_layer (str, optional): If given, the label passes come from a separate
+            single-sample view layer with this name (see `enable_label_view_layer`) and
+            the beauty pass only renders the combined image.
+
+    Returns:
+        dict: the output nodes of each pass.
+    """
+    view_layer = "ViewLayer"
+    if label_layer is not None:
+        view_layer = enable_label_view_layer(label_layer).name
+    # Segmentation masks enabler:
+    exr_seg_node, png_seg_node = enable_segmentation_render("output", max_value=1, view_layer=view_layer)
+    # Depth maps enabler :
+    exr_depth_node, png_depth_node = enable_depth_render("output", reverse=True, view_layer=view_layer)
+    # Normal pass enabler: 
+    png_normal_node = enable_normal_render("output", view_layer=view_layer)
+    return dict(
+        seg=(exr_seg_node, png_seg_node),
+        depth=(exr_depth_node, png_depth_node),
+        normal=(png_normal_node,),
+    )
 
-    # Set up paths
-    object_paths = args.obj_paths.split(",")
-    output_dir = args.output_dir
-    os.makedirs(output_dir, exist_ok=True)
 
+def create_sink(args):
+    """
+    Create the sink of the captured frames from the command line arguments.
+    """
+    if args.sink == "shards":
+        shard_dir = args.shard_dir or os.path.join(args.output_dir, "shards")
+        return make_sink(args.sink, shard_dir=shard_dir, max_bytes=int(args.shard_size * 2**30))
+    return make_sink(args.sink)
+
+
+def scene_lod_budget(triangles_per_pixel=1.0):
+    """
+    Triangle budget of a normalized object for the render resolution and the camera.
+    """
+    # closest camera to a normalized object: distance 2 to its center, minus half its diagonal
+    return triangle_budget(
+        bpy.context.scene.render.resolution_x,
+        bpy.context.scene.render.resolution_y,
+        bpy.data.objects["Camera"].data.angle,
+        distance=2 - 3**0.5 / 2,
+        triangles_per_pixel=triangles_per_pixel,
+    )
+
+
+def setup_scene(args):
+    """
+    Configure the parts of the scene shared by every job: render settings,
+    floor plane, compositor outputs and caches. This is done once per process.
+
+    Args:
+        args (argparse.Namespace): the command line arguments.
+
+    Returns:
+        dict: the persistent scene state passed to `run_job`.
+    """
     # Configuring Blender
-    config_render(res_x=128, res_y=128, transparent=False) #res_x=640, res_y=640
+    config_render(
+        res_x=128, res_y=128, transparent=False, threads=args.threads, quality=args.quality,
+        persistent_data=args.keyframed_views,
+    ) #res_x=640, res_y=640
     remover = BlenderRemover()
     remover.clear_all()
-    config_world(0.3)
 
-    # Set HDRI background if provided
-    if args.background == "color":
-        #set_hdri_background(args.background)
-        if args.color:
-            set_colored_background(args.color) # Using a color background
-        else: 
-            set_colored_background([1, 0 , 0 , 1]) # Using a color background RED
-    else:
-        set_hdri_background(args.background)
     # Create floor plane
     plane = create_plane((0, 0, -1), (0, 0, 0), (20, 20, 20), name="floor")
     enable_shaow_catcher(plane)
 
+    outputs = enable_outputs(label_layer="Labels" if args.split_labels else None)
+
+    capture = None
+    if args.capture:
+        encoder = None
+        if args.encoder_threads > 0:
+            encoder = AsyncEncoder(num_threads=args.encoder_threads, max_queue=args.encoder_queue)
+        capture = FrameCapture(create_sink(args), scratch_dir=args.scratch_dir, encoder=encoder)
+        capture.enable()
+
+    asset_cache = None
+    if args.asset_cache:
+        asset_cache = AssetCache(args.asset_cache, max_bytes=int(args.asset_cache_size * 2**30))
+
+    texture_proxy = None
+    if args.texture_proxy_dir:
+        size = texture_size(
+            bpy.context.scene.render.resolution_x, bpy.context.scene.render.resolution_y, tier=args.texture_proxy_tier
+        )
+        texture_proxy = dict(proxy_dir=args.texture_proxy_dir, size=size)
+
+    lod_budget = None
+    if args.lod:
+        lod_budget = scene_lod_budget(args.lod_triangles_per_pixel)
+        print(f"LOD budget: {lod_budget} triangles per object")
+
+    return dict(
+        remover=remover,
+        asset_cache=asset_cache,
+        lod_budget=lod_budget,
+        texture_proxy=texture_proxy,
+        hdri_proxy=dict(proxy_dir=args.hdri_proxy_dir, proxy_tier=args.hdri_proxy_tier),
+        keyframed=args.keyframed_views,
+        view_sampler=args.view_sampler,
+        scatter=args.scatter,
+        capture=capture,
+        timings=dict(render=0.0, output=0.0),
+        keep={"Camera", plane.name},
+        reset=None,
+        outputs=outputs,
+    )
+
+
+def reset_job(state):
+    """
+    Remove everything a job added to the scene (objects, lights, and the
+    meshes, materials and images they used) and keep the persistent state.
+
+    Returns:
+        dict: the reset report, see `BlenderRemover.reset_scene`. It is also
+            stored in state["reset"].
+    """
+    state["reset"] = state["remover"].reset_scene(keep=state["keep"])
+    # the pointers of the purged meshes can be reused
+    invalidate_vertices()
+    return state["reset"]
+
+
+def list_backgrounds(background, color=None):
+    """
+    List the backgrounds of a job with the color of each "color" background
+    and the name used as prefix of its output files.
+
+    Args:
+        background (str or List[str]): HDRI paths or "color".
+        color (List[float] or List[List[float]], optional): RGBA colors used by
+            the "color" backgrounds, in order. Defaults to red.
+
+    Returns:
+        List[Tuple[str, List[float], str]]: (background, color, background_name)
+    """
+    backgrounds = [background] if isinstance(background, str) else list(background)
+    colors = [] if not color else [color] if not isinstance(color[0], (list, tuple)) else list(color)
+    num_colors = backgrounds.count("color")
+    listed = []
+    for background in backgrounds:
+        if background == "color":
+            idx = sum(b == "color" for b, _, _ in listed)
+            color = colors[idx] if idx < len(colors) else [1, 0 , 0 , 1] # RED
+            name = "color" if num_colors == 1 else f"color_{idx}"
+            listed.append((background, color, name))
+        else:
+            listed.append((background, None, background.split("/")[-1]))
+    return listed
+
+
+def set_background(background, color, state):
+    """
+    Set the world to an HDRI or to a solid color.
+    """
+    # Set HDRI background if provided
+    if background == "color":
+        set_colored_background(color) # Using a color background
+    else:
+        # the suns of a previous color background of the job would light the HDRI renders
+        clear_random_lights()
+        set_hdri_background(background, **state["hdri_proxy"])
+
+
+def scatter_objects(objects, margin=0.05):
+    """
+    Give each object a random heading and scatter them on the floor without
+    overlaps, using the footprints of their convex hulls (see `tools.placement`).
+    The objects that do not fit are hidden.
+
+    Returns:
+        Vector: the center of the placed objects.
+    """
+    for obj in objects:
+        obj.rotation_euler[2] = np.random.uniform(0, 2 * np.pi)
+    bpy.context.view_layer.update()
+    footprints = [footprint(apply_matrix(get_hull(obj), obj.matrix_world)) for obj in objects]
+    positions, placed = scatter([radius for _, radius in footprints], margin=margin)
+    for obj, (center, _), position, is_placed in zip(objects, footprints, positions, placed):
+        for obj_part in find_all_objects(obj):
+            obj_part.hide_render = not is_placed
+        if is_placed:
+            obj.location[0] += position[0] - center[0]
+            obj.location[1] += position[1] - center[1]
+    if not placed.all():
+        print(f"{len(objects) - placed.sum()} objects could not be placed")
+    bpy.context.view_layer.update()
+    z = np.mean([obj.location[2] for obj in objects])
+    return Vector((*positions[placed].mean(0), z))
+
+
+def scene_radius(objects, target):
+    """
+    Largest horizontal distance between the target and the hull of the objects.
+    """
+    hulls = np.concatenate([apply_matrix(get_hull(obj), obj.matrix_world) for obj in objects if not obj.hide_render])
+    return float(np.linalg.norm(hulls[:, :2] - np.array(target)[:2], axis=-1).max())
+
+
+def randomize_scene(objects, background, scatter=False):
+    """
+    Place the objects for a new scene and give each one its pass_index.
+
+    Args:
+        scatter (bool, optional): scatter the objects on the floor instead of
+            placing all of them at the origin.
+
+    Returns:
+        Vector: the point the camera looks at.
+    """
+    for obj_idx, obj in enumerate(objects):
+        normalize_obj(obj)
+        againts_wall(obj, z=-1)
+        if background == "color": randomize_lighting() # Adding lighting on single color background scenes
+        for obj_part in find_all_objects(obj):
+            obj_part.pass_index = obj_idx + 1
+    if scatter and len(objects) > 1:
+        return scatter_objects(objects)
+    return obj.location
+
+
+def render_views(camera, poses, prefix, first_frame, skip=(), keyframed=False, on_view=None, capture=None, meta=None, timings=None):
+    """
+    Render the views of one scene. View i is rendered at frame first_frame + i
+    and saved to f"{prefix}{frame:05d}.png", the compositor outputs use the
+    same frame number.
+
+    Args:
+        camera (bpy.types.Object): the camera.
+        poses (np.ndarray): (V, 4, 4) world matrix of the camera in each view, see `tools.poses`.
+        skip (Set[int], optional): views that are not rendered.
+        keyframed (bool, optional): keyframe all the camera poses and render them as one
+            animation, so that the scene data is built once (needs persistent data).
+        on_view (Callable[[int, str], None], optional): called with (view_idx, path)
+            after each rendered view.
+        capture (FrameCapture, optional): if given, the passes of each view are captured
+            in memory and sent to its sink as the record f"{prefix}{frame:05d}" instead
+            of being written as images.
+        meta (dict, optional): metadata added to the captured records.
+        timings (dict, optional): the seconds spent rendering (including the images
+            Blender writes itself) and handling the outputs of the views are added
+            to timings["render"] and timings["output"].
+
+    Returns:
+        int: the number of rendered views.
+    """
+    if timings is None:
+        timings = dict(render=0.0, output=0.0)
+
+    def done(frame, path):
+        start = time.time()
+        if capture is not None:
+            # the view is reported once its record is written, maybe by an encoder thread
+            record_id = f"{prefix}{frame:05d}"
+            capture.collect(
+                path, record_id, frame=frame, view=frame - first_frame, **(meta or {}),
+                on_done=None if on_view is None else lambda: on_view(frame - first_frame, record_id),
+            )
+        elif on_view is not None:
+            on_view(frame - first_frame, path)
+        timings["output"] += time.time() - start
+
+    for view_idx, pose in enumerate(poses):
+        camera.matrix_world = Matrix(pose.tolist())
+        if keyframed:
+            keyframe_camera(camera, first_frame + view_idx)
+            continue
+        if view_idx in skip:
+            continue
+        bpy.context.view_layer.update()
+
+        # Generate unique filenames for each render
+        frame = first_frame + view_idx
+        bpy.context.scene.frame_current = frame
+        path = f"{prefix}{frame:05d}.png" if capture is None else capture.path(f"{frame:05d}")
+        start = time.time()
+        render_image(path)
+        timings["render"] += time.time() - start
+        done(frame, path)
+
+    pending = [view_idx for view_idx in range(len(poses)) if view_idx not in skip]
+    if keyframed:
+        # one animation per run of consecutive pending views
+        runs = []
+        for view_idx in pending:
+            if runs and runs[-1][1] == view_idx - 1:
+                runs[-1][1] = view_idx
+            else:
+                runs.append([view_idx, view_idx])
+        for start, end in runs:
+            started, output = time.time(), timings["output"]
+            render_animation(
+                f"{prefix}#####" if capture is None else capture.path("#####"),
+                first_frame + start,
+                first_frame + end,
+                on_frame=done,
+            )
+            # done() runs inside the animation
+            timings["render"] += time.time() - started - (timings["output"] - output)
+        camera.animation_data_clear()
+    return len(pending)
+
+
+def run_job(job, state, on_view=None):
+    """
+    Render one job: load the objects once, then for each background render
+    `num_scenes * num_views` images. Only the world node tree changes between
+    backgrounds, and each background is randomized as if it had its own job.
+    The camera and box annotations of all the views are written at the end
+    to f"{output_dir}/meta_{name}.npz" (see `tools.metadata.JobMetadata`).
+
+    The (background_name, scene, view) units listed in `job["skip"]` are not
+    rendered. They are still randomized, so the other views are the same as
+    in a full run.
+
+    Args:
+        job (dict): the job, see `JOB_DEFAULTS` for the keys.
+        state (dict): the persistent scene state returned by `setup_scene`.
+        on_view (Callable, optional): called with (background_name, scene_idx, view_idx, path)
+            after each rendered view.
+
+    Returns:
+        int: the number of rendered images.
+    """
+    job = dict(JOB_DEFAULTS, **job)
+    state["timings"].update(render=0.0, output=0.0)
+    if state["capture"] is not None and state["capture"].encoder is not None:
+        state["encoder_start"] = state["capture"].encoder.snapshot()
+
+    # Set up paths
+    object_paths = job["obj_paths"]
+    output_dir = job["output_dir"]
+    os.makedirs(output_dir, exist_ok=True)
+
     # Load objects
     # print("Objavrese objects")
     # objects = load_objaverse(download_processes=10)
     # objects.append(load_objects(object_paths))
-    objects = load_objects(object_paths)
-    
+    objects = load_objects(object_paths, cache=state["asset_cache"], lod_budget=state["lod_budget"], texture_proxy=state["texture_proxy"])
+    # the no-bounce label override only for scenes without transparent materials
+    update_label_override()
+
+    name = job["name"]
+    set_segmentation_max_value(len(objects))
+    for node in sum(state["outputs"].values(), ()):
+        node.base_path = output_dir
+
+    exr_seg_node, png_seg_node = state["outputs"]["seg"]
+    exr_depth_node, png_depth_node = state["outputs"]["depth"]
+    (png_normal_node,) = state["outputs"]["normal"]
 
-    # Enable render passes
-    # Segmentation masks enabler:
-    background_name = args.background.split("/")[-1]
-    exr_seg_node, png_seg_node = enable_segmentation_render(f"{output_dir}", max_value=len(objects)) 
-    
-    # Depth maps enabler :
-    exr_depth_node, png_depth_node = enable_depth_render(f"{output_dir}"  ,reverse=True) #f"{output_dir}"
-    
-    # Normal pass enabler: 
-    png_normal_node = enable_normal_render(f"{output_dir}")
-    
-    # Output segmentation masks :
-    png_seg_node.file_slots[0].path = f"seg_{args.name}/{background_name}_"
-    # Uncomment to output exr files 
-    exr_seg_node.file_slots[0].path = f"seg_{args.name}/{background_name}_" # change path to where ou want your exr files 
-    
-    # Output depth maps : 
-    png_depth_node.file_slots[0].path = f"depth_{args.name}/{background_name}_"
-    #Uncomment to output exr files
-    exr_depth_node.file_slots[0].path = f"depth_{args.name}/{background_name}_"  # change path to where ou want your exr files 
-    
-    # Output normal pass :
-    png_normal_node.file_slots[0].path = f"normal_{args.name}/{background_name}_"
-
-    # Rendering loop
     camera = bpy.data.objects["Camera"]
-    render_counter = 0  # To track unique filenames
-    for scene_idx in range(args.num_scenes):
-        for obj_idx, obj in enumerate(objects):
-            normalize_obj(obj)
-            againts_wall(obj, z=-1)
-            if args.background == "color": randomize_lighting() # Adding lighting on single color background scenes
-            for obj_part in find_all_objects(obj):
-                obj_part.pass_index = obj_idx + 1
-
-        for view_idx in range(args.num_views):
-            camera.location = random_loc((0, 0, 0), (2, 2), theta=(-1, 1), phi=(0, 1)) # random_loc(loc, radius=[0, 1], theta=[-0.5, 0.5], phi=[-1, 1]):
-            look_at(camera, obj.location)
+    render = bpy.context.scene.render
+    metadata = JobMetadata(
+        get_K_intr_from_blender(camera), [obj.name for obj in objects], render.resolution_x, render.resolution_y
+    )
+    skip = {tuple(unit) for unit in job["skip"]}
+    rendered = 0
+    for background, color, background_name in list_backgrounds(job["background"], job["color"]):
+        random.seed(42)
+        np.random.seed(42)
+        config_world(0.3)
+
+        set_background(background, color, state)
+
+        # Output segmentation masks :
+        png_seg_node.file_slots[0].path = f"seg_{name}/{background_name}_"
+        # Uncomment to output exr files 
+        exr_seg_node.file_slots[0].path = f"seg_{name}/{background_name}_" # change path to where ou want your exr files 
+        
+        # Output depth maps : 
+        png_depth_node.file_slots[0].path = f"depth_{name}/{background_name}_"
+        #Uncomment to output exr files
+        exr_depth_node.file_slots[0].path = f"depth_{name}/{background_name}_"  # change path to where ou want your exr files 
+        
+        # Output normal pass :
+        png_normal_node.file_slots[0].path = f"normal_{name}/{background_name}_"
+
+        # Rendering loop
+        for scene_idx in range(job["num_scenes"]):
+            target = randomize_scene(objects, background, scatter=state["scatter"])
+            # 2 for a single normalized object, further away for scattered objects
+            distance = 2 * max(1.0, scene_radius(objects, target))
+            # a scattered scene is orbited around its center, the other scenes around the world origin
+            center = target if (state["scatter"] and len(objects) > 1) else (0, 0, 0)
+            poses = pose_matrices(*sample_poses(
+                job["num_views"], target, center=center, radius=(distance, distance), theta=(-1, 1), phi=(0, 1),
+                strategy=state["view_sampler"],
+            ))
+            # skipped views are deterministic too, the metadata has all the views
             bpy.context.view_layer.update()
+            metadata.add_scene(
+                background_name,
+                scene_idx,
+                poses,
+                np.stack([obj_bbox(obj, mode="box") for obj in objects]),
+                first_frame=scene_idx * job["num_views"],
+                hidden=[obj.hide_render for obj in objects],
+            )
+            rendered += render_views(
+                camera,
+                poses,
+                prefix=(
+                    f"{output_dir}/render_{name}/{background_name}_" if state["capture"] is None
+                    else f"{output_dir}/frames_{name}/{background_name}_"
+                ),
+                first_frame=scene_idx * job["num_views"],
+                skip={view for b, s, view in skip if b == background_name and s == scene_idx},
+                keyframed=state["keyframed"],
+                on_view=None if on_view is None else (
+                    # bound now: with an encoder, the callback runs after the loop moved on
+                    lambda view_idx, path, background_name=background_name, scene_idx=scene_idx: on_view(
+                        background_name, scene_idx, view_idx, path
+                    )
+                ),
+                capture=state["capture"],
+                meta=dict(asset=name, background=background_name, scene=scene_idx),
+                timings=state["timings"],
+            )
+
+    metadata.write(f"{output_dir}/meta_{name}.npz")
+    reset_job(state)
+    return rendered
+
+
+def job_timings(state, seconds):
+    """
+    Per-stage timings of the last job: seconds spent rendering, handling the
+    outputs and in the rest of the job (loading, scene setup), and the
+    fraction of the job during which the renderer was idle.
+    """
+    timings = dict(state["timings"], seconds=seconds)
+    timings["other"] = seconds - timings["render"] - timings["output"]
+    timings["idle_fraction"] = 1 - timings["render"] / max(seconds, 1e-6)
+    if state["capture"] is not None and state["capture"].encoder is not None:
+        timings["encoder"] = state["capture"].encoder.stats_since(state["encoder_start"])
+    return timings
 
-            # Generate unique filenames for each render
-            base_filename = f"{output_dir}/render_{args.name}/{background_name}_{render_counter:05d}"
-            bpy.context.scene.frame_current = scene_idx * args.num_views + view_idx
-            render_image(f"{base_filename}.png")
-            render_counter += 1
 
-    remover.clear_all()
+def teardown_scene(state):
+    if state["capture"] is not None:
+        state["capture"].close()
+    state["remover"].clear_all()
 
-if __name__ == "__main__":
-    parser = ArgumentParserForBlender()
-    parser.add_argument("--obj_paths", type=str, required=True, help="Comma-separated list of paths to object files")
-    parser.add_argument("--background", type=str, required=True, help="Path to the HDRI background image")
+
+def main(args):
+    state = setup_scene(args)
+    start = time.time()
+    run_job(job_from_args(args), state)
+    if state["capture"] is not None and state["capture"].encoder is not None:
+        state["capture"].encoder.join()
+    print(f"Timings: {job_timings(state, time.time() - start)}")
+    print(f"Memory: {memory_usage()}")
+    print(f"Scene reset: {state['reset']}")
+    teardown_scene(state)
+
+
+def finish_encoding(state):
+    """
+    Wait for the frames of the job being encoded, so that all its progress
+    messages come before its result, and clear the encoder errors so that
+    they fail this job only.
+
+    Returns:
+        List[str]: the errors of the encoder tasks of the job.
+    """
+    if state["capture"] is None or state["capture"].encoder is None:
+        return []
+    state["capture"].encoder.join()
+    return state["capture"].encoder.take_errors()
+
+
+def worker(args):
+    """
+    Worker mode: set up the scene once, then render the jobs sent as JSON
+    lines on stdin until it is closed. See `tools.worker.BlenderWorker`.
+    """
+    state = setup_scene(args)
+    emit("ready")
+    for job in read_jobs():
+        start = time.time()
+        try:
+            images = run_job(
+                job,
+                state,
+                on_view=lambda background, scene, view, path: emit(
+                    "progress", background=background, scene=scene, view=view, path=path
+                ),
+            )
+        except Exception as e:
+            traceback.print_exc()
+            finish_encoding(state)
+            reset_job(state)
+            emit("result", status="error", error=f"{type(e).__name__}: {e}", seconds=time.time() - start)
+        else:
+            errors = finish_encoding(state)
+            if errors:
+                emit("result", status="error", error=f"{len(errors)} frames not written, first error: {errors[0]}",
+                     seconds=time.time() - start)
+                continue
+            cache = state["asset_cache"]
+            memory = memory_usage()
+            # past the memory ceiling, the worker exits after this job and the host starts a new one
+            recycle = args.max_rss_mb is not None and memory["rss_mb"] > args.max_rss_mb
+            emit(
+                "result", status="ok", images=images, seconds=time.time() - start, asset_cache=cache and cache.stats,
+                timings=job_timings(state, time.time() - start), memory=memory, reset=state["reset"], recycle=recycle,
+            )
+            if recycle:
+                print(f"Worker memory {memory['rss_mb']:.0f} MB > {args.max_rss_mb} MB, recycling")
+                break
+    teardown_scene(state)
+
+
+def add_arguments(parser):
+    """
+    Add the arguments of super_main.py to the given parser.
+    """
+    parser.add_argument("--obj_paths", type=str, help="Comma-separated list of paths to object files")
+    parser.add_argument("--background", type=str, help="Comma-separated list of HDRI background images (or 'color'), rendered one after the other with the same loaded objects")
     parser.add_argument("--output_dir", type=str, default="output", help="Directory to save the output images")
     parser.add_argument("--num_scenes", type=int, default=1, help="Number of scenes to render")
-    parser.add_argument("--color", type=float, nargs=4, help="Color (R, G, B, A) ex: --color 0 0 1 1 ")
+    parser.add_argument("--color", type=float, nargs=4, action="append", help="Color (R, G, B, A) ex: --color 0 0 1 1, repeat it for several 'color' backgrounds")
 
     parser.add_argument("--num_views", type=int, default=2, help="Number of views per scene")
-    parser.add_argument("--name", type=str, required=True, help="Name of the object(s)")
+    parser.add_argument("--name", type=str, help="Name of the object(s)")
+    parser.add_argument("--scatter", action="store_true", help="Scatter the objects of a scene on the floor without overlaps instead of stacking them at the origin")
+    parser.add_argument("--view_sampler", type=str, default="uniform", choices=POSE_STRATEGIES, help="Distribution of the camera poses, see tools.poses.sample_poses")
+    parser.add_argument("--threads", type=int, help="Number of Cycles render threads, defaults to one per core")
+    parser.add_argument("--quality", type=str, choices=list(QUALITY_PROFILES), help="Render quality profile, defaults to 4096 denoised samples")
+    parser.add_argument("--split_labels", action="store_true", help="Render the depth, normal and segmentation passes in a separate single-sample view layer")
+    parser.add_argument("--keyframed_views", action="store_true", help="Render the views of a scene as one animation with persistent data")
+    parser.add_argument("--capture", action="store_true", help="Capture the render passes in memory and send each frame to --sink instead of writing one file per pass")
+    parser.add_argument("--sink", type=str, default="npz", choices=list(SINKS), help="Destination of the captured frames")
+    parser.add_argument("--encoder_threads", type=int, default=0, help="Threads encoding and writing the captured frames in the background, 0 to write them synchronously")
+    parser.add_argument("--encoder_queue", type=int, default=8, help="Captured frames waiting for the encoder threads before the render loop blocks")
+    parser.add_argument("--shard_dir", type=str, help="Directory of the shards of --sink shards, defaults to <output_dir>/shards")
+    parser.add_argument("--shard_size", type=float, default=1, help="Size of the shards in GB")
+    parser.add_argument("--scratch_dir", type=str, help="RAM-backed directory used to read back the renders, defaults to /dev/shm")
+    parser.add_argument("--asset_cache", type=str, help="Directory of the preprocessed asset cache, disabled if not given")
+    parser.add_argument("--asset_cache_size", type=float, default=50, help="Maximum size of the asset cache in GB")
+    parser.add_argument("--lod", action="store_true", help="Decimate the objects to the number of triangles that the render resolution can show, cached with --asset_cache")
+    parser.add_argument("--lod_triangles_per_pixel", type=float, default=1.0, help="Triangles kept per pixel covered by the closest view of an object")
+    parser.add_argument("--texture_proxy_dir", type=str, help="Directory of the downscaled textures of the objects, full resolution textures are used if not given")
+    parser.add_argument("--texture_proxy_tier", type=float, default=2.0, help="Texture texels per rendered pixel")
+    parser.add_argument("--hdri_proxy_dir", type=str, help="Directory of the downsampled HDRI proxies, full resolution HDRIs are used if not given")
+    parser.add_argument("--hdri_proxy_tier", type=float, default=2.0, help="HDRI proxy texels per rendered pixel")
+    parser.add_argument("--max_rss_mb", type=float, help="In worker mode, exit after the job during which the resident memory crossed this ceiling, the host then starts a fresh worker")
+    parser.add_argument("--worker", action="store_true", help="Read jobs as JSON lines from stdin instead of rendering a single job")
+    return parser
+
+
+if __name__ == "__main__":
+    parser = add_arguments(ArgumentParserForBlender())
     args = parser.parse_args()
-    main(args)
+    if args.worker:
+        worker(args)
+    else:
+        for required in ("obj_paths", "background", "name"):
+            if getattr(args, required) is None:
+                parser.error(f"--{required} is required")
+        main(args)
@@ -1,4 +1,9 @@
 import bpy
+import hashlib
+import json
+import math
+import os
+import numpy as np
 
 def set_colored_background(color: tuple[float, float, float, float]) -> None:
     """Sets a solid color background in the Blender scene.
@@ -31,12 +36,23 @@ def set_colored_background(color: tuple[float, float, float, float]) -> None:
     background_node.inputs["Color"].default_value = color
 
 
-def set_hdri_background(hdri_path: str) -> None:
-    """Sets a HDRI background in the Blender scene.
+def set_hdri_background(hdri_path: str, proxy_dir: str = None, proxy_tier: float = 2.0, tolerance: float = 0.05) -> None:
+    """Sets a HDRI background in the Blender scene. Only the world node tree
+    is rebuilt, so it can be called again to swap the background of a loaded
+    scene. The previous HDRI image is freed once nothing uses it.
 
     Args:
-        color (tuple): A tuple with RGBA values (range 0-1) for the background color.
+        hdri_path (str): Path to the HDRI image.
+        proxy_dir (str, optional): If given, use a downsampled proxy of the HDRI
+            matched to the render resolution, cached in this directory. See `get_hdri_proxy`.
+        proxy_tier (float, optional): Proxy pixels per rendered pixel. Defaults to 2.0.
+        tolerance (float, optional): Maximum relative lighting error of the proxy.
     """
+    if proxy_dir is not None:
+        camera = bpy.context.scene.camera or bpy.data.objects["Camera"]
+        width = hdri_proxy_width(bpy.context.scene.render.resolution_x, camera.data.angle, tier=proxy_tier)
+        hdri_path = get_hdri_proxy(hdri_path, proxy_dir, width, tolerance=tolerance)
+
     # Get the world settings
     world = bpy.context.scene.world
 
@@ -46,13 +62,17 @@ def set_hdri_background(hdri_path: str) -> None:
 
     # Set up world node tree
     world_node_tree = bpy.context.scene.world.node_tree
+    previous_images = [node.image for node in world_node_tree.nodes if node.type == "TEX_ENVIRONMENT" and node.image]
     world_node_tree.nodes.clear()
+    for image in previous_images:
+        if image.users == 0:
+            bpy.data.images.remove(image)
 
     location_x = 0
 
     # Path to HDRI image
     path_to_image = hdri_path
-    image_obj = bpy.data.images.load(path_to_image)
+    image_obj = bpy.data.images.load(path_to_image, check_existing=True)
 
     # Environment texture node
     environment_texture_node = world_node_tree.nodes.new(type="ShaderNodeTexEnvironment")
@@ -75,4 +95,142 @@ def set_hdri_background(hdri_path: str) -> None:
     world_node_tree.links.new(background_node.outputs["Background"], world_output_node.inputs["Surface"])
 
 
+def hdri_proxy_width(res_x, fov, tier=2.0, min_width=64, max_width=8192):
+    """
+    Width of a lat-long HDRI proxy that has about `tier` texels per rendered
+    pixel, rounded to the nearest power of two (between tier / sqrt(2) and
+    tier * sqrt(2) texels per pixel). Rounding up would give the width of
+    common 4k HDRIs already at low resolutions, and no proxy.
+
+    Args:
+        res_x (int): horizontal render resolution.
+        fov (float): horizontal field of view of the camera, in radians.
+        tier (float, optional): texels per rendered pixel. Defaults to 2.0.
+    """
+    width = tier * res_x * 2 * math.pi / fov
+    return int(min(max_width, max(min_width, 2 ** round(math.log2(width)))))
+
+
+def downsample_latlong(pixels, width):
+    """
+    Downsample a lat-long environment map with a box filter weighted by the
+    solid angle of each texel. The integral of the radiance over the sphere,
+    and so the total light of the environment, is preserved.
+
+    Args:
+        pixels (np.ndarray): (H, W, C) environment map.
+        width (int): width of the proxy, its height is width / 2.
+
+    Returns:
+        np.ndarray: (width / 2, width, C) environment map.
+    """
+    H, W, C = pixels.shape
+    height = max(width // 2, 1)
+    if width >= W:
+        return pixels
+    # solid angle of the texels of each row
+    lat = (np.arange(H) + 0.5) / H * np.pi - np.pi / 2
+    weights = np.cos(lat).astype(np.float64)[:, None]
+    cols = (np.arange(width) * W) // width
+    rows = (np.arange(height) * H) // height
+    summed = np.add.reduceat(pixels.astype(np.float64), cols, axis=1)
+    summed = np.add.reduceat(summed * weights[:, :, None], rows, axis=0)
+    norm = np.add.reduceat(weights, rows, axis=0)[:, :, None] * np.diff(np.append(cols, W))[None, :, None]
+    return (summed / np.maximum(norm, 1e-12)).astype(np.float32)
+
+
+def latlong_irradiance(pixels):
+    """
+    Irradiance (RGB) received by a surface facing each of the 6 axis
+    directions, computed from a lat-long environment map.
 
+    Returns:
+        np.ndarray: (6, 3) irradiance for +x, -x, +y, -y, +z, -z.
+    """
+    H, W, _ = pixels.shape
+    lat = (np.arange(H) + 0.5) / H * np.pi - np.pi / 2
+    lon = (np.arange(W) + 0.5) / W * 2 * np.pi - np.pi
+    lat, lon = np.meshgrid(lat, lon, indexing="ij")
+    dirs = np.stack([np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)], -1)  # (H, W, 3)
+    solid_angle = np.cos(lat) * (np.pi / H) * (2 * np.pi / W)
+    axes = np.concatenate([np.eye(3), -np.eye(3)])[[0, 3, 1, 4, 2, 5]]
+    cosines = np.maximum(dirs @ axes.T, 0) * solid_angle[..., None]  # (H, W, 6)
+    return np.einsum("hwa,hwc->ac", cosines, pixels[..., :3].astype(np.float64))
+
+
+def compare_hdri_lighting(full, proxy):
+    """
+    Relative error of the lighting of a proxy against the full resolution
+    environment map, measured on the irradiance along the 6 axis directions.
+
+    Returns:
+        float: the maximum relative error.
+    """
+    e_full = latlong_irradiance(full)
+    e_proxy = latlong_irradiance(proxy)
+    return float((np.abs(e_proxy - e_full) / np.maximum(np.abs(e_full), 1e-6)).max())
+
+
+def image_to_array(image):
+    width, height = image.size
+    pixels = np.empty(width * height * image.channels, dtype=np.float32)
+    image.pixels.foreach_get(pixels)
+    return pixels.reshape(height, width, image.channels)
+
+
+def get_hdri_proxy(hdri_path, proxy_dir, width, tolerance=0.05):
+    """
+    Path to a downsampled proxy of the HDRI, created and cached on disk the
+    first time. The proxy is only used if its lighting is within `tolerance`
+    of the full resolution HDRI (see `compare_hdri_lighting`), the result of
+    this check is stored next to the proxy.
+
+    Args:
+        hdri_path (str): Path to the HDRI image.
+        proxy_dir (str): Directory of the proxies.
+        width (int): Width of the proxy, see `hdri_proxy_width`.
+        tolerance (float, optional): Maximum relative lighting error. Defaults to 0.05.
+
+    Returns:
+        str: the path to the proxy, or hdri_path if the proxy is not accurate enough.
+    """
+    stat = os.stat(hdri_path)
+    key = hashlib.sha256(f"{os.path.abspath(hdri_path)}:{stat.st_size}:{stat.st_mtime_ns}".encode()).hexdigest()[:16]
+    stem = os.path.splitext(os.path.basename(hdri_path))[0]
+    proxy_path = os.path.join(proxy_dir, f"{stem}_{key}_{width}.exr")
+    report_path = f"{proxy_path}.json"
+
+    if not os.path.exists(report_path):
+        os.makedirs(proxy_dir, exist_ok=True)
+        image = bpy.data.images.load(hdri_path, check_existing=False)
+        full = image_to_array(image)
+        bpy.data.images.remove(image)
+        if width >= full.shape[1]:
+            # Already small enough, remember it so that it is not loaded again
+            with open(report_path, "w") as f:
+                json.dump(dict(source=hdri_path, width=width, error=0.0, path=hdri_path), f)
+            return hdri_path
+        proxy = downsample_latlong(full, width)
+        error = compare_hdri_lighting(full, proxy)
+
+        # Write then rename so that other workers never read a partial file
+        proxy_image = bpy.data.images.new(f"proxy_{stem}", proxy.shape[1], proxy.shape[0], alpha=True, float_buffer=True)
+        if proxy.shape[2] == 3:
+            proxy = np.concatenate([proxy, np.ones_like(proxy[..., :1])], -1)
+        proxy_image.pixels.foreach_set(proxy.ravel())
+        proxy_image.filepath_raw = f"{proxy_path}.{os.getpid()}.tmp.exr"
+        proxy_image.file_format = "OPEN_EXR"
+        proxy_image.save()
+        bpy.data.images.remove(proxy_image)
+        os.replace(f"{proxy_path}.{os.getpid()}.tmp.exr", proxy_path)
+        with open(f"{report_path}.{os.getpid()}.tmp", "w") as f:
+            json.dump(dict(source=hdri_path, width=width, error=error, path=proxy_path), f)
+        os.replace(f"{report_path}.{os.getpid()}.tmp", report_path)
+        print(f"HDRI proxy {proxy_path}: lighting error {error:.4f}")
+
+    with open(report_path) as f:
+        report = json.load(f)
+    if report["error"] > tolerance:
+        print(f"HDRI proxy {proxy_path} lighting error {report['error']:.4f} > {tolerance}, using the full resolution HDRI")
+        return hdri_path
+    return report["path"]
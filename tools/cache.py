@@ -0,0 +1,134 @@
+import bpy
+import hashlib
+import json
+import os
+from tools.find import find_all_objects
+
+
+def file_hash(path, chunk_size=1 << 20):
+    """
+    sha256 of the content of a file.
+    """
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class AssetCache:
+    """
+    Content-addressed cache of preprocessed assets. The first time an asset
+    is used, it is imported and preprocessed (joined, centered, ...) by the
+    given loader and the result is saved with its materials and images into
+    `<cache_dir>/<key>.blend`. Later loads append the objects from this file
+    instead of importing the asset again.
+
+    The key is the hash of the asset file and of the preprocessing options,
+    so changing either creates a new entry. Entries are evicted in least
+    recently used order when the cache grows over `max_bytes`.
+
+    >>> cache = AssetCache("asset_cache", max_bytes=50 * 2**30)
+    >>> obj = cache.load(path, "object_0", lambda: load_obj(path, "object_0", center=True, join=True), center=True, join=True)
+    >>> cache.stats
+    {'hits': 0, 'misses': 1, 'evictions': 0}
+    """
+
+    def __init__(self, cache_dir, max_bytes=None):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.stats = dict(hits=0, misses=0, evictions=0)
+        self._hashes = {}
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def key(self, path, **options):
+        stat = os.stat(path)
+        fingerprint = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+        if fingerprint not in self._hashes:
+            self._hashes[fingerprint] = file_hash(path)
+        options = json.dumps(options, sort_keys=True)
+        return hashlib.sha256(f"{self._hashes[fingerprint]}:{options}".encode()).hexdigest()
+
+    def entry(self, key):
+        return os.path.join(self.cache_dir, f"{key}.blend")
+
+    def hit_rate(self):
+        return self.stats["hits"] / max(self.stats["hits"] + self.stats["misses"], 1)
+
+    def load(self, path, name, loader, **options):
+        """
+        Load an asset from the cache, or with `loader` and store it in the cache.
+
+        Args:
+            path (str): path to the asset file, used for the key.
+            name (str): name given to the root object.
+            loader (Callable[[], bpy.types.Object]): imports and preprocesses the asset.
+            options: the preprocessing options, part of the key.
+
+        Returns:
+            bpy.types.Object: the root object of the asset.
+        """
+        entry = self.entry(self.key(path, **options))
+        if os.path.exists(entry):
+            try:
+                obj = self._append(entry, name)
+            except (OSError, RuntimeError) as e:
+                # Evicted or being replaced by another worker
+                print(f"Asset cache entry {entry} could not be loaded: {e}")
+            else:
+                os.utime(entry)
+                self.stats["hits"] += 1
+                return obj
+
+        self.stats["misses"] += 1
+        obj = loader()
+        self._save(obj, entry)
+        self.evict()
+        return obj
+
+    def evict(self):
+        """
+        Remove the least recently used entries until the cache fits in max_bytes.
+        """
+        if self.max_bytes is None:
+            return
+        entries = []
+        for f in os.listdir(self.cache_dir):
+            if not f.endswith(".blend"):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.cache_dir, f))
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, f))
+        total = sum(size for _, size, _ in entries)
+        for _, size, f in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(os.path.join(self.cache_dir, f))
+                self.stats["evictions"] += 1
+            except FileNotFoundError:
+                pass
+            total -= size
+
+    def _save(self, obj, entry):
+        # Write then rename so that other workers never read a partial file
+        tmp = f"{entry}.{os.getpid()}.tmp"
+        bpy.data.libraries.write(tmp, set(find_all_objects(obj)), path_remap="ABSOLUTE")
+        os.replace(tmp, entry)
+
+    def _append(self, entry, name):
+        with bpy.data.libraries.load(entry, link=False) as (data_from, data_to):
+            data_to.objects = data_from.objects[:]
+        objs = [obj for obj in data_to.objects if obj is not None]
+        if not objs:
+            raise RuntimeError(f"No objects in {entry}")
+        for obj in objs:
+            bpy.context.collection.objects.link(obj)
+        obj = next(obj for obj in objs if obj.parent is None)
+        obj.name = name
+        if obj.type == "MESH":
+            obj.data.name = name
+        bpy.context.view_layer.objects.active = obj
+        return obj
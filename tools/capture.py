@@ -0,0 +1,182 @@
+import bpy
+import os
+import struct
+import tempfile
+import numpy as np
+
+EXR_MAGIC = 20000630
+EXR_PIXEL_TYPES = {0: np.dtype("<u4"), 1: np.dtype("<f2"), 2: np.dtype("<f4")}
+
+
+def _read_null_terminated(buffer, offset):
+    end = buffer.index(b"\0", offset)
+    return buffer[offset:end].decode(), end + 1
+
+
+def read_exr(path):
+    """
+    Read an uncompressed scanline OpenEXR file, e.g. a multilayer render
+    written with exr_codec="NONE", into NumPy arrays.
+
+    Returns:
+        Dict[str, np.ndarray]: (H, W) array of each channel, e.g. "ViewLayer.Depth.Z",
+            rows from top to bottom.
+    """
+    with open(path, "rb") as f:
+        buffer = f.read()
+    magic, version = struct.unpack_from("<ii", buffer, 0)
+    if magic != EXR_MAGIC:
+        raise ValueError(f"{path} is not an OpenEXR file")
+    if version & 0x1200:
+        raise NotImplementedError(f"{path}: tiled and multi-part OpenEXR files are not supported")
+
+    offset = 8
+    channels = []
+    compression = None
+    data_window = None
+    while buffer[offset] != 0:
+        name, offset = _read_null_terminated(buffer, offset)
+        kind, offset = _read_null_terminated(buffer, offset)
+        (size,) = struct.unpack_from("<i", buffer, offset)
+        offset += 4
+        value = buffer[offset : offset + size]
+        offset += size
+        if name == "channels":
+            i = 0
+            while value[i] != 0:
+                channel, i = _read_null_terminated(value, i)
+                (pixel_type,) = struct.unpack_from("<i", value, i)
+                channels.append((channel, EXR_PIXEL_TYPES[pixel_type]))
+                i += 16
+        elif name == "compression":
+            compression = value[0]
+        elif name == "dataWindow":
+            data_window = struct.unpack("<iiii", value)
+    offset += 1
+    if compression != 0:
+        raise NotImplementedError(f"{path}: only uncompressed OpenEXR files are supported")
+
+    xmin, ymin, xmax, ymax = data_window
+    width, height = xmax - xmin + 1, ymax - ymin + 1
+    chunks = np.frombuffer(buffer, dtype="<u8", count=height, offset=offset)
+    scanline = np.dtype(
+        [("y", "<i4"), ("size", "<i4")] + [(channel, dtype, (width,)) for channel, dtype in channels]
+    )
+    if np.all(np.diff(chunks.astype(np.int64)) == scanline.itemsize):
+        lines = np.frombuffer(buffer, dtype=scanline, count=height, offset=int(chunks[0]))
+    else:
+        lines = np.concatenate([np.frombuffer(buffer, dtype=scanline, count=1, offset=int(c)) for c in chunks])
+    order = np.argsort(lines["y"])
+    return {channel: lines[channel][order] for channel, _ in channels}
+
+
+# (channels, name in the record) of the passes of a render
+CAPTURED_PASSES = {
+    "Combined": ("RGBA", "rgb"),
+    "Depth": ("Z", "depth"),
+    "IndexOB": ("X", "index"),
+    "Normal": ("XYZ", "normal"),
+}
+
+
+def collect_passes(channels, beauty_layer="ViewLayer"):
+    """
+    Group the channels of a multilayer render into the arrays of a record.
+    The combined pass comes from the beauty layer, the other passes from
+    whichever layer renders them (see `enable_label_view_layer`).
+    """
+    layers = sorted({channel.split(".")[0] for channel in channels}, key=lambda layer: layer != beauty_layer)
+    passes = {}
+    for render_pass, (components, key) in CAPTURED_PASSES.items():
+        for layer in layers:
+            names = [f"{layer}.{render_pass}.{c}" for c in components]
+            if all(name in channels for name in names):
+                arrays = [channels[name] for name in names]
+                passes[key] = arrays[0] if len(arrays) == 1 else np.stack(arrays, -1)
+                break
+    return passes
+
+
+class FrameCapture:
+    """
+    Capture the Combined, Depth, IndexOB and Normal passes of each render into
+    NumPy arrays and send them as one record to a sink, instead of writing
+    one file per pass with File Output nodes.
+
+    Blender does not expose the pixels of the Render Result to Python, so
+    the render is written once as an uncompressed multilayer EXR to a
+    RAM-backed scratch directory, read back with `read_exr` and deleted.
+    With an encoder (see `tools.encoder.AsyncEncoder`), reading, encoding and
+    writing the record happen in the background while the next frame renders.
+
+    >>> capture = FrameCapture(NpzSink())
+    >>> capture.enable()
+    >>> render_image(capture.path(frame))
+    >>> capture.collect(capture.path(frame), "renders/chair/frame_00000", frame=frame)
+    """
+
+    def __init__(self, sink, scratch_dir=None, beauty_layer="ViewLayer", encoder=None):
+        if scratch_dir is None:
+            scratch_dir = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+        self.sink = sink
+        self.scratch_dir = scratch_dir
+        self.beauty_layer = beauty_layer
+        self.encoder = encoder
+
+    def enable(self):
+        """
+        Render to multilayer EXR and mute the File Output nodes of the compositor.
+
+        The EXR holds the linear Combined pass, before the view transform, and
+        `tools.packing.pack_frame` encodes it with the plain sRGB curve. The
+        view transform is set to "Standard" (instead of the default "Filmic"
+        of Blender 3.x), so that this is the same image a PNG render would be.
+        """
+        view = bpy.context.scene.view_settings
+        view.view_transform = "Standard"
+        view.look = "None"
+        view.exposure = 0.0
+        view.gamma = 1.0
+        settings = bpy.context.scene.render.image_settings
+        settings.file_format = "OPEN_EXR_MULTILAYER"
+        settings.exr_codec = "NONE"
+        settings.color_depth = "32"
+        if bpy.context.scene.node_tree is not None:
+            for node in bpy.context.scene.node_tree.nodes:
+                if node.type == "OUTPUT_FILE":
+                    node.mute = True
+
+    def path(self, frame):
+        """
+        Scratch path of a frame, frame can be "#####" for animations.
+        """
+        return os.path.join(self.scratch_dir, f"capture_{os.getpid()}_{frame}.exr")
+
+    def collect(self, path, record_id, on_done=None, **meta):
+        """
+        Read the render written at path, delete it and send the record to the
+        sink, in the background if there is an encoder.
+
+        Args:
+            on_done (Callable[[], None], optional): called once the record is written.
+        """
+        if self.encoder is not None:
+            self.encoder.submit(self._collect, path, record_id, meta, on_done)
+        else:
+            self._collect(path, record_id, meta, on_done)
+
+    def _collect(self, path, record_id, meta, on_done=None):
+        channels = read_exr(path)
+        os.remove(path)
+        record = dict(id=record_id, meta=meta, passes=collect_passes(channels, self.beauty_layer))
+        self.sink.write(record)
+        if on_done is not None:
+            on_done()
+
+    def close(self):
+        """
+        Wait for the frames being encoded and close the sink.
+        """
+        if self.encoder is not None:
+            self.encoder.close()
+        self.sink.close()
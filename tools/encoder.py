@@ -0,0 +1,111 @@
+import queue
+import threading
+import time
+
+
+class AsyncEncoder:
+    """
+    Pool of background threads that encode and write the rendered frames
+    while Blender renders the next ones. Tasks go through a bounded queue:
+    when the encoders fall behind, `submit` blocks until a slot is free, so
+    the frames waiting in memory (or on the scratch disk) stay bounded.
+
+    NumPy, zlib and file writes release the GIL, so the encoding overlaps
+    with the render. The tasks must not use bpy, which is not thread-safe.
+
+    >>> encoder = AsyncEncoder(num_threads=4, max_queue=16)
+    >>> encoder.submit(sink.write, record)
+    >>> encoder.join()
+    >>> encoder.take_errors()
+    []
+    >>> encoder.close()
+    >>> encoder.stats
+    {'tasks': 10, 'failed': 0, 'encode': 1.52, 'wait': 0.0, 'idle': 8.1}
+    """
+
+    def __init__(self, num_threads=2, max_queue=8):
+        """
+        Args:
+            num_threads (int, optional): number of encoder threads.
+            max_queue (int, optional): number of tasks waiting before `submit` blocks.
+        """
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.stats = dict(tasks=0, failed=0, encode=0.0, wait=0.0, idle=0.0)
+        self.errors = []
+        self._lock = threading.Lock()
+        self._threads = [threading.Thread(target=self._run, daemon=True) for _ in range(num_threads)]
+        for thread in self._threads:
+            thread.start()
+
+    def submit(self, func, *args, **kwargs):
+        """
+        Queue func(*args, **kwargs), blocks while the queue is full. The time
+        spent blocked is added to stats["wait"].
+        """
+        if self.errors:
+            # the job fails, `take_errors` clears the errors for the next job
+            raise RuntimeError(f"Encoder task failed: {self.errors[0]}")
+        start = time.time()
+        self.queue.put((func, args, kwargs))
+        with self._lock:
+            self.stats["wait"] += time.time() - start
+
+    def _run(self):
+        while True:
+            start = time.time()
+            task = self.queue.get()
+            started = time.time()
+            if task is None:
+                self.queue.task_done()
+                return
+            func, args, kwargs = task
+            try:
+                func(*args, **kwargs)
+            except Exception as e:
+                with self._lock:
+                    self.stats["failed"] += 1
+                    self.errors.append(f"{type(e).__name__}: {e}")
+            finally:
+                with self._lock:
+                    self.stats["tasks"] += 1
+                    self.stats["idle"] += started - start
+                    self.stats["encode"] += time.time() - started
+                self.queue.task_done()
+
+    def join(self):
+        """
+        Wait until all the queued tasks are done.
+        """
+        self.queue.join()
+
+    def take_errors(self):
+        """
+        Return and clear the errors of the tasks so far, e.g. after the `join`
+        at the end of a job, so that they fail this job only.
+        """
+        with self._lock:
+            errors, self.errors = self.errors, []
+        return errors
+
+    def snapshot(self):
+        """
+        Copy of the stats, to compute the stats of a job (see `stats_since`).
+        """
+        with self._lock:
+            return dict(self.stats)
+
+    def stats_since(self, snapshot):
+        with self._lock:
+            return {key: value - snapshot[key] for key, value in self.stats.items()}
+
+    def close(self):
+        """
+        Finish the queued tasks and stop the threads.
+        """
+        for _ in self._threads:
+            self.queue.put(None)
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+        if self.errors:
+            print(f"{len(self.errors)} encoder tasks failed, first error: {self.errors[0]}")
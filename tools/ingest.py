@@ -0,0 +1,332 @@
+import hashlib
+import json
+import os
+import queue
+import shutil
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+
+
+class ChecksumError(ValueError):
+    pass
+
+
+def read_catalog(path):
+    """
+    Read a catalog of assets, one JSON object per line with at least "uid" and
+    "url", and optionally "sha256", "file_type" and "size" (see Objaverse_downoald.py).
+    """
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+
+
+def asset_filename(entry):
+    return f"{entry['uid']}.{entry.get('file_type', 'glb')}"
+
+
+def source_url(entry, mirror=None):
+    """
+    Where to fetch an asset from: its own URL, or the file of the same name
+    in a mirror (a directory or the base URL of an HTTP server).
+    """
+    if mirror is None:
+        return entry["url"]
+    if "://" in mirror:
+        return f"{mirror.rstrip('/')}/{urllib.parse.quote(asset_filename(entry))}"
+    return os.path.join(mirror, asset_filename(entry))
+
+
+def fetch(url, path, sha256=None, chunk_size=1 << 20, timeout=60):
+    """
+    Download url to path. The data goes to `<path>.part`, and an interrupted
+    download resumes from there with an HTTP Range request. The file is
+    checked against sha256 (if given) and then renamed to path.
+
+    Local paths and file:// URLs are copied.
+
+    Returns:
+        int: the size of the file.
+    """
+    part = f"{path}.part"
+    if "://" not in url or url.startswith("file://"):
+        shutil.copyfile(urllib.parse.unquote(url[len("file://"):]) if url.startswith("file://") else url, part)
+    else:
+        offset = os.path.getsize(part) if os.path.exists(part) else 0
+        request = urllib.request.Request(url, headers={"Range": f"bytes={offset}-"} if offset else {})
+        try:
+            with urllib.request.urlopen(request, timeout=timeout) as response:
+                # 206: the server resumes the download, 200: it sends the whole file again
+                mode = "ab" if offset and response.status == 206 else "wb"
+                with open(part, mode) as f:
+                    shutil.copyfileobj(response, f, chunk_size)
+        except urllib.error.HTTPError as e:
+            # 416: nothing left to download, the part file is complete
+            if not (offset and e.code == 416):
+                raise
+
+    if sha256 is not None:
+        h = hashlib.sha256()
+        with open(part, "rb") as f:
+            for chunk in iter(lambda: f.read(chunk_size), b""):
+                h.update(chunk)
+        if h.hexdigest() != sha256:
+            os.remove(part)
+            raise ChecksumError(f"sha256 mismatch for {url}: expected {sha256}, got {h.hexdigest()}")
+    os.replace(part, path)
+    return os.path.getsize(path)
+
+
+def check_asset(path):
+    """
+    Cheap validation of a downloaded asset before it is sent to Blender:
+    not empty, and a GLB starts with the binary glTF header.
+
+    Returns:
+        str: the path of the asset to render.
+    """
+    with open(path, "rb") as f:
+        header = f.read(12)
+    if not header:
+        raise ValueError(f"{path} is empty")
+    if path.endswith(".glb") and header[:4] != b"glTF":
+        raise ValueError(f"{path} is not a binary glTF file")
+    return path
+
+
+class DiskBudget:
+    """
+    Bound the disk space used by the downloaded assets. Before a download,
+    `reserve` evicts the assets that are already rendered (oldest first),
+    and waits while the other assets being rendered leave no room.
+    """
+
+    def __init__(self, max_bytes=None, timeout=300.0):
+        """
+        Args:
+            timeout (float, optional): seconds `reserve` waits for a rendered asset
+                before it exceeds the budget with a warning, so that an asset never
+                marked `done` cannot stall the downloads.
+        """
+        self.max_bytes = max_bytes
+        self.timeout = timeout
+        self.used = 0
+        self.sizes = {}
+        self.rendered = []
+        self.stats = dict(evicted=0, evicted_bytes=0, assets=0, bytes=0)
+        self._condition = threading.Condition()
+
+    def scan(self, directory):
+        """
+        Account for the assets already in directory (e.g. from an earlier run).
+        They can be evicted, unless `claim` takes them back first.
+        """
+        with self._condition:
+            for name in os.listdir(directory):
+                path = os.path.join(directory, name)
+                if name.endswith(".part") or not os.path.isfile(path) or path in self.sizes:
+                    continue
+                self.sizes[path] = os.path.getsize(path)
+                self.used += self.sizes[path]
+                self.rendered.append(path)
+
+    def claim(self, path):
+        """
+        Keep an asset already on disk for a new render.
+
+        Returns:
+            bool: whether the asset is on disk and accounted for.
+        """
+        with self._condition:
+            if path not in self.sizes:
+                return False
+            if path in self.rendered:
+                self.rendered.remove(path)
+            return os.path.exists(path)
+
+    def reserve(self, nbytes):
+        """
+        Wait until nbytes fit in the budget and account for them.
+        """
+        with self._condition:
+            while self.max_bytes is not None and self.used + nbytes > self.max_bytes:
+                if self.rendered:
+                    self._evict(self.rendered.pop(0))
+                elif self.used == 0:
+                    # a single asset larger than the budget
+                    break
+                elif not self._condition.wait(self.timeout):
+                    print(f"No rendered asset to evict after {self.timeout:g}s, exceeding the disk budget "
+                          f"({(self.used + nbytes) / 2**20:.0f} of {self.max_bytes / 2**20:.0f} MB)")
+                    break
+            self.used += nbytes
+
+    def add(self, path, nbytes, reserved=0):
+        """
+        Record the actual size of a downloaded asset (reserved bytes are released).
+        """
+        with self._condition:
+            self.used += nbytes - reserved - self.sizes.get(path, 0)
+            self.sizes[path] = nbytes
+            self.stats["assets"] += 1
+            self.stats["bytes"] += nbytes
+
+    def average_size(self):
+        """
+        Size to reserve for an asset of unknown size: the average of the assets so far.
+        """
+        return self.stats["bytes"] // max(self.stats["assets"], 1)
+
+    def release(self, nbytes):
+        with self._condition:
+            self.used -= nbytes
+            self._condition.notify_all()
+
+    def done(self, path):
+        """
+        The asset is rendered and can be evicted.
+        """
+        with self._condition:
+            if path in self.sizes:
+                self.rendered.append(path)
+                self._condition.notify_all()
+
+    def _evict(self, path):
+        size = self.sizes.pop(path)
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        self.used -= size
+        self.stats["evicted"] += 1
+        self.stats["evicted_bytes"] += size
+
+
+class IngestPipeline:
+    """
+    Stream assets from a catalog: a bounded pool of downloader threads
+    fetches the assets, a validation step checks (and may convert) each
+    one, and the valid assets are yielded as soon as they are ready, so
+    rendering starts with the first asset. A disk budget evicts the
+    assets that are rendered (see `done`).
+
+    >>> pipeline = IngestPipeline(read_catalog("catalog.jsonl"), "objects", max_bytes=20 * 2**30)
+    >>> for path in pipeline:
+    ...     render(path)
+    ...     pipeline.done(path)
+    """
+
+    def __init__(self, entries, download_dir, num_downloaders=4, mirror=None, max_bytes=None, validate=check_asset,
+                 max_ready=8, retries=3, budget_timeout=300.0):
+        """
+        Args:
+            entries (Iterable[dict]): the catalog entries, see `read_catalog`.
+            mirror (str, optional): directory or base URL to fetch the assets from instead of their URL.
+            max_bytes (int, optional): disk budget of download_dir, including the assets
+                already in it.
+            validate (Callable[[str], str], optional): checks an asset and returns the path to
+                render (e.g. after a conversion), or raises ValueError for a bad asset.
+                Defaults to `check_asset`.
+            max_ready (int, optional): number of assets waiting for the renderers before the
+                downloaders pause.
+            budget_timeout (float, optional): seconds a download waits for room in the disk
+                budget before it exceeds it, see `DiskBudget`.
+        """
+        self.entries = iter(entries)
+        self.download_dir = download_dir
+        self.mirror = mirror
+        self.validate = validate
+        self.retries = retries
+        self.budget = DiskBudget(max_bytes, budget_timeout)
+        self.stats = dict(downloaded=0, skipped=0, failed=0, bytes=0)
+        self.errors = {}
+        self._downloaded = {}
+        self._ready = queue.Queue(maxsize=max_ready)
+        self._entries_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        os.makedirs(download_dir, exist_ok=True)
+        self.budget.scan(download_dir)
+        self._threads = [threading.Thread(target=self._download, daemon=True) for _ in range(num_downloaders)]
+        for thread in self._threads:
+            thread.start()
+        self._closer = threading.Thread(target=self._close_when_done, daemon=True)
+        self._closer.start()
+
+    def _next_entry(self):
+        with self._entries_lock:
+            return next(self.entries, None)
+
+    def _download(self):
+        while True:
+            entry = self._next_entry()
+            if entry is None:
+                return
+            path = os.path.join(self.download_dir, asset_filename(entry))
+            if self.budget.claim(path):
+                self._count("skipped")
+            else:
+                size = entry.get("size") or self.budget.average_size()
+                self.budget.reserve(size)
+                try:
+                    self._fetch(entry, path)
+                    self._count("downloaded")
+                    self._count("bytes", os.path.getsize(path))
+                except (OSError, ValueError) as e:
+                    self.budget.release(size)
+                    self._reject(entry, e)
+                    continue
+                self.budget.add(path, os.path.getsize(path), reserved=size)
+            try:
+                render_path = path if self.validate is None else self.validate(path)
+            except (OSError, ValueError) as e:
+                self.budget.done(path)
+                self._reject(entry, e)
+                continue
+            with self._stats_lock:
+                self._downloaded[render_path] = path
+            self._ready.put(render_path)
+
+    def _count(self, key, value=1):
+        with self._stats_lock:
+            self.stats[key] += value
+
+    def _reject(self, entry, error):
+        with self._stats_lock:
+            self.stats["failed"] += 1
+            self.errors[entry["uid"]] = f"{type(error).__name__}: {error}"
+        print(f"Asset {entry['uid']} rejected: {error}")
+
+    def _fetch(self, entry, path):
+        for attempt in range(self.retries):
+            try:
+                return fetch(source_url(entry, self.mirror), path, entry.get("sha256"))
+            except (OSError, ChecksumError) as e:
+                if attempt == self.retries - 1:
+                    raise
+                print(f"Download of {entry['uid']} failed ({e}), retrying")
+                time.sleep(2**attempt)
+
+    def _close_when_done(self):
+        for thread in self._threads:
+            thread.join()
+        self._ready.put(None)
+
+    def __iter__(self):
+        while True:
+            render_path = self._ready.get()
+            if render_path is None:
+                return
+            yield render_path
+
+    def done(self, render_path):
+        """
+        The asset is rendered, it can be evicted from the disk.
+        """
+        with self._stats_lock:
+            path = self._downloaded.pop(render_path, render_path)
+        self.budget.done(path)
@@ -0,0 +1,68 @@
+import bpy
+import math
+import numpy as np
+from tools.find import find_all_meshes
+from tools.transform import invalidate_vertices
+
+
+def triangle_budget(res_x, res_y, fov, distance, size=1.0, triangles_per_pixel=1.0, min_triangles=2000):
+    """
+    Number of triangles worth keeping for an object of the given size seen
+    from the given (closest) distance: beyond about one triangle per covered
+    pixel, the extra triangles are smaller than a pixel.
+
+    Args:
+        fov (float): horizontal field of view of the camera, in radians.
+        distance (float): closest distance between the camera and the object.
+        size (float, optional): size of the object, e.g. 1 after `normalize_obj`.
+
+    Returns:
+        int: the triangle budget of the object.
+    """
+    pixels_across = size / (2 * distance * math.tan(fov / 2)) * max(res_x, res_y)
+    covered = min(pixels_across**2, res_x * res_y)
+    # about half of the triangles face the camera
+    return max(min_triangles, int(2 * covered * triangles_per_pixel))
+
+
+def triangle_count(obj: bpy.types.Object):
+    """
+    Number of triangles of all the meshes of the object.
+    """
+    count = 0
+    for mesh in find_all_meshes(obj):
+        loop_totals = np.empty(len(mesh.data.polygons), dtype=np.int32)
+        mesh.data.polygons.foreach_get("loop_total", loop_totals)
+        count += int((loop_totals - 2).sum())
+    return count
+
+
+def decimate(obj: bpy.types.Object, budget):
+    """
+    Decimate the meshes of the object in place (collapse decimation with the
+    same ratio for every mesh) so that it has at most `budget` triangles.
+    Meshes shared with other objects are replaced for this object only.
+
+    Returns:
+        Tuple[int, int]: the number of triangles before and after.
+    """
+    before = triangle_count(obj)
+    if before <= budget:
+        return before, before
+    ratio = budget / before
+    depsgraph = bpy.context.evaluated_depsgraph_get()
+    for part in find_all_meshes(obj):
+        modifier = part.modifiers.new("LOD", "DECIMATE")
+        modifier.decimate_type = "COLLAPSE"
+        modifier.ratio = ratio
+        modifier.use_collapse_triangulate = True
+        depsgraph.update()
+        mesh = bpy.data.meshes.new_from_object(part.evaluated_get(depsgraph))
+        part.modifiers.remove(modifier)
+        old = part.data
+        part.data = mesh
+        mesh.name = old.name
+        if old.users == 0:
+            bpy.data.meshes.remove(old)
+        invalidate_vertices(mesh)
+    return before, triangle_count(obj)
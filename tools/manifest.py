@@ -0,0 +1,93 @@
+import json
+import os
+import threading
+import time
+
+
+class JobManifest:
+    """
+    Durable record of the finished render units. A unit is one view of one
+    scene of an (asset, background) pair. Units are appended to a JSONL file
+    as soon as they are rendered, so after a crash at most the views being
+    rendered at that moment are lost.
+
+    >>> manifest = JobManifest("renders/manifest.jsonl")
+    >>> manifest.record("chair", "studio.exr", scene=0, view=3, path="...")
+    >>> manifest.pending("chair", "studio.exr", num_scenes=1, num_views=10)
+    [(0, 0), (0, 1), (0, 2), (0, 4), ...]
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.done = set()
+        self._lock = threading.Lock()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.load()
+        self._file = open(path, "a")
+
+    @staticmethod
+    def unit(asset, background, scene, view):
+        return (asset, background, int(scene), int(view))
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return
+        end = 0
+        with open(self.path, "rb") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # Last line of a run killed while writing it
+                    continue
+                end = f.tell()
+                self.done.add(self.unit(record["asset"], record["background"], record["scene"], record["view"]))
+        # Drop the partial last line, or terminate a complete one, so that the
+        # next record starts on a line of its own
+        with open(self.path, "rb+") as f:
+            f.truncate(end)
+            if end:
+                f.seek(end - 1)
+                if f.read(1) != b"\n":
+                    f.write(b"\n")
+
+    def record(self, asset, background, scene, view, **meta):
+        """
+        Mark a unit as finished. Thread safe.
+        """
+        record = dict(asset=asset, background=background, scene=scene, view=view, time=time.time(), **meta)
+        with self._lock:
+            self._file.write(json.dumps(record) + "\n")
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self.done.add(self.unit(asset, background, scene, view))
+
+    def is_done(self, asset, background, scene, view):
+        return self.unit(asset, background, scene, view) in self.done
+
+    def completed(self, asset, background, num_scenes, num_views):
+        """
+        List the finished (scene, view) units of an (asset, background) pair.
+        """
+        return [
+            (scene, view)
+            for scene in range(num_scenes)
+            for view in range(num_views)
+            if self.is_done(asset, background, scene, view)
+        ]
+
+    def pending(self, asset, background, num_scenes, num_views):
+        """
+        List the (scene, view) units of an (asset, background) pair that still
+        have to be rendered.
+        """
+        return [
+            (scene, view)
+            for scene in range(num_scenes)
+            for view in range(num_views)
+            if not self.is_done(asset, background, scene, view)
+        ]
+
+    def close(self):
+        self._file.close()
@@ -0,0 +1,151 @@
+import os
+import numpy as np
+
+# Blender camera axes (-Z forward, Y up) to OpenCV camera axes (Z forward, -Y up)
+R_BCAM2CV = np.diag([1.0, -1.0, -1.0])
+
+
+def world_to_cv(camera_matrices):
+    """
+    Batched version of `tools.camera.get_3x4_RT_matrix_from_blender`.
+
+    Args:
+        camera_matrices (np.ndarray): (N, 4, 4) world matrices of the camera (without scale).
+
+    Returns:
+        np.ndarray: (N, 3, 4) world to OpenCV camera RT matrices.
+    """
+    rotation = camera_matrices[:, :3, :3]
+    location = camera_matrices[:, :3, 3]
+    R = R_BCAM2CV @ rotation.transpose(0, 2, 1)
+    T = -R @ location[..., None]
+    return np.concatenate([R, T], -1).astype(np.float32)
+
+
+def project_boxes(K, RT, boxes3d, width, height):
+    """
+    Project the corners of the 3D boxes of all objects in all views at once.
+
+    Args:
+        K (np.ndarray): (3, 3) intrinsic matrix.
+        RT (np.ndarray): (V, 3, 4) extrinsic matrices.
+        boxes3d (np.ndarray): (V, O, 8, 3) world coordinates of the box corners in each view.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray, np.ndarray]:
+            (V, O, 8, 2) projected corners,
+            (V, O, 4) 2D boxes (x_min, y_min, x_max, y_max) clipped to the image,
+            (V, O) whether the whole box is in front of the camera and overlaps the image.
+    """
+    num_views, num_objects = boxes3d.shape[:2]
+    corners = boxes3d.reshape(num_views, -1, 3)
+    corners = np.concatenate([corners, np.ones(corners.shape[:2] + (1,))], -1)
+    points = K @ RT @ corners.transpose(0, 2, 1)  # (V, 3, O * 8)
+    depth = points[:, 2]
+    corners2d = points[:, :2] / np.where(np.abs(depth) < 1e-6, 1e-6, depth)[:, None]
+    corners2d = corners2d.transpose(0, 2, 1).reshape(num_views, num_objects, 8, 2)
+    in_front = (depth.reshape(num_views, num_objects, 8) > 0).all(-1)
+
+    box2d = np.concatenate([corners2d.min(2), corners2d.max(2)], -1)
+    box2d = np.clip(box2d, 0, [width, height, width, height])
+    visible = in_front & (box2d[..., 2] > box2d[..., 0]) & (box2d[..., 3] > box2d[..., 1])
+    return corners2d.astype(np.float32), box2d.astype(np.float32), visible
+
+
+class JobMetadata:
+    """
+    Camera and annotation metadata of all the views of a job, written as one
+    columnar NPZ file at the end of the job. Row i of each array is view i:
+
+    - background, scene, view, frame: identify the render of the view
+    - RT (N, 3, 4): world to OpenCV camera matrix, K (3, 3) is shared
+    - box3d (N, O, 8, 3): world coordinates of the box corners of each object
+    - corners2d (N, O, 8, 2), box2d (N, O, 4) and visible (N, O): the projected boxes
+    - hidden (N, O): the objects not rendered in the scene (e.g. not placed by a scatter),
+      they are never visible
+
+    The object o has the pass_index o + 1 in the segmentation masks.
+
+    >>> metadata = JobMetadata(K, ["chair"], 128, 128)
+    >>> metadata.add_scene("studio.exr", 0, camera_matrices, boxes3d)
+    >>> metadata.write("renders/chair/meta_chair.npz")
+    """
+
+    def __init__(self, K, object_names, width, height):
+        self.K = np.asarray(K, dtype=np.float32)
+        self.object_names = list(object_names)
+        self.width = width
+        self.height = height
+        self.scenes = []
+
+    def add_scene(self, background, scene, camera_matrices, boxes3d, first_frame=None, hidden=None):
+        """
+        Args:
+            background (str): name of the background.
+            scene (int): index of the scene.
+            camera_matrices (np.ndarray): (V, 4, 4) world matrix of the camera in each view.
+            boxes3d (np.ndarray): (O, 8, 3) world coordinates of the box corners of each object.
+            first_frame (int, optional): frame of the first view, defaults to scene * V.
+            hidden (Sequence[bool], optional): (O,) objects not rendered in this scene.
+        """
+        camera_matrices = np.asarray(camera_matrices, dtype=np.float64)
+        boxes3d = np.asarray(boxes3d, dtype=np.float64)
+        num_views = len(camera_matrices)
+        if first_frame is None:
+            first_frame = scene * num_views
+        if hidden is None:
+            hidden = np.zeros(len(boxes3d), dtype=bool)
+        self.scenes.append(dict(
+            background=np.full(num_views, background),
+            scene=np.full(num_views, scene, dtype=np.int32),
+            view=np.arange(num_views, dtype=np.int32),
+            frame=np.arange(first_frame, first_frame + num_views, dtype=np.int32),
+            RT=world_to_cv(camera_matrices),
+            box3d=np.broadcast_to(boxes3d, (num_views,) + boxes3d.shape).astype(np.float32),
+            hidden=np.broadcast_to(np.asarray(hidden, dtype=bool), (num_views, len(boxes3d))).copy(),
+        ))
+
+    def columns(self):
+        """
+        Returns:
+            Dict[str, np.ndarray]: the columns of all the views.
+        """
+        columns = {key: np.concatenate([scene[key] for scene in self.scenes]) for key in self.scenes[0]}
+        corners2d, box2d, visible = project_boxes(self.K, columns["RT"], columns["box3d"], self.width, self.height)
+        columns.update(corners2d=corners2d, box2d=box2d, visible=visible & ~columns["hidden"])
+        return columns
+
+    def write(self, path):
+        """
+        Write all the views to path in one np.savez call. The views of the
+        other backgrounds already in the file (e.g. rendered before a resumed
+        job that only lists the pending backgrounds) are kept.
+        """
+        if not self.scenes:
+            return None
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        columns = self.columns()
+        if os.path.exists(path):
+            columns = self.merge(path, columns)
+        # write then rename, a crash never leaves a truncated file behind
+        np.savez(
+            f"{path}.tmp.npz",
+            K=self.K,
+            object_names=np.array(self.object_names),
+            resolution=np.array([self.width, self.height], dtype=np.int32),
+            **columns,
+        )
+        os.replace(f"{path}.tmp.npz", path)
+        return path
+
+    def merge(self, path, columns):
+        """
+        Add the views of the backgrounds of an existing file that are not in columns.
+        """
+        with np.load(path) as old:
+            if list(old["object_names"]) != self.object_names or set(columns) - set(old.files):
+                print(f"Replacing {path}, its objects or columns differ")
+                return columns
+            keep = ~np.isin(old["background"], columns["background"])
+            return {key: np.concatenate([old[key][keep], value]) for key, value in columns.items()}
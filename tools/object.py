@@ -2,6 +2,7 @@ import bpy
 import numpy as np
 from mathutils import Matrix
 from mesh import get_meshes
+from tools.find import find_all_objects
 from tools.transform import transform, center_vert_bbox, get_vertices
 
 
@@ -49,6 +50,32 @@ def join_objects(objs):
     obj = bpy.context.object
     return obj
 
+
+def instance_object(obj, name):
+    """
+    Linked duplicate of an object and its children: the copies share the
+    mesh data and materials of the original (so Cycles builds its BVH once)
+    and have their own transform, pass_index and visibility.
+
+    Args:
+        obj (bpy.types.Object): root object to instance.
+        name (str): name of the new root object.
+
+    Returns:
+        bpy.types.Object: the new root object.
+    """
+    copies = {}
+    for part in find_all_objects(obj):
+        copy = part.copy()
+        bpy.context.collection.objects.link(copy)
+        copies[part.name] = copy
+    for part in find_all_objects(obj):
+        if part.parent is not None and part.parent.name in copies:
+            copies[part.name].parent = copies[part.parent.name]
+    root = copies[obj.name]
+    root.name = name
+    return root
+
 import bpy
 from bpy.app.handlers import persistent
 
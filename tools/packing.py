@@ -0,0 +1,136 @@
+import json
+import numpy as np
+
+PACKED_VERSION = 1
+
+
+def linear_to_srgb(rgb):
+    """
+    Encode linear scene-referred values in [0, 1] with the sRGB transfer function.
+    """
+    rgb = np.clip(rgb, 0.0, 1.0)
+    return np.where(rgb <= 0.0031308, rgb * 12.92, 1.055 * np.power(rgb, 1 / 2.4) - 0.055)
+
+
+def srgb_to_linear(rgb):
+    return np.where(rgb <= 0.04045, rgb / 12.92, np.power((rgb + 0.055) / 1.055, 2.4))
+
+
+def oct_encode(normal, bits=8):
+    """
+    Octahedral encoding of unit vectors into two unsigned integers per pixel.
+
+    Args:
+        normal (np.ndarray): (..., 3) unit vectors.
+        bits (int, optional): 8 or 16 bits per component.
+
+    Returns:
+        np.ndarray: (..., 2) uint8 or uint16 array.
+    """
+    normal = normal / np.maximum(np.abs(normal).sum(-1, keepdims=True), 1e-12)
+    x, y, z = normal[..., 0], normal[..., 1], normal[..., 2]
+    sign_x = np.where(x >= 0, 1.0, -1.0)
+    sign_y = np.where(y >= 0, 1.0, -1.0)
+    # fold the lower hemisphere over the diagonals
+    u = np.where(z >= 0, x, (1 - np.abs(y)) * sign_x)
+    v = np.where(z >= 0, y, (1 - np.abs(x)) * sign_y)
+    scale = 2**bits - 1
+    encoded = np.round((np.stack([u, v], -1) * 0.5 + 0.5) * scale)
+    return encoded.astype(np.uint8 if bits == 8 else np.uint16)
+
+
+def oct_decode(encoded, bits=8):
+    """
+    Inverse of `oct_encode`.
+
+    Returns:
+        np.ndarray: (..., 3) float32 unit vectors.
+    """
+    uv = encoded.astype(np.float32) / (2**bits - 1) * 2 - 1
+    u, v = uv[..., 0], uv[..., 1]
+    z = 1 - np.abs(u) - np.abs(v)
+    t = np.maximum(-z, 0)
+    x = u - np.where(u >= 0, t, -t)
+    y = v - np.where(v >= 0, t, -t)
+    normal = np.stack([x, y, z], -1)
+    return normal / np.maximum(np.linalg.norm(normal, axis=-1, keepdims=True), 1e-12)
+
+
+def pack_frame(passes, meta=None, depth_scale=1e-3, normal_bits=8):
+    """
+    Pack the float passes of a captured frame (see `tools.capture.collect_passes`)
+    into compact integer arrays:
+
+    - rgb: (H, W, 3) uint8, sRGB encoded, and alpha (H, W) uint8 if not opaque.
+      This is the "Standard" view transform, which `tools.capture.FrameCapture.enable`
+      sets for the scene; a "Filmic" PNG render would not match it
+    - depth: (H, W) uint16, metric depth / depth_scale, 0 where nothing was hit
+      or the depth does not fit
+    - index: (H, W) uint8, or uint16 if there are more than 255 objects
+    - normal: (H, W, 2) octahedral encoded normal
+
+    Args:
+        depth_scale (float, optional): meters per depth unit, the same for all frames
+            so that depth stays metric. The default of 1 mm covers 65 m.
+
+    Returns:
+        dict: the arrays and the "header", a JSON string with the format version,
+            the scales and encodings and the metadata of the frame.
+    """
+    packed = {}
+    header = dict(version=PACKED_VERSION, meta=meta or {})
+    if "rgb" in passes:
+        rgb = passes["rgb"]
+        packed["rgb"] = np.round(linear_to_srgb(rgb[..., :3]) * 255).astype(np.uint8)
+        if rgb.shape[-1] == 4 and np.any(rgb[..., 3] < 1):
+            packed["alpha"] = np.round(np.clip(rgb[..., 3], 0, 1) * 255).astype(np.uint8)
+        header["height"], header["width"] = rgb.shape[:2]
+        header["rgb"] = "srgb"
+    if "depth" in passes:
+        depth = np.round(passes["depth"] / depth_scale)
+        packed["depth"] = np.where((depth > 0) & (depth < 2**16), depth, 0).astype(np.uint16)
+        header["depth_scale"] = depth_scale
+    if "index" in passes:
+        index = np.round(passes["index"])
+        packed["index"] = index.astype(np.uint8 if index.max(initial=0) < 2**8 else np.uint16)
+    if "normal" in passes:
+        packed["normal"] = oct_encode(passes["normal"], normal_bits)
+        header["normal_bits"] = normal_bits
+    packed["header"] = np.frombuffer(json.dumps(header).encode(), dtype=np.uint8)
+    return packed
+
+
+def unpack_frame(packed):
+    """
+    Decode the arrays of `pack_frame`.
+
+    Returns:
+        dict: "meta", "rgb" (H, W, 3) uint8 sRGB, "alpha" if any, "depth" (H, W) float32
+            meters (inf where nothing was hit), "index" (H, W) and "normal" (H, W, 3) float32.
+    """
+    header = json.loads(bytes(packed["header"]).decode())
+    if header["version"] > PACKED_VERSION:
+        raise ValueError(f"Unsupported packed frame version {header['version']}")
+    frame = dict(meta=header["meta"])
+    for key in ("rgb", "alpha", "index"):
+        if key in packed:
+            frame[key] = packed[key]
+    if "depth" in packed:
+        depth = packed["depth"].astype(np.float32) * header["depth_scale"]
+        frame["depth"] = np.where(packed["depth"] > 0, depth, np.inf)
+    if "normal" in packed:
+        frame["normal"] = oct_decode(packed["normal"], header["normal_bits"])
+    return frame
+
+
+def load_packed(path):
+    """
+    Load a frame written by `tools.sinks.PackedSink`, path can also be a file
+    object (e.g. a sample of `tools.shards.ShardReader`). Only needs NumPy, so
+    it can be used by the training data loaders.
+
+    >>> frame = load_packed("renders/chair/frames_chair/studio.exr_00003.npz")
+    >>> mask = frame["index"] > 0
+    """
+    with np.load(path) as f:
+        return unpack_frame(dict(f))
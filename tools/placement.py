@@ -0,0 +1,104 @@
+import math
+from collections import defaultdict
+
+import numpy as np
+
+
+class GridIndex:
+    """
+    Uniform grid over the floor plane. With cells at least as large as the
+    largest collision distance, the objects that can collide with a point
+    are all in its 3x3 neighbouring cells, so a query costs O(1) instead of
+    O(n) pairwise checks.
+    """
+
+    def __init__(self, cell_size):
+        self.cell_size = cell_size
+        self.cells = defaultdict(list)
+
+    def _cell(self, position):
+        return int(math.floor(position[0] / self.cell_size)), int(math.floor(position[1] / self.cell_size))
+
+    def insert(self, idx, position):
+        self.cells[self._cell(position)].append(idx)
+
+    def neighbors(self, position):
+        x, y = self._cell(position)
+        for dx in (-1, 0, 1):
+            for dy in (-1, 0, 1):
+                yield from self.cells.get((x + dx, y + dy), ())
+
+
+class PairwiseIndex:
+    """
+    Reference index that checks every placed object, O(n) per query.
+    """
+
+    def __init__(self, cell_size=None):
+        self.placed = []
+
+    def insert(self, idx, position):
+        self.placed.append(idx)
+
+    def neighbors(self, position):
+        return self.placed
+
+
+def scatter_extent(radii, density=0.3):
+    """
+    Half size of a square floor area where the footprints cover `density` of the area.
+    """
+    return math.sqrt(np.sum(np.pi * np.asarray(radii) ** 2) / density) / 2
+
+
+def scatter(radii, half_extent=None, margin=0.0, max_attempts=100, rng=np.random, index=GridIndex):
+    """
+    Scatter circular footprints on the square [-half_extent, half_extent]^2
+    without overlaps, by rejection sampling. The largest footprints are
+    placed first. Each object draws its max_attempts candidates at once, so
+    the random numbers used do not depend on the collisions.
+
+    Args:
+        radii (np.ndarray): (N,) radius of the footprint of each object.
+        half_extent (float, optional): half size of the floor area. Defaults to
+            `scatter_extent(radii)`.
+        margin (float, optional): minimum gap between two footprints.
+        index (type, optional): spatial index, GridIndex or PairwiseIndex.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: (N, 2) center of each footprint (nan if the
+            object could not be placed) and (N,) whether it was placed.
+    """
+    radii = np.asarray(radii, dtype=np.float64)
+    if half_extent is None:
+        half_extent = scatter_extent(radii)
+    positions = np.full((len(radii), 2), np.nan)
+    placed = np.zeros(len(radii), dtype=bool)
+    grid = index(2 * radii.max(initial=0) + margin)
+    for idx in np.argsort(-radii, kind="stable"):
+        bound = max(half_extent - radii[idx], 0)
+        candidates = rng.uniform(-bound, bound, size=(max_attempts, 2))
+        for candidate in candidates:
+            if all(
+                (candidate[0] - positions[other, 0]) ** 2 + (candidate[1] - positions[other, 1]) ** 2
+                >= (radii[idx] + radii[other] + margin) ** 2
+                for other in grid.neighbors(candidate)
+            ):
+                positions[idx] = candidate
+                placed[idx] = True
+                grid.insert(idx, candidate)
+                break
+    return positions, placed
+
+
+def footprint(points):
+    """
+    Circular footprint on the floor of a set of world points (e.g. the
+    convex hull of an object): center of its xy bounding box and radius.
+
+    Returns:
+        Tuple[np.ndarray, float]: (2,) center and radius.
+    """
+    xy = np.asarray(points)[:, :2]
+    center = (xy.min(0) + xy.max(0)) / 2
+    return center, float(np.linalg.norm(xy - center, axis=-1).max())
@@ -0,0 +1,135 @@
+import numpy as np
+
+POSE_STRATEGIES = ("uniform", "stratified", "fibonacci", "sobol")
+
+# direction numbers of the first Sobol dimensions (Joe and Kuo), as (degree, a, m)
+SOBOL_DIRECTIONS = [(1, 0, [1]), (2, 1, [1, 3]), (3, 1, [1, 3, 1])]
+SOBOL_BITS = 30
+GOLDEN_RATIO = (1 + 5**0.5) / 2
+
+
+def sobol(n, dims=3, skip=1):
+    """
+    First n points of the Sobol sequence in [0, 1)^dims (dims <= 4), the point 0 is skipped.
+
+    Returns:
+        np.ndarray: (n, dims) points.
+    """
+    index = np.arange(skip, skip + n, dtype=np.int64)
+    gray = index ^ (index >> 1)
+    points = np.zeros((n, dims), dtype=np.int64)
+    for dim in range(dims):
+        if dim == 0:
+            v = [1 << (SOBOL_BITS - 1 - k) for k in range(SOBOL_BITS)]
+        else:
+            degree, a, m = SOBOL_DIRECTIONS[dim - 1]
+            v = [m[k] << (SOBOL_BITS - 1 - k) for k in range(degree)]
+            for k in range(degree, SOBOL_BITS):
+                value = v[k - degree] ^ (v[k - degree] >> degree)
+                for j in range(1, degree):
+                    value ^= ((a >> (degree - 1 - j)) & 1) * v[k - j]
+                v.append(value)
+        for k in range(SOBOL_BITS):
+            points[:, dim] ^= ((gray >> k) & 1) * v[k]
+    return points / 2.0**SOBOL_BITS
+
+
+def unit_samples(n, strategy="stratified", rng=np.random):
+    """
+    n samples of [0, 1)^3 spread with the given strategy ("stratified",
+    "fibonacci" or "sobol"). The first two coordinates are the direction,
+    the third the radius.
+    """
+    if strategy == "stratified":
+        # Latin hypercube: each coordinate has exactly one sample in each of n strata
+        strata = np.stack([rng.permutation(n) for _ in range(3)], -1)
+        return (strata + rng.uniform(size=(n, 3))) / n
+    if strategy == "fibonacci":
+        i = np.arange(n)
+        return np.stack(
+            [(i / GOLDEN_RATIO + rng.uniform()) % 1, (i + 0.5) / n, rng.uniform(size=n)], -1
+        )
+    if strategy == "sobol":
+        # random shift modulo 1 (Cranley-Patterson) so that scenes do not share their views
+        return (sobol(n) + rng.uniform(size=3)) % 1
+    raise ValueError(f"Unknown pose strategy {strategy}")
+
+
+def look_at_rotations(positions, target):
+    """
+    Vectorized `tools.transform.look_at`: rotation of a camera at each
+    position looking at target, -Z towards the target and Y up (the roll
+    of Vector.to_track_quat("-Z", "Y")).
+
+    Returns:
+        np.ndarray: (N, 3, 3) camera to world rotation matrices.
+    """
+    forward = np.asarray(target, dtype=np.float64) - positions
+    forward /= np.linalg.norm(forward, axis=-1, keepdims=True)
+    right = np.cross(forward, [0.0, 0.0, 1.0])
+    # looking straight up or down: any horizontal right axis
+    vertical = np.linalg.norm(right, axis=-1) < 1e-8
+    right[vertical] = [1.0, 0.0, 0.0]
+    right /= np.linalg.norm(right, axis=-1, keepdims=True)
+    up = np.cross(right, forward)
+    return np.stack([right, up, -forward], -1)
+
+
+def sample_poses(n, target, center=(0, 0, 0), radius=(2, 2), theta=(-1, 1), phi=(0, 1), strategy="uniform", rng=np.random):
+    """
+    Sample n camera poses on a spherical band around center, all looking at target.
+
+    Args:
+        radius (Tuple[float, float]): distance to center.
+        theta (Tuple[float, float]): azimuth limits, in units of pi.
+        phi (Tuple[float, float]): elevation limits, in units of pi.
+        strategy (str, optional):
+            "uniform": independent samples, the same as n calls to `random_loc` with the same
+                random state;
+            "stratified", "fibonacci", "sobol": samples spread uniformly over the area of the
+                band, which cover it with fewer views.
+        rng (optional): the random state, np.random or a np.random.RandomState.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: (N, 3) positions and (N, 3, 3) camera to world rotations.
+    """
+    if strategy == "uniform":
+        samples = rng.uniform(
+            low=[radius[0], theta[0], phi[0]], high=[radius[1], theta[1], phi[1]], size=(n, 3)
+        )
+        distance, azimuth, elevation = samples[:, 0], samples[:, 1] * np.pi, samples[:, 2] * np.pi
+    else:
+        u = unit_samples(n, strategy, rng)
+        azimuth = (theta[0] + u[:, 0] * (theta[1] - theta[0])) * np.pi
+        # uniform in sin(elevation) is uniform in area
+        low, high = np.sin(np.clip(np.array(phi) * np.pi, -np.pi / 2, np.pi / 2))
+        elevation = np.arcsin(low + u[:, 1] * (high - low))
+        distance = radius[0] + u[:, 2] * (radius[1] - radius[0])
+
+    directions = np.stack(
+        [np.cos(elevation) * np.cos(azimuth), np.cos(elevation) * np.sin(azimuth), np.sin(elevation)], -1
+    )
+    positions = np.asarray(center, dtype=np.float64) + directions * distance[:, None]
+    return positions, look_at_rotations(positions, target)
+
+
+def pose_matrices(positions, rotations):
+    """
+    Returns:
+        np.ndarray: (N, 4, 4) world matrices of the poses.
+    """
+    matrices = np.zeros((len(positions), 4, 4))
+    matrices[:, :3, :3] = rotations
+    matrices[:, :3, 3] = positions
+    matrices[:, 3, 3] = 1
+    return matrices
+
+
+def coverage(directions, band_directions):
+    """
+    Largest angle (in degrees) between a direction of the band and its
+    closest view: the smaller, the better the views cover the band.
+    """
+    directions = directions / np.linalg.norm(directions, axis=-1, keepdims=True)
+    cosine = (band_directions @ directions.T).max(-1)
+    return float(np.degrees(np.arccos(np.clip(cosine, -1, 1))).max())
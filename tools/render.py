@@ -5,19 +5,35 @@ import math
 #### render functions
 
 def config_cycle_gpu(verbose=False):
+    """
+    Render with the NVIDIA CUDA devices if there are any, otherwise fall back
+    to the CPU.
+
+    Returns:
+        List[str]: names of the enabled GPU devices, empty when rendering on CPU.
+    """
     devices = []
     bpy.data.scenes[0].render.engine = "CYCLES"
-    bpy.context.preferences.addons["cycles"].preferences.compute_device_type = "CUDA"
-    bpy.context.scene.cycles.device = "GPU"
-    bpy.context.preferences.addons["cycles"].preferences.get_devices()
+    preferences = bpy.context.preferences.addons["cycles"].preferences
+    try:
+        preferences.compute_device_type = "CUDA"
+    except TypeError:  # Blender built without CUDA
+        pass
+    else:
+        preferences.get_devices()
+        for d in preferences.devices:
+            if d.type == "CUDA" and d["name"][0] == "N":  # enable NVIDIA devices
+                d["use"] = 1
+                devices.append(d["name"])
+
+    if devices:
+        bpy.context.scene.cycles.device = "GPU"
+    else:
+        preferences.compute_device_type = "NONE"
+        bpy.context.scene.cycles.device = "CPU"
 
     if verbose:
-        print(bpy.context.preferences.addons["cycles"].preferences.compute_device_type)
-
-    for d in bpy.context.preferences.addons["cycles"].preferences.devices:
-        if d["name"][0] == "N":  # enable NVIDIA devices
-            d["use"] = 1
-            devices.append(d["name"])
+        print(preferences.compute_device_type, devices or "CPU")
 
     return devices
 
@@ -30,11 +46,49 @@ def config_cycles(pre_sample=1024, sample=4096):
     bpy.data.scenes["Scene"].cycles.samples = sample
 
 
+# Named Cycles quality presets, see `config_quality`. time_limit is in seconds
+# per frame (0 for no limit), adaptive_threshold is the noise level at which
+# a pixel stops sampling (0 disables adaptive sampling).
+QUALITY_PROFILES = {
+    "draft": dict(samples=16, adaptive_threshold=0.1, max_bounces=4, denoiser="OPENIMAGEDENOISE", time_limit=0.5),
+    "train": dict(samples=64, adaptive_threshold=0.05, max_bounces=6, denoiser="OPENIMAGEDENOISE", time_limit=2),
+    "eval": dict(samples=512, adaptive_threshold=0.01, max_bounces=12, denoiser="OPENIMAGEDENOISE", time_limit=0),
+}
+
+
+def config_quality(profile="train"):
+    """
+    Config cycles samples, adaptive sampling, bounces, denoiser and time limit
+    from a quality profile.
+
+    Args:
+        profile (str or dict): name of a profile of QUALITY_PROFILES, or a dict with the same keys.
+            The denoiser can be None to disable denoising.
+    """
+    if isinstance(profile, str):
+        profile = QUALITY_PROFILES[profile]
+    cycles = bpy.context.scene.cycles
+    cycles.samples = profile["samples"]
+    cycles.preview_samples = min(cycles.preview_samples, profile["samples"])
+    cycles.use_adaptive_sampling = profile["adaptive_threshold"] > 0
+    cycles.adaptive_threshold = profile["adaptive_threshold"]
+    cycles.max_bounces = profile["max_bounces"]
+    cycles.use_denoising = profile["denoiser"] is not None
+    if profile["denoiser"] is not None:
+        cycles.denoiser = profile["denoiser"]
+    cycles.time_limit = profile["time_limit"]
+
+
 def config_render(
-    path="tmp/output.png", engine="CYCLES", res_x=640, res_y=480, file_format="PNG", transparent=True, enable_gpu=True
+    path="tmp/output.png", engine="CYCLES", res_x=640, res_y=480, file_format="PNG", transparent=True, enable_gpu=True,
+    threads=None, quality=None, persistent_data=False,
 ):
     """
-    Config render engine for path, engine, res_x, res_y, file_format, transparent
+    Config render engine for path, engine, res_x, res_y, file_format, transparent.
+    If threads is given, render with that fixed number of threads instead of one per core.
+    If quality is given, Cycles is configured with this profile (see `config_quality`)
+    instead of 4096 denoised samples.
+    If persistent_data is True, Cycles keeps the scene data (BVH, textures) between renders.
     """
 
     bpy.context.preferences.edit.undo_steps = 0  # disable undo
@@ -45,16 +99,174 @@ def config_render(
     render.film_transparent = transparent
     render.resolution_x = res_x
     render.resolution_y = res_y
+    render.use_persistent_data = persistent_data
+    if threads is not None:
+        render.threads_mode = "FIXED"
+        render.threads = threads
     if engine.startswith("C"):
         render.engine = "CYCLES"
-        config_cycles()
-        bpy.data.scenes["Scene"].cycles.use_denoising = True
+        if quality is None:
+            config_cycles()
+            bpy.data.scenes["Scene"].cycles.use_denoising = True
+        else:
+            config_quality(quality)
         if enable_gpu:
             config_cycle_gpu()
     else:
         render.engine = "BLENDER_EEVEE"
 
-def enable_depth_render(base_path="output", reverse=False):
+def get_render_layers_node(view_layer="ViewLayer"):
+    """
+    Get the Render Layers compositor node of the given view layer, create it if needed.
+    """
+    bpy.context.scene.use_nodes = True
+    nodes = bpy.context.scene.node_tree.nodes
+    for node in nodes:
+        if node.type == "R_LAYERS" and node.layer == view_layer:
+            return node
+    render_node = nodes.new("CompositorNodeRLayers")
+    render_node.layer = view_layer
+    return render_node
+
+
+def label_override_material(name="LabelOverride"):
+    """
+    Black diffuse material for the label view layer: Cycles drops the zero
+    weight closure, so the paths end at the first hit without bounces or
+    light samples, and only the passes of that hit are computed.
+    """
+    material = bpy.data.materials.get(name)
+    if material is None:
+        material = bpy.data.materials.new(name)
+        # kept by the orphan purge between jobs
+        material.use_fake_user = True
+        material.use_nodes = True
+        nodes = material.node_tree.nodes
+        nodes.clear()
+        diffuse = nodes.new("ShaderNodeBsdfDiffuse")
+        diffuse.inputs["Color"].default_value = (0, 0, 0, 1)
+        output = nodes.new("ShaderNodeOutputMaterial")
+        material.node_tree.links.new(diffuse.outputs[0], output.inputs["Surface"])
+    return material
+
+
+def material_has_alpha(material):
+    """
+    Whether the material can be seen through: alpha clip or blend, a
+    Principled BSDF alpha below 1 or from a texture, or a Transparent BSDF.
+    """
+    if material.blend_method != "OPAQUE":
+        return True
+    if not material.use_nodes or material.node_tree is None:
+        return False
+    for node in material.node_tree.nodes:
+        if node.type == "BSDF_TRANSPARENT":
+            return True
+        if node.type == "BSDF_PRINCIPLED":
+            alpha = node.inputs["Alpha"]
+            if alpha.is_linked or alpha.default_value < 1:
+                return True
+    return False
+
+
+def update_label_override(name="Labels"):
+    """
+    Use `label_override_material` on the label view layer, unless a material
+    of the scene has alpha (e.g. cut-out foliage, fences or decals): the
+    opaque override would hide what the beauty layer sees through, so these
+    scenes render the label layer with their own materials. Call it after
+    the objects of a job are loaded.
+
+    Returns:
+        List[str]: the materials with alpha, empty if the override is used.
+    """
+    view_layer = bpy.context.scene.view_layers.get(name)
+    if view_layer is None:
+        return []
+    override = label_override_material()
+    transparent = [
+        material.name for material in bpy.data.materials
+        if material.users and material is not override and material_has_alpha(material)
+    ]
+    view_layer.material_override = None if transparent else override
+    return transparent
+
+
+def enable_label_view_layer(name="Labels", beauty_layer="ViewLayer"):
+    """
+    Add a view layer for the label passes (depth, normal, segmentation) that
+    is rendered with a single sample, no denoising and no bounces (the
+    objects use `label_override_material`), so that the beauty layer can use
+    an expensive quality profile while the labels cost about one primary ray
+    per pixel. Both layers share the camera and the geometry. Pass
+    `view_layer=name` to the enable_*_render functions to take their passes
+    from this layer.
+
+    The depth and object index passes only depend on the first hit, so they
+    are the same as when they come from the beauty layer. The normal pass
+    is the shading normal of the geometry: the normal maps of the materials
+    are not applied. Scenes with transparent materials keep their materials
+    in this layer (see `update_label_override`), so that the first hit is the
+    one of the beauty layer. `benchmark.py labels` compares the passes of
+    both layers, with and without a cut-out material.
+
+    Returns:
+        bpy.types.ViewLayer: the label view layer.
+    """
+    scene = bpy.context.scene
+    view_layer = scene.view_layers.get(name)
+    if view_layer is None:
+        view_layer = scene.view_layers.new(name)
+    view_layer.samples = 1
+    view_layer.cycles.use_denoising = False
+    view_layer.pass_alpha_threshold = 0
+    view_layer.material_override = label_override_material()
+    # the beauty pass only needs the combined image
+    beauty = scene.view_layers[beauty_layer]
+    beauty.use_pass_z = False
+    beauty.use_pass_normal = False
+    beauty.use_pass_object_index = False
+    return view_layer
+
+
+def ensure_node(name, node_type, **props):
+    """
+    Get the compositor node with the given name, create it if it does not
+    exist. The properties are set every time. Building the compositor graph
+    with named nodes makes it idempotent: calling the enable_*_render
+    functions again reuses the nodes instead of appending new ones.
+
+    Args:
+        name (str): unique name of the node.
+        node_type (str): e.g. "CompositorNodeMath".
+        props: properties of the node, e.g. operation="ADD".
+    """
+    bpy.context.scene.use_nodes = True
+    nodes = bpy.context.scene.node_tree.nodes
+    node = nodes.get(name)
+    if node is not None and node.bl_idname != node_type:
+        nodes.remove(node)
+        node = None
+    if node is None:
+        node = nodes.new(node_type)
+        node.name = name
+        node.label = name
+    for key, value in props.items():
+        setattr(node, key, value)
+    return node
+
+
+def ensure_link(output_socket, input_socket):
+    """
+    Link output_socket to input_socket unless they are already linked.
+    """
+    for link in input_socket.links:
+        if link.from_socket == output_socket:
+            return link
+    return bpy.context.scene.node_tree.links.new(output_socket, input_socket)
+
+
+def enable_depth_render(base_path="output", reverse=False, view_layer="ViewLayer"):
     """
     Enable depth render and output exr and png. The png is normalized to [0, 1]
     and saved in base_path. The exr is the raw depth value. The png is useful for
@@ -63,147 +275,185 @@ def enable_depth_render(base_path="output", reverse=False):
     Args:
         base_path (str, optional): base path to save the exr and png. Defaults to "output".
         reverse (bool, optional): whether to reverse the depth value. Defaults to False.
+        view_layer (str, optional): view layer rendering the depth pass. Defaults to "ViewLayer".
     """
     bpy.context.scene.render.film_transparent = False
     bpy.context.scene.use_nodes = True
-    bpy.data.scenes["Scene"].view_layers["ViewLayer"].use_pass_z = True
-    bpy.data.scenes["Scene"].view_layers["ViewLayer"].pass_alpha_threshold = 0
+    bpy.data.scenes["Scene"].view_layers[view_layer].use_pass_z = True
+    bpy.data.scenes["Scene"].view_layers[view_layer].pass_alpha_threshold = 0
 
-    nodes = bpy.context.scene.node_tree.nodes
-    links = bpy.context.scene.node_tree.links
-    if "Render Layers" not in nodes:
-        render_node = nodes.new("CompositorNodeRLayers")
-    else:
-        render_node = nodes["Render Layers"]
-    if "Composite" not in nodes:
-        output_node = nodes.new("CompositorNodeComposite")
-    else:
-        output_node = nodes["Composite"]
+    render_node = get_render_layers_node(view_layer)
+    output_node = ensure_node("Composite", "CompositorNodeComposite")
+    ensure_link(get_render_layers_node().outputs[0], output_node.inputs[0])
 
-    link1 = links.new(render_node.outputs[0], output_node.inputs[0])
-    exr_output_node = nodes.new("CompositorNodeOutputFile")
+    exr_output_node = ensure_node(f"{view_layer}/depth/exr", "CompositorNodeOutputFile", base_path=base_path)
     exr_output_node.format.file_format = "OPEN_EXR"
     # # read exr with:
     # # 1. OPENCV_IO_ENABLE_OPENEXR=1
     # # 2. cv2.imread(PATH_TO_EXR_FILE, cv2.IMREAD_ANYCOLOR | cv2.IMREAD_ANYDEPTH)
-    exr_output_node.base_path = base_path
-    link2 = links.new(render_node.outputs[2], exr_output_node.inputs[0])
+    ensure_link(render_node.outputs["Depth"], exr_output_node.inputs[0])
 
     # add normalized png depth
-    output_node2 = nodes.new("CompositorNodeNormalize")
-    png_output_node = nodes.new("CompositorNodeOutputFile")
+    normalize_node = ensure_node(f"{view_layer}/depth/normalize", "CompositorNodeNormalize")
+    png_output_node = ensure_node(f"{view_layer}/depth/png", "CompositorNodeOutputFile", base_path=base_path)
     png_output_node.format.file_format = "PNG"
-    png_output_node.base_path = base_path
-    link3 = links.new(render_node.outputs[2], output_node2.inputs[0])
+    ensure_link(render_node.outputs["Depth"], normalize_node.inputs[0])
     if reverse:
-        output_node3 = nodes.new("CompositorNodeMath")
         # x = 1 - x
-        output_node3.operation = "MULTIPLY"
-        output_node3.inputs[1].default_value = -1
-        link4 = links.new(output_node2.outputs[0], output_node3.inputs[0])
-        output_node4 = nodes.new("CompositorNodeMath")
-        output_node4.operation = "ADD"
-        output_node4.inputs[1].default_value = 1
-        link5 = links.new(output_node3.outputs[0], output_node4.inputs[0])
-        link6 = links.new(output_node4.outputs[0], png_output_node.inputs[0])
+        reverse_node = ensure_node(f"{view_layer}/depth/reverse", "CompositorNodeMath", operation="MULTIPLY_ADD")
+        reverse_node.inputs[1].default_value = -1
+        reverse_node.inputs[2].default_value = 1
+        ensure_link(normalize_node.outputs[0], reverse_node.inputs[0])
+        ensure_link(reverse_node.outputs[0], png_output_node.inputs[0])
     else:
-        link4 = links.new(output_node2.outputs[0], png_output_node.inputs[0])
+        ensure_link(normalize_node.outputs[0], png_output_node.inputs[0])
     return exr_output_node, png_output_node
 
-def enable_normal_render(base_path="output"):
+def enable_normal_render(base_path="output", view_layer="ViewLayer"):
     """
     Enable normal render and output png. The png is normalized to [0, 1].
     """
     bpy.context.scene.use_nodes = True
-    bpy.data.scenes["Scene"].view_layers["ViewLayer"].use_pass_normal = True
-    bpy.data.scenes["Scene"].view_layers["ViewLayer"].pass_alpha_threshold = 0
+    bpy.data.scenes["Scene"].view_layers[view_layer].use_pass_normal = True
+    bpy.data.scenes["Scene"].view_layers[view_layer].pass_alpha_threshold = 0
 
-    nodes = bpy.context.scene.node_tree.nodes
-    links = bpy.context.scene.node_tree.links
-    if "Render Layers" not in nodes:
-        render_node = nodes.new("CompositorNodeRLayers")
-    else:
-        render_node = nodes["Render Layers"]
+    render_node = get_render_layers_node(view_layer)
 
     # Seperate RGBA
-    output_node1 = nodes.new("CompositorNodeSepRGBA")
-    link1 = links.new(render_node.outputs[3], output_node1.inputs[0])
-    # map RGB from [-1, 1] to [0, 1] separately (MapRange)
-    output_nodeR = nodes.new("CompositorNodeMapRange")
-    output_nodeR.inputs[1].default_value = -1
-    output_nodeR.inputs[2].default_value = 1
-    output_nodeR.inputs[3].default_value = 0
-    output_nodeR.inputs[4].default_value = 1
-    output_nodeR.use_clamp = True
-    link2 = links.new(output_node1.outputs[0], output_nodeR.inputs[0])
-    output_nodeG = nodes.new("CompositorNodeMapRange")
-    output_nodeG.inputs[1].default_value = -1
-    output_nodeG.inputs[2].default_value = 1
-    output_nodeG.inputs[3].default_value = 0
-    output_nodeG.inputs[4].default_value = 1
-    output_nodeG.use_clamp = True
-    link3 = links.new(output_node1.outputs[1], output_nodeG.inputs[0])
-    output_nodeB = nodes.new("CompositorNodeMapRange")
-    output_nodeB.inputs[1].default_value = -1
-    output_nodeB.inputs[2].default_value = 1
-    output_nodeB.inputs[3].default_value = 0
-    output_nodeB.inputs[4].default_value = 1
-
-    link4 = links.new(output_node1.outputs[2], output_nodeB.inputs[0])
+    separate_node = ensure_node(f"{view_layer}/normal/separate", "CompositorNodeSepRGBA")
+    ensure_link(render_node.outputs["Normal"], separate_node.inputs[0])
     # combine RGB
-    output_node2 = nodes.new("CompositorNodeCombRGBA")
-    link5 = links.new(output_nodeR.outputs[0], output_node2.inputs[0])
-    link6 = links.new(output_nodeG.outputs[0], output_node2.inputs[1])
-    link7 = links.new(output_nodeB.outputs[0], output_node2.inputs[2])
+    combine_node = ensure_node(f"{view_layer}/normal/combine", "CompositorNodeCombRGBA")
+    # map RGB from [-1, 1] to [0, 1] separately (MapRange)
+    for i, channel in enumerate("RGB"):
+        map_node = ensure_node(f"{view_layer}/normal/map{channel}", "CompositorNodeMapRange", use_clamp=True)
+        map_node.inputs[1].default_value = -1
+        map_node.inputs[2].default_value = 1
+        map_node.inputs[3].default_value = 0
+        map_node.inputs[4].default_value = 1
+        ensure_link(separate_node.outputs[i], map_node.inputs[0])
+        ensure_link(map_node.outputs[0], combine_node.inputs[i])
     # output
-    png_output_node = nodes.new("CompositorNodeOutputFile")
+    png_output_node = ensure_node(f"{view_layer}/normal/png", "CompositorNodeOutputFile", base_path=base_path)
     png_output_node.format.file_format = "PNG"
-    png_output_node.base_path = base_path
-    link8 = links.new(output_node2.outputs[0], png_output_node.inputs[0])
+    ensure_link(combine_node.outputs[0], png_output_node.inputs[0])
     return png_output_node
 
 
-def enable_segmentation_render(base_path="output", max_value=None):
+def enable_segmentation_render(base_path="output", max_value=None, view_layer="ViewLayer"):
     """
     In the segmentation render, each object is assigned a unique color.
     Each objects has the attribute pass_index, which is used to assign the color.
+    The colors are the ones of `rainbow_link`, looked up from a palette (see
+    `palette_link`) instead of being computed per pixel.
 
     Args:
         base_path (str, optional): base path to save the png. Defaults to "output".
+        view_layer (str, optional): view layer rendering the object index pass. Defaults to "ViewLayer".
 
 
     Returns:
         png_output_node, exr_output_node
     """
     bpy.context.scene.use_nodes = True
-    bpy.data.scenes["Scene"].view_layers["ViewLayer"].use_pass_object_index = True
-    nodes = bpy.context.scene.node_tree.nodes
-    links = bpy.context.scene.node_tree.links
-    if "Render Layers" not in nodes:
-        render_node = nodes.new("CompositorNodeRLayers")
-    else:
-        render_node = nodes["Render Layers"]
+    bpy.data.scenes["Scene"].view_layers[view_layer].use_pass_object_index = True
+    render_node = get_render_layers_node(view_layer)
     if max_value is None:
         max_value = max(find_all_pass_index())
     print(f"max_value: {max_value}")
 
-    png_output_node = nodes.new("CompositorNodeOutputFile")
+    png_output_node = ensure_node(f"{view_layer}/seg/png", "CompositorNodeOutputFile", base_path=base_path)
     png_output_node.format.file_format = "PNG"
-    output_node1 = nodes.new("CompositorNodeSetAlpha")
-    rainbow_link(render_node.outputs["IndexOB"], output_node1.inputs[0], max_value=max_value)
-    output_node2 = nodes.new("CompositorNodeMath")
-    output_node2.operation = "CEIL"
-    link1 = links.new(render_node.outputs["IndexOB"], output_node2.inputs[0])
-    link2 = links.new(output_node2.outputs[0], output_node1.inputs[1])
-    link3 = links.new(output_node1.outputs[0], png_output_node.inputs[0])
-    png_output_node.base_path = base_path
-
-    exr_output_node = nodes.new("CompositorNodeOutputFile")
+    alpha_node = ensure_node(f"{view_layer}/seg/alpha", "CompositorNodeSetAlpha")
+    palette_link(render_node.outputs["IndexOB"], alpha_node.inputs[0], max_value=max_value, name=f"{view_layer}/seg")
+    ceil_node = ensure_node(f"{view_layer}/seg/ceil", "CompositorNodeMath", operation="CEIL")
+    ensure_link(render_node.outputs["IndexOB"], ceil_node.inputs[0])
+    ensure_link(ceil_node.outputs[0], alpha_node.inputs[1])
+    ensure_link(alpha_node.outputs[0], png_output_node.inputs[0])
+
+    exr_output_node = ensure_node(f"{view_layer}/seg/exr", "CompositorNodeOutputFile", base_path=base_path)
     exr_output_node.format.file_format = "OPEN_EXR"
-    exr_output_node.base_path = base_path
-    link3 = links.new(render_node.outputs["IndexOB"], exr_output_node.inputs[0])
+    ensure_link(render_node.outputs["IndexOB"], exr_output_node.inputs[0])
     return exr_output_node, png_output_node
 
+def rainbow_color(value, max_value):
+    """
+    The color of `rainbow_link` for the given input value.
+    """
+    i = value / max_value
+    return (
+        math.sin(2 * math.pi * i) * 0.5 + 0.5,
+        math.sin(2 * math.pi * i + 2) * 0.5 + 0.5,
+        math.sin(2 * math.pi * i + 4) * 0.5 + 0.5,
+        1.0,
+    )
+
+
+# A ColorRamp holds at most 32 colors, index 0 is the background
+MAX_PALETTE_SIZE = 31
+
+
+def palette_link(input_socket, output_socket, max_value=2, name="seg"):
+    """
+    Link input_socket to output_socket with the rainbow colors of
+    `rainbow_link`, precomputed for each integer pass_index in a ColorRamp
+    with constant interpolation. Three nodes per graph instead of 17: a
+    modulo that wraps the indices, a multiply-add that maps each index to
+    its palette slot, and the ColorRamp.
+
+    With more than MAX_PALETTE_SIZE objects, the indices wrap around the
+    palette (modulo its 32 colors): the colors are no longer unique, the exr
+    output still is.
+
+    Args:
+        name (str): prefix of the node names, the palette is updated by
+            `set_segmentation_max_value`.
+    """
+    wrap_node = ensure_node(f"{name}/palette_wrap", "CompositorNodeMath", operation="MODULO")
+    lookup_node = ensure_node(f"{name}/palette_lookup", "CompositorNodeMath", operation="MULTIPLY_ADD")
+    ramp_node = ensure_node(f"{name}/palette", "CompositorNodeValToRGB")
+    ensure_link(input_socket, wrap_node.inputs[0])
+    ensure_link(wrap_node.outputs[0], lookup_node.inputs[0])
+    ensure_link(lookup_node.outputs[0], ramp_node.inputs[0])
+    ensure_link(ramp_node.outputs[0], output_socket)
+    set_palette(name, max_value)
+
+
+def set_palette(name, max_value):
+    nodes = bpy.context.scene.node_tree.nodes
+    size = min(int(max_value), MAX_PALETTE_SIZE)
+    # identity up to max_value, wraps around the palette above
+    wrap_node = nodes[f"{name}/palette_wrap"]
+    wrap_node.inputs[1].default_value = size + 1
+    # the color of index k is at [k, k + 1) / (size + 1)
+    lookup_node = nodes[f"{name}/palette_lookup"]
+    lookup_node.inputs[1].default_value = 1 / (size + 1)
+    lookup_node.inputs[2].default_value = 0.5 / (size + 1)
+
+    ramp = nodes[f"{name}/palette"].color_ramp
+    ramp.interpolation = "CONSTANT"
+    while len(ramp.elements) > 1:
+        ramp.elements.remove(ramp.elements[-1])
+    # same colors as rainbow_link, or evenly spread if the palette wraps
+    period = max(max_value, 1) if max_value <= size else size + 1
+    ramp.elements[0].position = 0
+    ramp.elements[0].color = rainbow_color(0, period)
+    for k in range(1, size + 1):
+        element = ramp.elements.new(k / (size + 1))
+        element.color = rainbow_color(k, period)
+
+
+def set_segmentation_max_value(max_value):
+    """
+    Update the max_value used by the segmentation colors (see `palette_link`)
+    without rebuilding the compositor graph, e.g. when a new job loads a
+    different number of objects.
+    """
+    for node in bpy.context.scene.node_tree.nodes:
+        if node.name.endswith("/palette"):
+            set_palette(node.name[: -len("/palette")], max_value)
+
+
 def rainbow_link(input_node, output_node, max_value=2):
     """
     Link input_node to output_node with rainbow colors.
@@ -286,6 +536,42 @@ def render_image(path=None):
         bpy.context.scene.render.filepath = path
     bpy.ops.render.render(write_still=True)
 
+
+def keyframe_camera(camera, frame):
+    """
+    Insert location and rotation keyframes of the camera at the given frame.
+    """
+    camera.keyframe_insert("location", frame=frame)
+    camera.keyframe_insert("rotation_euler", frame=frame)
+
+
+def render_animation(path, frame_start, frame_end, on_frame=None):
+    """
+    Render the frames [frame_start, frame_end] as one animation. With
+    persistent data enabled, the scene is synced and the BVH is built once
+    for all the frames.
+
+    Args:
+        path (str): output path, "#" are replaced by the frame number, e.g. "render/img_#####".
+        on_frame (Callable[[int, str], None], optional): called with the frame and the path
+            of the image after each frame is written.
+    """
+    scene = bpy.context.scene
+    scene.render.filepath = path
+    scene.frame_start = frame_start
+    scene.frame_end = frame_end
+
+    def handler(scene, *args):
+        on_frame(scene.frame_current, scene.render.frame_path(frame=scene.frame_current))
+
+    if on_frame is not None:
+        bpy.app.handlers.render_write.append(handler)
+    try:
+        bpy.ops.render.render(animation=True)
+    finally:
+        if on_frame is not None:
+            bpy.app.handlers.render_write.remove(handler)
+
 """ def render_image(path=None, mask=False):
     # If path is provided, set it as the output file path
     if path is not None:
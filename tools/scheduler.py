@@ -0,0 +1,104 @@
+import os
+import time
+
+from tools.worker import BlenderWorkerPool
+
+
+def detect_cores():
+    """
+    Number of cores usable by this process (respects taskset/cgroup affinity
+    where the platform exposes it).
+    """
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def split_threads(num_workers, cores=None):
+    """
+    Split the cores between `num_workers` Blender processes so that the total
+    number of Cycles threads matches the machine.
+
+    Returns:
+        List[int]: the number of render threads of each worker.
+    """
+    cores = detect_cores() if cores is None else cores
+    num_workers = max(1, min(num_workers, cores))
+    base, extra = divmod(cores, num_workers)
+    return [base + (i < extra) for i in range(num_workers)]
+
+
+class Scheduler:
+    """
+    Run jobs on K concurrent Blender workers and split the cores between them.
+    Each worker renders with a fixed number of Cycles threads, so K workers
+    keep the cores busy while the others import objects, set up scenes or
+    encode images.
+
+    >>> scheduler = Scheduler(blender_app, "super_main.py", num_workers=8)
+    >>> results = scheduler.run(jobs)
+    Throughput: 12.3 images/s (...)
+    """
+
+    def __init__(self, blender_app, script_path, num_workers=None, cores=None, extra_args=(), verbose=True, report_every=30.0):
+        """
+        Args:
+            num_workers (int, optional): K, the number of concurrent Blender processes.
+                Defaults to one worker per 8 cores.
+            cores (int, optional): number of cores to use. Defaults to all usable cores.
+            report_every (float, optional): seconds between throughput reports.
+        """
+        self.cores = detect_cores() if cores is None else cores
+        if num_workers is None:
+            num_workers = max(1, self.cores // 8)
+        self.threads = split_threads(num_workers, self.cores)
+        self.pool = BlenderWorkerPool(blender_app, script_path, num_workers=len(self.threads), extra_args=extra_args, verbose=verbose)
+        for worker, threads in zip(self.pool.workers, self.threads):
+            worker.extra_args += ["--threads", str(threads)]
+        self.report_every = report_every
+        self.stats = dict(jobs=0, failed=0, images=0, seconds=0.0)
+
+    def images_per_second(self):
+        return self.stats["images"] / max(self.stats["seconds"], 1e-6)
+
+    def report(self):
+        print(
+            f"Throughput: {self.images_per_second():.2f} images/s "
+            f"({self.stats['images']} images, {self.stats['jobs']} jobs, {self.stats['failed']} failed, "
+            f"{len(self.threads)} workers x {self.threads[0]} threads, {self.stats['seconds']:.1f}s)"
+        )
+
+    def run(self, jobs, callback=None, on_message=None):
+        """
+        Run all jobs and print the aggregate throughput every `report_every` seconds
+        and at the end.
+
+        Args:
+            jobs (Iterable[dict]): jobs to run.
+            callback (Callable[[dict, dict], None], optional): called with (job, result)
+                as soon as a job finishes.
+            on_message (Callable[[dict, dict], None], optional): called with (job, message)
+                for the progress messages of the workers.
+
+        Returns:
+            List[dict]: the results, in the order of the jobs.
+        """
+        start = time.time()
+        last_report = start
+
+        def on_result(job, result):
+            nonlocal last_report
+            self.stats["jobs"] += 1
+            self.stats["failed"] += result["status"] != "ok"
+            self.stats["images"] += result.get("images", 0)
+            self.stats["seconds"] = time.time() - start
+            if callback is not None:
+                callback(job, result)
+            if time.time() - last_report > self.report_every:
+                last_report = time.time()
+                self.report()
+
+        results = self.pool.map(jobs, callback=on_result, on_message=on_message)
+        self.stats["seconds"] = time.time() - start
+        self.report()
+        return results
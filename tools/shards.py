@@ -0,0 +1,204 @@
+import glob
+import io
+import json
+import os
+import socket
+import tarfile
+
+BLOCK_SIZE = tarfile.BLOCKSIZE
+INDEX_SUFFIX = ".idx.jsonl"
+PART_SUFFIX = ".part"
+
+
+def _padded(size):
+    return -(-size // BLOCK_SIZE) * BLOCK_SIZE
+
+
+def _finalize(tar_part, index_part):
+    # the index is renamed last: a shard is complete once its index exists
+    for path in (tar_part, index_part):
+        with open(path, "rb+") as f:
+            os.fsync(f.fileno())
+    os.replace(tar_part, tar_part[: -len(PART_SUFFIX)])
+    os.replace(index_part, index_part[: -len(PART_SUFFIX)])
+
+
+class ShardWriter:
+    """
+    Stream samples into size-bounded tar shards, WebDataset style: each
+    sample is one member `<key>.<ext>` and each shard `<name>.tar` has a
+    sidecar index `<name>.tar.idx.jsonl` with one line per sample:
+
+    >>> {"key": "chair/frames_chair/studio.exr_00003", "offset": 1536, "size": 20480, "meta": {...}}
+
+    where offset and size locate the content of the member in the tar file.
+    Shards are written as `.part` files and renamed when they are full or
+    the writer is closed, so a crash never leaves a truncated shard under
+    its final name (see `recover_shards`).
+
+    >>> with ShardWriter("renders/shards", max_bytes=2**30) as writer:
+    ...     writer.write("chair/frames_chair/studio.exr_00003", "npz", data, meta)
+    """
+
+    def __init__(self, shard_dir, max_bytes=2**30, prefix=None):
+        """
+        Args:
+            max_bytes (int, optional): a new shard is started once a shard reaches this size.
+            prefix (str, optional): prefix of the shard names, must be unique per writer.
+                Defaults to "<hostname>-<pid>".
+        """
+        self.shard_dir = shard_dir
+        self.max_bytes = max_bytes
+        self.prefix = prefix or f"{socket.gethostname()}-{os.getpid()}"
+        self.num_shards = 0
+        self._tar = None
+        self._index = None
+        os.makedirs(shard_dir, exist_ok=True)
+
+    def _open(self):
+        path = os.path.join(self.shard_dir, f"{self.prefix}-{self.num_shards:06d}.tar")
+        while os.path.exists(path) or os.path.exists(path + PART_SUFFIX):
+            self.num_shards += 1
+            path = os.path.join(self.shard_dir, f"{self.prefix}-{self.num_shards:06d}.tar")
+        self._tar_path = path + PART_SUFFIX
+        self._index_path = path + INDEX_SUFFIX + PART_SUFFIX
+        self._tar = tarfile.open(self._tar_path, "w", format=tarfile.GNU_FORMAT)
+        self._index = open(self._index_path, "w")
+        self.num_shards += 1
+
+    def write(self, key, ext, data, meta=None):
+        """
+        Append one sample to the current shard.
+
+        Args:
+            key (str): the sample id, unique in the dataset.
+            ext (str): extension of the member, i.e. the format of data.
+            data (bytes): the encoded sample.
+            meta (dict, optional): metadata stored in the index.
+        """
+        if self._tar is None:
+            self._open()
+        info = tarfile.TarInfo(f"{key}.{ext}")
+        info.size = len(data)
+        self._tar.addfile(info, io.BytesIO(data))
+        self._tar.fileobj.flush()
+        # the content ends at the current offset, up to the block padding
+        offset = self._tar.offset - _padded(len(data))
+        self._index.write(json.dumps(dict(key=key, ext=ext, offset=offset, size=len(data), meta=meta or {})) + "\n")
+        self._index.flush()
+        if self._tar.offset >= self.max_bytes:
+            self.finalize()
+
+    def finalize(self):
+        """
+        Close the current shard and give it its final name.
+        """
+        if self._tar is None:
+            return
+        self._tar.close()
+        self._index.close()
+        self._tar = self._index = None
+        _finalize(self._tar_path, self._index_path)
+
+    def close(self):
+        self.finalize()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def recover_shards(shard_dir):
+    """
+    Finalize the `.part` shards left by crashed writers: the tar file is
+    truncated after the last sample of its index and terminated. Must not
+    run while writers are using shard_dir.
+
+    Returns:
+        int: the number of recovered samples.
+    """
+    recovered = 0
+    for tar_part in glob.glob(os.path.join(shard_dir, f"*.tar{PART_SUFFIX}")):
+        index_part = tar_part[: -len(PART_SUFFIX)] + INDEX_SUFFIX + PART_SUFFIX
+        size = os.path.getsize(tar_part)
+        entries = []
+        if os.path.exists(index_part):
+            with open(index_part) as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        # the last line of a crashed writer
+                        break
+                    if entry["offset"] + _padded(entry["size"]) > size:
+                        break
+                    entries.append(line if line.endswith("\n") else line + "\n")
+        if not entries:
+            os.remove(tar_part)
+            if os.path.exists(index_part):
+                os.remove(index_part)
+            continue
+        last = json.loads(entries[-1])
+        with open(tar_part, "rb+") as f:
+            f.truncate(last["offset"] + _padded(last["size"]))
+            f.seek(0, os.SEEK_END)
+            f.write(b"\0" * 2 * BLOCK_SIZE)
+        with open(index_part, "w") as f:
+            f.writelines(entries)
+        _finalize(tar_part, index_part)
+        recovered += len(entries)
+        print(f"Recovered {len(entries)} samples of {tar_part}")
+    return recovered
+
+
+class ShardReader:
+    """
+    Random access to the samples of the finalized shards of a directory.
+    The indexes are loaded once, each sample is then read with one seek.
+
+    >>> reader = ShardReader("renders/shards")
+    >>> data = reader["chair/frames_chair/studio.exr_00003"]
+    >>> frame = load_packed(io.BytesIO(data))
+    """
+
+    def __init__(self, shard_dir):
+        self.shard_dir = shard_dir
+        self.index = {}
+        for index_path in sorted(glob.glob(os.path.join(shard_dir, f"*.tar{INDEX_SUFFIX}"))):
+            tar_path = index_path[: -len(INDEX_SUFFIX)]
+            with open(index_path) as f:
+                for line in f:
+                    entry = json.loads(line)
+                    entry["path"] = tar_path
+                    self.index[entry["key"]] = entry
+        self._files = {}
+
+    def __len__(self):
+        return len(self.index)
+
+    def __contains__(self, key):
+        return key in self.index
+
+    def __iter__(self):
+        return iter(self.index)
+
+    def keys(self):
+        return self.index.keys()
+
+    def meta(self, key):
+        return self.index[key]["meta"]
+
+    def __getitem__(self, key):
+        entry = self.index[key]
+        if entry["path"] not in self._files:
+            self._files[entry["path"]] = open(entry["path"], "rb")
+        f = self._files[entry["path"]]
+        f.seek(entry["offset"])
+        return f.read(entry["size"])
+
+    def close(self):
+        for f in self._files.values():
+            f.close()
+        self._files = {}
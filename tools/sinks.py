@@ -0,0 +1,115 @@
+import io
+import json
+import os
+import threading
+import numpy as np
+from tools.packing import pack_frame
+from tools.shards import ShardWriter
+
+
+class FrameSink:
+    """
+    Destination of the frames captured in memory after each render (see
+    `tools.capture.FrameCapture`). A frame is one record:
+
+    >>> record = {
+    ...     "id": "renders/chair/frames_chair/studio.exr_00003",
+    ...     "meta": {"frame": 3, ...},
+    ...     "passes": {"rgb": (H, W, 4) float32, "depth": (H, W), "index": (H, W), "normal": (H, W, 3)},
+    ... }
+    >>> sink.write(record)
+
+    With an `tools.encoder.AsyncEncoder`, write is called from several threads.
+    """
+
+    def write(self, record):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class NpzSink(FrameSink):
+    """
+    Write each record to `<id>.npz`, with one array per pass and the
+    metadata as a JSON string.
+    """
+
+    def write(self, record):
+        path = f"{record['id']}.npz"
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        np.savez(path, meta=json.dumps(record["meta"]), **record["passes"])
+        return path
+
+
+class PackedSink(FrameSink):
+    """
+    Write each record to `<id>.npz` in the packed format of
+    `tools.packing.pack_frame`: one file per frame with 8-bit sRGB, 16-bit
+    metric depth, 8/16-bit object indices and octahedral normals. Read it
+    back with `tools.packing.load_packed`.
+    """
+
+    def __init__(self, depth_scale=1e-3, normal_bits=8, compress=False):
+        self.depth_scale = depth_scale
+        self.normal_bits = normal_bits
+        self.compress = compress
+
+    def write(self, record):
+        path = f"{record['id']}.npz"
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        packed = pack_frame(record["passes"], record["meta"], self.depth_scale, self.normal_bits)
+        (np.savez_compressed if self.compress else np.savez)(path, **packed)
+        return path
+
+
+class ShardSink(FrameSink):
+    """
+    Stream the records into size-bounded tar shards with a sidecar index
+    (see `tools.shards.ShardWriter`) instead of one file per frame. Each
+    record is one `<key>.npz` member in the packed format, the key is its
+    id relative to the parent of shard_dir. Read the samples back with
+    `tools.shards.ShardReader` and `tools.packing.load_packed`.
+    """
+
+    def __init__(self, shard_dir, max_bytes=2**30, depth_scale=1e-3, normal_bits=8):
+        self.root = os.path.dirname(os.path.abspath(shard_dir))
+        self.writer = ShardWriter(shard_dir, max_bytes=max_bytes)
+        self._lock = threading.Lock()
+        self.depth_scale = depth_scale
+        self.normal_bits = normal_bits
+
+    def write(self, record):
+        key = os.path.relpath(os.path.abspath(record["id"]), self.root)
+        buffer = io.BytesIO()
+        np.savez(buffer, **pack_frame(record["passes"], record["meta"], self.depth_scale, self.normal_bits))
+        # the records are encoded in parallel by AsyncEncoder, written one at a time
+        with self._lock:
+            self.writer.write(key, "npz", buffer.getvalue(), record["meta"])
+        return key
+
+    def close(self):
+        with self._lock:
+            self.writer.close()
+
+
+SINKS = {
+    "npz": NpzSink,
+    "packed": PackedSink,
+    "shards": ShardSink,
+}
+
+
+def make_sink(name, **kwargs):
+    """
+    Create a sink from its name in SINKS.
+    """
+    return SINKS[name](**kwargs)
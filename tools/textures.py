@@ -0,0 +1,211 @@
+import bpy
+import hashlib
+import math
+import os
+import struct
+import time
+import numpy as np
+from tools.background import image_to_array
+from tools.cache import file_hash
+from tools.find import find_all_meshes
+
+
+def texture_size(res_x, res_y, tier=2.0, min_size=64):
+    """
+    Largest texture dimension worth keeping for the render resolution: an
+    object covers at most the whole frame, so textures get about `tier`
+    texels per rendered pixel, rounded up to a power of two.
+    """
+    return max(min_size, 2 ** math.ceil(math.log2(tier * max(res_x, res_y))))
+
+
+def object_images(obj: bpy.types.Object):
+    """
+    Image texture nodes of the materials of the object, including the nodes
+    inside node groups.
+
+    Returns:
+        List[bpy.types.ShaderNodeTexImage]: the nodes that use an image.
+    """
+    nodes = []
+    trees = [slot.material.node_tree for mesh in find_all_meshes(obj) for slot in mesh.material_slots
+             if slot.material is not None and slot.material.node_tree is not None]
+    seen = set()
+    while trees:
+        tree = trees.pop()
+        if tree.name in seen:
+            continue
+        seen.add(tree.name)
+        for node in tree.nodes:
+            if node.type == "TEX_IMAGE" and node.image is not None:
+                nodes.append(node)
+            elif node.type == "GROUP" and node.node_tree is not None:
+                trees.append(node.node_tree)
+    return nodes
+
+
+def image_hash(image):
+    """
+    sha256 of the content of an image, packed (e.g. embedded in a GLB), on
+    disk or generated in memory.
+
+    Returns:
+        str: the hash, or None if the image has no data (e.g. a missing file).
+    """
+    if image.packed_file is not None:
+        return hashlib.sha256(image.packed_file.data).hexdigest()
+    path = bpy.path.abspath(image.filepath)
+    if image.source == "FILE" and os.path.isfile(path):
+        return file_hash(path)
+    if image.has_data:
+        return hashlib.sha256(image_to_array(image).tobytes()).hexdigest()
+    return None
+
+
+def encoded_image_size(data):
+    """
+    Size of a PNG or JPEG image from the header of its file data, without
+    decoding the pixels.
+
+    Returns:
+        Tuple[int, int, bool]: width, height and whether Blender decodes it to
+            a float buffer (16 bit PNG), or None for other formats.
+    """
+    if data[:8] == b"\x89PNG\r\n\x1a\n" and data[12:16] == b"IHDR":
+        width, height = struct.unpack(">II", data[16:24])
+        return width, height, data[24] == 16
+    if data[:2] != b"\xff\xd8":
+        return None
+    i = 2
+    while i + 9 <= len(data):
+        if data[i] != 0xFF:
+            return None
+        marker = data[i + 1]
+        if marker == 0xFF:
+            # fill byte
+            i += 1
+        elif 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+            # start of frame: precision, height, width
+            height, width = struct.unpack(">HH", data[i + 5:i + 9])
+            return width, height, False
+        elif marker == 0x01 or 0xD0 <= marker <= 0xD7:
+            # markers without a segment
+            i += 2
+        else:
+            i += 2 + struct.unpack(">H", data[i + 2:i + 4])[0]
+    return None
+
+
+def image_info(image):
+    """
+    Size, float buffer and content hash of an image. For PNG and JPEG images
+    (packed or on disk) they are read from the file data, so that the image
+    is not decoded; the other images are decoded.
+
+    Returns:
+        Tuple[int, int, bool, str]: width, height, whether the image is float and
+            its hash (None if the image has no data, see `image_hash`).
+    """
+    data = None
+    path = bpy.path.abspath(image.filepath)
+    if image.packed_file is not None:
+        data = image.packed_file.data
+    elif image.source == "FILE" and os.path.isfile(path):
+        with open(path, "rb") as f:
+            data = f.read()
+    header = encoded_image_size(data) if data else None
+    if header is not None:
+        return (*header, hashlib.sha256(data).hexdigest())
+    width, height = image.size
+    return width, height, image.is_float, image_hash(image)
+
+
+def downsample_image(pixels, size):
+    """
+    Box-filter an (H, W, C) image by an integer factor so that its largest
+    dimension is at most size.
+    """
+    height, width = pixels.shape[:2]
+    factor = math.ceil(max(height, width) / size)
+    height, width = height // factor, width // factor
+    pixels = pixels[: height * factor, : width * factor]
+    return pixels.reshape(height, factor, width, factor, -1).mean((1, 3))
+
+
+def get_texture_proxy(image, proxy_dir, size, info=None):
+    """
+    Path to a downscaled copy of the image, created and cached on disk the
+    first time. The key is the content hash of the image, so the same
+    texture embedded in several assets is scaled once. The image is only
+    decoded to create the proxy (or if its size is not in its header, see
+    `image_info`), so with a warm proxy_dir the full resolution textures
+    are never loaded in memory.
+
+    Args:
+        info (Tuple[int, int, bool, str], optional): the `image_info` of the image.
+
+    Returns:
+        str: the path to the proxy, or None if the image is already small enough
+            or has no data (it renders as a missing texture, as without proxies).
+    """
+    width, height, is_float, key = image_info(image) if info is None else info
+    if max(width, height) <= size or min(width, height) == 0 or key is None:
+        return None
+    extension = "exr" if is_float else "png"
+    proxy_path = os.path.join(proxy_dir, f"{key}_{size}.{extension}")
+    if os.path.exists(proxy_path):
+        return proxy_path
+
+    os.makedirs(proxy_dir, exist_ok=True)
+    pixels = downsample_image(image_to_array(image), size)
+    if pixels.shape[2] < 4:
+        # grey or RGB images, Blender stores 4 channels
+        pixels = np.concatenate([np.repeat(pixels[..., :1], 3, -1) if pixels.shape[2] < 3 else pixels[..., :3],
+                                 np.ones_like(pixels[..., :1])], -1)
+    # Write then rename so that other workers never read a partial file
+    proxy = bpy.data.images.new(f"proxy_{image.name}", pixels.shape[1], pixels.shape[0], alpha=True, float_buffer=is_float)
+    proxy.pixels.foreach_set(pixels.astype(np.float32).ravel())
+    proxy.filepath_raw = f"{proxy_path}.{os.getpid()}.tmp.{extension}"
+    proxy.file_format = "OPEN_EXR" if is_float else "PNG"
+    proxy.save()
+    bpy.data.images.remove(proxy)
+    os.replace(f"{proxy_path}.{os.getpid()}.tmp.{extension}", proxy_path)
+    return proxy_path
+
+
+def proxy_textures(obj: bpy.types.Object, proxy_dir, size):
+    """
+    Replace the images of the materials of the object by downscaled proxies
+    (see `get_texture_proxy`) and remove the full resolution images.
+
+    Returns:
+        dict: number of images replaced, bytes of pixels saved and seconds spent.
+    """
+    start = time.time()
+    proxies = {}
+    saved = 0
+    for node in object_images(obj):
+        image = node.image
+        if image.name not in proxies:
+            # the size from the file data, image.size would decode the full resolution image
+            width, height, is_float, key = info = image_info(image)
+            proxy_path = get_texture_proxy(image, proxy_dir, size, info)
+            if proxy_path is None:
+                proxies[image.name] = image
+                continue
+            proxy = bpy.data.images.load(proxy_path, check_existing=True)
+            proxy.colorspace_settings.name = image.colorspace_settings.name
+            proxy.alpha_mode = image.alpha_mode
+            texel_bytes = 16 if is_float else 4
+            saved += (width * height - proxy.size[0] * proxy.size[1]) * texel_bytes
+            proxies[image.name] = proxy
+        node.image = proxies[image.name]
+
+    replaced = 0
+    for name, proxy in proxies.items():
+        image = bpy.data.images.get(name)
+        if image is not None and image is not proxy:
+            replaced += 1
+            if image.users == 0:
+                bpy.data.images.remove(image)
+    return dict(images=replaced, bytes_saved=saved, seconds=time.time() - start)
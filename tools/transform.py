@@ -1,11 +1,68 @@
 import bpy
-import math
+import bmesh
 import numpy as np
 from mathutils import Matrix, Vector
+from bpy.app.handlers import persistent
 from numpy.random import uniform
 from tools.find import find_all_meshes
 
 
+# object-space vertices of each mesh datablock, keyed by its pointer
+_VERTEX_CACHE = {}
+
+
+def invalidate_vertices(mesh: bpy.types.Mesh = None):
+    """
+    Drop the cached vertices of the given mesh datablock, or of all meshes.
+    """
+    if mesh is None:
+        _VERTEX_CACHE.clear()
+    else:
+        _VERTEX_CACHE.pop(mesh.as_pointer(), None)
+
+
+@persistent
+def _invalidate_updated_meshes(scene, depsgraph):
+    for update in depsgraph.updates:
+        if update.is_updated_geometry:
+            data = update.id.original
+            if isinstance(data, bpy.types.Object):
+                data = data.data
+            if isinstance(data, bpy.types.Mesh):
+                invalidate_vertices(data)
+
+
+if not any(handler.__name__ == _invalidate_updated_meshes.__name__ for handler in bpy.app.handlers.depsgraph_update_post):
+    bpy.app.handlers.depsgraph_update_post.append(_invalidate_updated_meshes)
+
+
+def mesh_vertices(mesh: bpy.types.Mesh):
+    """
+    Object-space vertices of a mesh datablock, read once and cached until the
+    mesh is edited (see `transform` and `invalidate_vertices`).
+
+    Returns:
+        np.ndarray: (N, 3) float32 read-only array.
+    """
+    key = mesh.as_pointer()
+    vertices = _VERTEX_CACHE.get(key)
+    if vertices is None or len(vertices) != len(mesh.vertices):
+        vertices = np.empty(len(mesh.vertices) * 3, dtype=np.float32)
+        mesh.vertices.foreach_get("co", vertices)
+        vertices = vertices.reshape(-1, 3)
+        vertices.flags.writeable = False
+        _VERTEX_CACHE[key] = vertices
+    return vertices
+
+
+def apply_matrix(points, matrix):
+    """
+    Transform (N, 3) points by a 4x4 matrix as points @ R.T + t.
+    """
+    matrix = np.asarray(matrix, dtype=np.float32)
+    return points @ matrix[:3, :3].T + matrix[:3, 3]
+
+
 def get_vertices(obj_or_mesh: bpy.types.Object or bpy.types.Mesh, mode="obj"):
     """
     Get the vertices of the given object or mesh.
@@ -13,26 +70,19 @@ def get_vertices(obj_or_mesh: bpy.types.Object or bpy.types.Mesh, mode="obj"):
     Args:
         obj_or_mesh (bpy.types.Object or bpy.types.Mesh): The object or mesh.
         mode (str, optional): "obj" or "world". Object space or world space. Defaults to "obj".
+
+    Returns:
+        np.ndarray: (N, 3) float32 vertices of all the meshes of the object.
     """
     meshes = find_all_meshes(obj_or_mesh)
     assert len(meshes) > 0, "No mesh found"
-    mesh_list = []
     vertices_list = []
     for mesh in meshes:
-        vertices = np.ones(len(mesh.data.vertices) * 3)
-        mesh.data.vertices.foreach_get("co", vertices)
-        vertices = vertices.reshape(-1, 3)  # (N, 3)
+        vertices = mesh_vertices(mesh.data)
+        if mode == "world":
+            vertices = apply_matrix(vertices, mesh.matrix_world)
         vertices_list.append(vertices)
-        mesh_list.append(mesh)
-
-    if mode == "world":
-        for i, (obj, vertices) in enumerate(zip(mesh_list, vertices_list)):
-            vertices = np.concatenate([vertices, np.ones((len(vertices), 1))], axis=1)  # (N, 4)
-            vertices = vertices @ np.array(obj.matrix_world).T  # (N, 4) @ (4, 4) -> (N, 4)
-            vertices = vertices[:, :3]
-            vertices_list[i] = vertices
-    vertices = np.concatenate(vertices_list, axis=0)
-    return vertices
+    return np.concatenate(vertices_list, axis=0)
 
 
 
@@ -40,6 +90,7 @@ def transform(obj_or_mesh: bpy.types.Object or bpy.types.Mesh, matrix: Matrix or
     mesh = obj_or_mesh.data if isinstance(obj_or_mesh, bpy.types.Object) else obj_or_mesh
     mesh.transform(Matrix(matrix))
     mesh.update()
+    invalidate_vertices(mesh)
 
 
 def center_vert_bbox(vertices, bbox_center=None, bbox_scale=None, scale=False):
@@ -57,6 +108,11 @@ def center_vert_bbox(vertices, bbox_center=None, bbox_scale=None, scale=False):
 
 
 
+BOX_CORNERS = np.array(
+    [[0, 0, 0], [0, 0, 1], [0, 1, 1], [0, 1, 0], [1, 0, 0], [1, 0, 1], [1, 1, 1], [1, 1, 0]], dtype=bool
+)
+
+
 def obj_bbox(obj: bpy.types.Object, ignore_matrix=False, mode="minmax"):
     """
     Compute the bounding box of the given object.
@@ -68,61 +124,92 @@ def obj_bbox(obj: bpy.types.Object, ignore_matrix=False, mode="minmax"):
 
     Returns:
         Tuple[Vector, Vector]: The minimum and maximum coordinates of the bounding box.
+        np.ndarray: in "box" mode, the (8, 3) corners of the box aligned with the object axes.
     """
+    if mode not in ("minmax", "box"):
+        raise ValueError(f"Unknown mode {mode}")
+    meshes = find_all_meshes(obj)
+    corners = np.array([np.array(mesh.bound_box) for mesh in meshes], dtype=np.float32)  # (M, 8, 3)
     if mode == "minmax":
-        bbox_min = (math.inf,) * 3
-        bbox_max = (-math.inf,) * 3
-        for obj in find_all_meshes(obj):
-            for coord in obj.bound_box:
-                coord = Vector(coord)
-                if not ignore_matrix:
-                    coord = obj.matrix_world @ coord
-                bbox_min = tuple(min(x, y) for x, y in zip(bbox_min, coord))
-                bbox_max = tuple(max(x, y) for x, y in zip(bbox_max, coord))
-        return Vector(bbox_min), Vector(bbox_max)
-    elif mode == "box":
-        # return a 8 * 3 array
-        bbox_min = (math.inf,) * 3
-        bbox_max = (-math.inf,) * 3
-        for obj in find_all_meshes(obj):
-            for coord in obj.bound_box:
-                coord = Vector(coord)
-                bbox_min = tuple(min(x, y) for x, y in zip(bbox_min, coord))
-                bbox_max = tuple(max(x, y) for x, y in zip(bbox_max, coord))
-        # canonical box
-        box = np.array(
-            [
-                [bbox_min[0], bbox_min[1], bbox_min[2]],
-                [bbox_min[0], bbox_min[1], bbox_max[2]],
-                [bbox_min[0], bbox_max[1], bbox_max[2]],
-                [bbox_min[0], bbox_max[1], bbox_min[2]],
-                [bbox_max[0], bbox_min[1], bbox_min[2]],
-                [bbox_max[0], bbox_min[1], bbox_max[2]],
-                [bbox_max[0], bbox_max[1], bbox_max[2]],
-                [bbox_max[0], bbox_max[1], bbox_min[2]],
-            ]
-        )
         if not ignore_matrix:
-            box = np.concatenate([box, np.ones((8, 1))], axis=1)
-            box = box @ np.array(obj.matrix_world).T
-            box = box[:, :3]
-        return box
-    else:
-        raise ValueError(f"Unknown mode {mode}")
+            matrices = np.array([np.array(mesh.matrix_world) for mesh in meshes], dtype=np.float32)  # (M, 4, 4)
+            corners = corners @ matrices[:, :3, :3].transpose(0, 2, 1) + matrices[:, None, :3, 3]
+        corners = corners.reshape(-1, 3)
+        return Vector(corners.min(0)), Vector(corners.max(0))
+
+    # "box": bounding box in the frame of the object, with its children
+    root = np.array(obj.matrix_world, dtype=np.float32)
+    to_root = np.linalg.inv(root) @ np.array([np.array(mesh.matrix_world) for mesh in meshes], dtype=np.float32)
+    corners = (corners @ to_root[:, :3, :3].transpose(0, 2, 1) + to_root[:, None, :3, 3]).reshape(-1, 3)
+    box = np.where(BOX_CORNERS, corners.max(0), corners.min(0))
+    if not ignore_matrix:
+        box = apply_matrix(box, root)
+    return box
     
 
+def convex_hull(points):
+    """
+    Vertices of the convex hull of the given points, computed with bmesh.
+
+    Returns:
+        np.ndarray: (H, 3) float32 hull vertices, the points themselves if the
+            hull is degenerate (fewer than 4 points, flat objects).
+    """
+    points = np.asarray(points, dtype=np.float32)
+    if len(points) < 4:
+        return points
+    bm = bmesh.new()
+    try:
+        verts = [bm.verts.new(point) for point in points.tolist()]
+        hull = bmesh.ops.convex_hull(bm, input=verts)
+        hull = np.array([v.co[:] for v in hull["geom"] if isinstance(v, bmesh.types.BMVert)], dtype=np.float32)
+    finally:
+        bm.free()
+    return hull if len(hull) >= 4 else points
+
+
+def get_hull(obj: bpy.types.Object):
+    """
+    Convex hull of all the meshes of the object, in the object frame. It is
+    computed once and stored in the "hull" custom property of the object, so
+    it is saved with the object (e.g. in the asset cache).
+
+    Returns:
+        np.ndarray: (H, 3) float32 hull vertices.
+    """
+    if "hull" not in obj:
+        root = np.linalg.inv(np.array(obj.matrix_world, dtype=np.float32))
+        points = np.concatenate(
+            [apply_matrix(mesh_vertices(mesh.data), root @ np.array(mesh.matrix_world)) for mesh in find_all_meshes(obj)]
+        )
+        obj["hull"] = convex_hull(points).ravel().tolist()
+    return np.array(obj["hull"], dtype=np.float32).reshape(-1, 3)
+
+
+def hull_bbox(obj: bpy.types.Object):
+    """
+    World bounding box of the object from its convex hull: tight under any
+    rotation and independent of the mesh density.
+
+    Returns:
+        Tuple[Vector, Vector]: The minimum and maximum coordinates of the bounding box.
+    """
+    hull = apply_matrix(get_hull(obj), obj.matrix_world)
+    return Vector(hull.min(0)), Vector(hull.max(0))
+
+
 def normalize_obj(obj: bpy.types.Object):
     """
     Normalize the object to have unit bounding box and center at the world origin.
     """
-    bbox_min, bbox_max = obj_bbox(obj)
+    bbox_min, bbox_max = hull_bbox(obj)
     scale = 1 / max(bbox_max - bbox_min)
-    obj.scale = obj.scale * scale
-    # Apply scale to matrix_world.
-    bpy.context.view_layer.update()
-    bbox_min, bbox_max = obj_bbox(obj)
+    # scaling the object scales its bounding box around its origin
+    origin = obj.matrix_world.translation.copy()
+    bbox_min = origin + (bbox_min - origin) * scale
+    bbox_max = origin + (bbox_max - origin) * scale
     offset = -(bbox_min + bbox_max) / 2
-    obj.matrix_world = Matrix.Translation(offset) @ obj.matrix_world
+    obj.matrix_world = Matrix.Translation(offset) @ obj.matrix_world @ Matrix.Scale(scale, 4)
     bpy.context.view_layer.update()
 
 
@@ -142,14 +229,15 @@ def look_at(obj: bpy.types.Object, target):
 
 def againts_wall(obj: bpy.types.Object, z=0):
     """
-    Move the object to the wall. The wall is defined as the z coordinate of the lowest vertex.
+    Move the object to the wall. The wall is defined as the z coordinate of the lowest vertex,
+    found on the convex hull of the object.
 
     Args:
         obj (bpy.types.Object): The object.
         z (float, optional): The z coordinate of the wall. Defaults to 0.
     """
-    vertices = get_vertices(obj, mode="world")
-    obj.location[2] = -vertices[:, 2].min() + z
+    bbox_min, _ = hull_bbox(obj)
+    obj.location[2] = -bbox_min[2] + z
 
 
 def random_loc(loc, radius=[0, 1], theta=[-0.5, 0.5], phi=[-1, 1]):
@@ -0,0 +1,373 @@
+import json
+import os
+import struct
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+# Assets beyond these limits are flagged "huge"
+TRIAGE_LIMITS = dict(max_triangles=5_000_000, max_texture=16384, max_bytes=2**30)
+# Flags of the assets that are not worth a Blender launch
+SKIP_FLAGS = ("corrupt", "empty", "degenerate", "huge")
+TRIAGE_FORMATS = (".glb", ".gltf", ".obj")
+
+GLB_MAGIC = b"glTF"
+GLB_JSON = 0x4E4F534A
+PNG_MAGIC = b"\x89PNG\r\n\x1a\n"
+# triangles of a primitive of `count` vertices, by glTF primitive mode (4: TRIANGLES, 5: TRIANGLE_STRIP, 6: TRIANGLE_FAN)
+PRIMITIVE_TRIANGLES = {4: lambda count: count // 3, 5: lambda count: max(count - 2, 0), 6: lambda count: max(count - 2, 0)}
+
+
+class CorruptAsset(ValueError):
+    pass
+
+
+def image_size(header):
+    """
+    Size of a PNG or JPEG image from the first bytes of the file.
+
+    Returns:
+        Tuple[int, int]: width and height, or None for other formats or a short header.
+    """
+    if header.startswith(PNG_MAGIC) and len(header) >= 24:
+        return struct.unpack(">II", header[16:24])
+    if header.startswith(b"\xff\xd8"):
+        i = 2
+        while i + 9 <= len(header):
+            if header[i] != 0xFF:
+                return None
+            marker = header[i + 1]
+            # start of frame markers, except DHT (C4), JPG (C8) and DAC (CC)
+            if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+                height, width = struct.unpack(">HH", header[i + 5 : i + 9])
+                return width, height
+            i += 2 + struct.unpack(">H", header[i + 2 : i + 4])[0]
+    return None
+
+
+def file_image_size(path, max_header=1 << 16):
+    try:
+        with open(path, "rb") as f:
+            return image_size(f.read(max_header))
+    except OSError:
+        return None
+
+
+def node_matrix(node):
+    """
+    Local 4x4 matrix of a glTF node, from "matrix" (column major) or "translation", "rotation" and "scale".
+    """
+    if "matrix" in node:
+        return np.array(node["matrix"], dtype=np.float64).reshape(4, 4).T
+    x, y, z, w = node.get("rotation", (0, 0, 0, 1))
+    rotation = np.array([
+        [1 - 2 * (y * y + z * z), 2 * (x * y - z * w), 2 * (x * z + y * w)],
+        [2 * (x * y + z * w), 1 - 2 * (x * x + z * z), 2 * (y * z - x * w)],
+        [2 * (x * z - y * w), 2 * (y * z + x * w), 1 - 2 * (x * x + y * y)],
+    ])
+    matrix = np.eye(4)
+    matrix[:3, :3] = rotation * np.array(node.get("scale", (1, 1, 1)))
+    matrix[:3, 3] = node.get("translation", (0, 0, 0))
+    return matrix
+
+
+def read_glb(path):
+    """
+    Read the JSON chunk of a GLB file, without its binary chunk.
+
+    Returns:
+        Tuple[dict, int]: the glTF JSON and the file offset of the binary chunk data.
+    """
+    size = os.path.getsize(path)
+    with open(path, "rb") as f:
+        header = f.read(20)
+        if len(header) < 20 or header[:4] != GLB_MAGIC:
+            raise CorruptAsset("not a binary glTF file")
+        _, length, chunk_length, chunk_type = struct.unpack("<IIII", header[4:])
+        if length > size:
+            raise CorruptAsset(f"truncated, {size} of {length} bytes")
+        if chunk_type != GLB_JSON or 20 + chunk_length > length:
+            raise CorruptAsset("missing JSON chunk")
+        gltf = json.loads(f.read(chunk_length))
+    # the binary chunk follows the JSON chunk and its 8 bytes header
+    return gltf, 20 + chunk_length + 8
+
+
+def gltf_textures(gltf, path, bin_offset):
+    """
+    Sizes of the images of a glTF asset, embedded in the binary chunk or next to the file.
+    """
+    sizes = []
+    views = gltf.get("bufferViews", [])
+    with open(path, "rb") as f:
+        for image in gltf.get("images", []):
+            if "bufferView" in image:
+                view = views[image["bufferView"]]
+                f.seek(bin_offset + view.get("byteOffset", 0))
+                size = image_size(f.read(min(view["byteLength"], 1 << 16)))
+            elif "uri" in image and not image["uri"].startswith("data:"):
+                size = file_image_size(os.path.join(os.path.dirname(path), image["uri"]))
+            else:
+                size = None
+            if size is not None:
+                sizes.append(list(size))
+    return sizes
+
+
+def triage_gltf(path):
+    """
+    Statistics of a glTF/GLB asset from its JSON only: the vertices,
+    triangles and bounds are summed over the mesh instances of the scene,
+    from the accessor counts and the POSITION min/max.
+    """
+    if path.endswith(".glb"):
+        gltf, bin_offset = read_glb(path)
+    else:
+        with open(path, "rb") as f:
+            gltf = json.loads(f.read())
+        bin_offset = 0
+    if not isinstance(gltf, dict):
+        raise CorruptAsset(f"the glTF JSON is a {type(gltf).__name__}, not an object")
+
+    accessors = gltf.get("accessors", [])
+    meshes = gltf.get("meshes", [])
+    nodes = gltf.get("nodes", [])
+    scenes = gltf.get("scenes", [])
+    if scenes:
+        roots = scenes[gltf.get("scene", 0)].get("nodes", [])
+    else:
+        children = {child for node in nodes for child in node.get("children", [])}
+        roots = [i for i in range(len(nodes)) if i not in children]
+
+    vertices = triangles = 0
+    corners = []
+    stack = [(i, np.eye(4)) for i in roots]
+    visited = 0
+    while stack:
+        idx, parent = stack.pop()
+        visited += 1
+        if visited > len(nodes):
+            raise CorruptAsset("cycle in the node hierarchy")
+        node = nodes[idx]
+        matrix = parent @ node_matrix(node)
+        stack.extend((child, matrix) for child in node.get("children", []))
+        if "mesh" not in node:
+            continue
+        for primitive in meshes[node["mesh"]]["primitives"]:
+            position = accessors[primitive["attributes"]["POSITION"]]
+            count = accessors[primitive["indices"]]["count"] if "indices" in primitive else position["count"]
+            vertices += position["count"]
+            triangles += PRIMITIVE_TRIANGLES.get(primitive.get("mode", 4), lambda count: 0)(count)
+            if "min" in position and "max" in position:
+                low, high = np.array(position["min"][:3], dtype=np.float64), np.array(position["max"][:3], dtype=np.float64)
+                box = np.array([[x, y, z, 1] for x in (low[0], high[0]) for y in (low[1], high[1]) for z in (low[2], high[2])])
+                corners.append(box @ matrix.T)
+
+    bounds = None
+    if corners:
+        corners = np.concatenate(corners)[:, :3]
+        bounds = [corners.min(0).tolist(), corners.max(0).tolist()]
+    return dict(vertices=vertices, triangles=triangles, nodes=len(nodes), bounds=bounds,
+                textures=gltf_textures(gltf, path, bin_offset))
+
+
+def obj_textures(lines, path):
+    """
+    Sizes of the images referenced by the material libraries of an OBJ file.
+    """
+    sizes = []
+    root = os.path.dirname(path)
+    for line in lines:
+        if not line.startswith(b"mtllib"):
+            continue
+        mtl_path = os.path.join(root, line[6:].strip().decode(errors="replace"))
+        if not os.path.exists(mtl_path):
+            continue
+        with open(mtl_path, "rb") as f:
+            for mtl_line in f:
+                if mtl_line.startswith(b"map_"):
+                    size = file_image_size(os.path.join(root, mtl_line.split()[-1].decode(errors="replace")))
+                    if size is not None:
+                        sizes.append(list(size))
+    return sizes
+
+
+def triage_obj(path):
+    """
+    Statistics of an OBJ asset. The faces are fans of n - 2 triangles.
+    """
+    with open(path, "rb") as f:
+        data = f.read()
+    if b"\x00" in data[:4096]:
+        raise CorruptAsset("binary data in an OBJ file")
+    lines = data.splitlines()
+    try:
+        positions = np.array([line.split()[1:4] for line in lines if line.startswith(b"v ")], dtype=np.float64)
+    except ValueError as e:
+        raise CorruptAsset(f"bad vertex: {e}")
+    faces = [line for line in lines if line.startswith(b"f ")]
+    triangles = sum(max(len(line.split()) - 3, 0) for line in faces)
+    nodes = sum(1 for line in lines if line.startswith((b"o ", b"g ")))
+    bounds = None
+    if len(positions):
+        if positions.ndim != 2 or positions.shape[1] != 3:
+            raise CorruptAsset("vertex with less than 3 coordinates")
+        bounds = [positions.min(0).tolist(), positions.max(0).tolist()]
+    return dict(vertices=len(positions), triangles=triangles, nodes=max(nodes, 1 if len(positions) else 0),
+                bounds=bounds, textures=obj_textures(lines, path))
+
+
+def triage_flags(stats, limits=TRIAGE_LIMITS):
+    flags = []
+    if stats["vertices"] == 0 or stats["triangles"] == 0:
+        flags.append("empty")
+    bounds = stats["bounds"]
+    if bounds is not None:
+        extent = np.subtract(bounds[1], bounds[0])
+        # a point or a line: nothing to see from most of the views
+        if not np.isfinite(extent).all() or (extent > 1e-9).sum() < 2:
+            flags.append("degenerate")
+    max_texture = max((max(size) for size in stats["textures"]), default=0)
+    if stats["triangles"] > limits["max_triangles"] or max_texture > limits["max_texture"] or stats["bytes"] > limits["max_bytes"]:
+        flags.append("huge")
+    return flags
+
+
+def triage_asset(path, limits=TRIAGE_LIMITS):
+    """
+    Inspect an asset without Blender and flag the ones not worth rendering:
+    "corrupt" (unreadable), "empty" (no triangles), "degenerate" (a point or
+    a line) and "huge" (beyond `limits`). The other formats are "unchecked".
+
+    Returns:
+        dict: the catalog record of the asset: path, size, mtime, status ("ok",
+            "skip" or "unchecked"), flags, vertices, triangles, nodes, bounds,
+            textures ([width, height] of each image) and seconds.
+    """
+    start = time.time()
+    stat = os.stat(path)
+    record = dict(path=path, bytes=stat.st_size, mtime=stat.st_mtime)
+    extension = os.path.splitext(path)[1].lower()
+    if extension not in TRIAGE_FORMATS:
+        record.update(status="unchecked", flags=[])
+    else:
+        try:
+            record.update(triage_obj(path) if extension == ".obj" else triage_gltf(path))
+            record["flags"] = triage_flags(record, limits)
+        except (OSError, ValueError, KeyError, IndexError, TypeError, AttributeError, struct.error) as e:
+            record.update(flags=["corrupt"], error=f"{type(e).__name__}: {e}")
+        record["status"] = "skip" if set(record["flags"]) & set(SKIP_FLAGS) else "ok"
+    record["seconds"] = time.time() - start
+    return record
+
+
+class CatalogIndex:
+    """
+    JSONL index of the triaged assets. A record stays valid while the size
+    and mtime of its file do not change, so a new run only triages the new
+    or modified assets.
+
+    >>> index = CatalogIndex("renders/catalog_index.jsonl")
+    >>> records = triage_files(paths, index)
+    >>> [path for path, record in records.items() if record["status"] != "skip"]
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.records = {}
+        self._lock = threading.Lock()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.load()
+        self._file = open(path, "a")
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path) as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                self.records[record["path"]] = record
+
+    def get(self, path):
+        """
+        The record of an asset, or None if it is not triaged or changed since.
+        """
+        record = self.records.get(path)
+        if record is None or not os.path.exists(path):
+            return None
+        stat = os.stat(path)
+        if record["bytes"] != stat.st_size or record["mtime"] != stat.st_mtime:
+            return None
+        return record
+
+    def record(self, record):
+        """
+        Add a record. Thread safe.
+        """
+        with self._lock:
+            self._file.write(json.dumps(record) + "\n")
+            self._file.flush()
+            self.records[record["path"]] = record
+
+    def close(self):
+        self._file.close()
+
+
+def triage_files(paths, index=None, processes=None, chunksize=16, limits=TRIAGE_LIMITS):
+    """
+    Triage the assets on a process pool, reusing the up-to-date records of the index.
+
+    Args:
+        index (CatalogIndex, optional): index updated with the new records.
+        processes (int, optional): number of processes. Defaults to the number of cores.
+
+    Returns:
+        Dict[str, dict]: the record of each asset, see `triage_asset`.
+    """
+    records = {}
+    todo = []
+    for path in paths:
+        record = None if index is None else index.get(path)
+        if record is None:
+            todo.append(path)
+        else:
+            records[path] = record
+    if todo:
+        with ProcessPoolExecutor(processes) as pool:
+            for record in pool.map(triage_asset, todo, [limits] * len(todo), chunksize=chunksize):
+                records[record["path"]] = record
+                if index is not None:
+                    index.record(record)
+    return records
+
+
+def validate_asset(path, index=None, limits=TRIAGE_LIMITS):
+    """
+    Validation step of `tools.ingest.IngestPipeline`: triage a downloaded
+    asset and reject it before it reaches a Blender worker.
+
+    Returns:
+        str: the path of the asset, if its status is not "skip".
+    """
+    record = triage_asset(path, limits)
+    if index is not None:
+        index.record(record)
+    if record["status"] == "skip":
+        raise ValueError(f"triage flagged {path} as {', '.join(record['flags'])}")
+    return path
+
+
+def route(records):
+    """
+    Paths of the assets to render, the most expensive (most triangles) first
+    so that the longest jobs do not start last and leave the other workers idle.
+    """
+    kept = [record for record in records if record["status"] != "skip"]
+    kept.sort(key=lambda record: -record.get("triangles", 0))
+    return [record["path"] for record in kept]
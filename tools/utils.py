@@ -1,6 +1,9 @@
 import bpy
 import argparse
+import os
+import resource
 import sys
+import time
 
 class ArgumentParserForBlender(argparse.ArgumentParser):
     """
@@ -44,6 +47,17 @@ class ArgumentParserForBlender(argparse.ArgumentParser):
         return super().parse_known_args(args=self._get_argv_after_doubledash(args), namespace=None)
 
 
+def memory_usage():
+    """
+    Resident memory of this process, now and at its peak, in MB.
+    """
+    with open("/proc/self/statm") as f:
+        rss = int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    # ru_maxrss is in kB on Linux
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    return dict(rss_mb=rss / 2**20, peak_rss_mb=peak / 2**20)
+
+
 class BlenderRemover:
     """
     This class is used to remove objects, meshes, materials, and images
@@ -102,19 +116,55 @@ class BlenderRemover:
         Args:
             exclude (List): objects, meshes, materials, and images to be excluded
         """
-        for mat in bpy.data.materials:
-            if mat not in exclude or mat.name not in exclude:
+        # iterate over copies, removing from a bpy collection while iterating skips items
+        for mat in list(bpy.data.materials):
+            if mat not in exclude and mat.name not in exclude:
                 bpy.data.materials.remove(mat)
-        for obj in bpy.data.objects:
+        for obj in list(bpy.data.objects):
             # keep camera if only one camera is left
             if obj.type == "CAMERA" and len(bpy.data.cameras) == 1:
                 continue
-            if obj not in exclude or obj.name not in exclude:
+            if obj not in exclude and obj.name not in exclude:
                 bpy.data.objects.remove(obj)
-        for mesh in bpy.data.meshes:
-            if mesh not in exclude or mesh.name not in exclude:
+        for mesh in list(bpy.data.meshes):
+            if mesh not in exclude and mesh.name not in exclude:
                 bpy.data.meshes.remove(mesh)
-        for img in bpy.data.images:
-            if (img not in exclude or img.name not in exclude) and img.users == 0:
+        for img in list(bpy.data.images):
+            if img not in exclude and img.name not in exclude and img.users == 0:
                 bpy.data.images.remove(img)
 
+    def reset_scene(self, keep=()):
+        """
+        Restore the scene to its baseline: remove every object that is not in
+        `keep` (e.g. the camera and the floor), then recursively purge all the
+        datablocks left without users (meshes, materials, images, textures,
+        node groups, lights, actions, ...). The scene, its compositor and its
+        world are kept with what they use.
+
+        Args:
+            keep (Iterable): objects, or names of objects, to keep.
+
+        Returns:
+            dict: the datablock counts after the reset, the memory usage and the seconds spent.
+        """
+        start = time.time()
+        keep = {obj if isinstance(obj, str) else obj.name for obj in keep}
+        for obj in list(bpy.data.objects):
+            if obj.name not in keep:
+                bpy.data.objects.remove(obj)
+        bpy.data.orphans_purge(do_local_ids=True, do_linked_ids=True, do_recursive=True)
+        self.reset()
+        return dict(datablocks=datablock_counts(), seconds=time.time() - start, **memory_usage())
+
+
+DATABLOCKS = (
+    "objects", "meshes", "materials", "images", "textures", "node_groups", "lights",
+    "cameras", "worlds", "actions", "collections", "libraries",
+)
+
+
+def datablock_counts():
+    """
+    Number of datablocks of each type in the blend data, to spot leaks.
+    """
+    return {name: len(getattr(bpy.data, name)) for name in DATABLOCKS}
@@ -0,0 +1,206 @@
+import json
+import subprocess
+import sys
+import threading
+import time
+
+# Every protocol message written by a worker starts with this marker, so the
+# host can tell them apart from Blender's own log output on the same stdout.
+MESSAGE_PREFIX = "@@worker "
+# encoder threads emit progress messages while the main thread emits results
+_emit_lock = threading.Lock()
+
+
+def emit(message_type, **payload):
+    """
+    Send a protocol message from a Blender worker to the host.
+
+    Args:
+        message_type (str): "ready", "result", ...
+        payload: JSON serializable fields of the message.
+
+    Thread safe, each message is written as one line.
+    """
+    payload["type"] = message_type
+    line = MESSAGE_PREFIX + json.dumps(payload) + "\n"
+    with _emit_lock:
+        sys.stdout.write(line)
+        sys.stdout.flush()
+
+
+def read_jobs(stream=None):
+    """
+    Yield the jobs sent by the host, one JSON object per line, until the host
+    closes the stream.
+    """
+    stream = sys.stdin if stream is None else stream
+    for line in stream:
+        line = line.strip()
+        if line:
+            yield json.loads(line)
+
+
+class WorkerDied(RuntimeError):
+    pass
+
+
+class BlenderWorker:
+    """
+    A long-lived Blender process running `script_path` in worker mode. Jobs
+    are sent as JSON lines on its stdin and the result of each job is read
+    back from its stdout.
+
+    >>> worker = BlenderWorker(blender_app, "super_main.py")
+    >>> worker.start()
+    >>> result = worker.submit({"obj_paths": [...], "background": ..., ...})
+    >>> worker.stop()
+    """
+
+    def __init__(self, blender_app, script_path, extra_args=(), verbose=True):
+        self.blender_app = blender_app
+        self.script_path = script_path
+        self.extra_args = list(extra_args)
+        self.verbose = verbose
+        self.process = None
+
+    @property
+    def alive(self):
+        return self.process is not None and self.process.poll() is None
+
+    def start(self):
+        command = [self.blender_app, "-b", "-P", self.script_path, "--", "--worker", *self.extra_args]
+        self.process = subprocess.Popen(
+            command, stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True, bufsize=1
+        )
+        self._read_until("ready")
+
+    def submit(self, job, on_message=None):
+        """
+        Run one job on the worker and block until its result comes back.
+
+        Args:
+            job (dict): the job.
+            on_message (Callable[[dict], None], optional): called with the other
+                messages sent by the worker while it runs the job, e.g. "progress".
+        """
+        if not self.alive:
+            self.start()
+        try:
+            self.process.stdin.write(json.dumps(job) + "\n")
+            self.process.stdin.flush()
+        except (BrokenPipeError, OSError) as e:
+            raise WorkerDied(f"Worker exited before accepting the job: {e}")
+        result = self._read_until("result", on_message)
+        if result.get("recycle"):
+            # the worker exits after this result to release its memory, the next submit starts a new one
+            self.stop()
+        return result
+
+    def stop(self, timeout=30):
+        if self.process is None:
+            return
+        try:
+            self.process.stdin.close()
+            self.process.wait(timeout=timeout)
+        except (OSError, subprocess.TimeoutExpired):
+            self.process.kill()
+            self.process.wait()
+        self.process = None
+
+    def _read_until(self, message_type, on_message=None):
+        for line in self.process.stdout:
+            # Blender writes from C without flushing on newlines, so the marker
+            # may not be at the start of the line.
+            idx = line.find(MESSAGE_PREFIX)
+            if idx < 0:
+                if self.verbose:
+                    print(line, end="")
+                continue
+            if self.verbose and idx > 0:
+                print(line[:idx])
+            message = json.loads(line[idx + len(MESSAGE_PREFIX) :])
+            if message["type"] == message_type:
+                return message
+            if on_message is not None:
+                on_message(message)
+        code = self.process.wait()
+        self.process = None
+        raise WorkerDied(f"Worker exited with code {code} while waiting for '{message_type}'")
+
+
+class BlenderWorkerPool:
+    """
+    A pool of N long-lived Blender workers. Each worker pays the Blender
+    startup cost once and then renders jobs until the queue is empty.
+
+    >>> pool = BlenderWorkerPool(blender_app, "super_main.py", num_workers=4)
+    >>> results = pool.map(jobs)
+    """
+
+    def __init__(self, blender_app, script_path, num_workers=1, extra_args=(), verbose=True):
+        self.workers = [
+            BlenderWorker(blender_app, script_path, extra_args=extra_args, verbose=verbose)
+            for _ in range(num_workers)
+        ]
+
+    def map(self, jobs, callback=None, on_message=None):
+        """
+        Run all jobs on the pool.
+
+        Args:
+            jobs (Iterable[dict]): jobs to run.
+            callback (Callable[[dict, dict], None], optional): called with (job, result)
+                as soon as a job finishes. Calls are serialized.
+            on_message (Callable[[dict, dict], None], optional): called with (job, message)
+                for the other messages sent while a job runs, e.g. "progress".
+
+        Returns:
+            List[dict]: the results, in the order of the jobs.
+
+        The jobs are read lazily, one at a time when a worker is free, so `jobs`
+        can be a generator that yields them as they become available (e.g.
+        while the assets are downloaded, see `tools.ingest`).
+        """
+        jobs = iter(jobs)
+        results = []
+        lock = threading.Lock()
+        callback_lock = threading.Lock()
+
+        def next_job():
+            with lock:
+                job = next(jobs, None)
+                if job is None:
+                    return None, None
+                results.append(None)
+                return len(results) - 1, job
+
+        def run(worker):
+            while True:
+                i, job = next_job()
+                if job is None:
+                    break
+                start = time.time()
+                handler = None if on_message is None else (lambda message, job=job: on_message(job, message))
+                try:
+                    result = worker.submit(job, on_message=handler)
+                except WorkerDied as e:
+                    # The next submit restarts the worker
+                    result = {"type": "result", "status": "error", "error": str(e)}
+                except Exception as e:
+                    # e.g. a bad message or a failing on_message: the worker may be
+                    # in the middle of the job, kill it so that the next submit restarts it
+                    worker.stop(timeout=0)
+                    result = {"type": "result", "status": "error", "error": f"{type(e).__name__}: {e}"}
+                result.setdefault("seconds", time.time() - start)
+                results[i] = result
+                if callback is not None:
+                    with callback_lock:
+                        callback(job, result)
+            worker.stop()
+
+        threads = [threading.Thread(target=run, args=(worker,), daemon=True) for worker in self.workers]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results